@@ -0,0 +1,50 @@
+'''
+Check the local CID calculator against `ipfs add --cid-version=1 -n` and time both.
+Sizes cover the chunk and fan-out boundaries of the balanced layout (one leaf, two
+leaves, a full 174-link node, the first file needing a second level).
+
+usage: python cid_check.py [file ...]   (default: generated random files)
+'''
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import numpy as np
+sys.path.append("../")
+from geohashtree.config import ipfs_binary
+from geohashtree.unixfs import CHUNK_SIZE, MAX_LINKS, file_cid, file_cids
+
+SIZES = [0, 1, 1000, CHUNK_SIZE, CHUNK_SIZE + 1, 3 * CHUNK_SIZE - 7,
+         MAX_LINKS * CHUNK_SIZE, MAX_LINKS * CHUNK_SIZE + 1, 200 * CHUNK_SIZE + 12345]
+
+def random_files(directory, sizes=SIZES, seed=0):
+    rng = np.random.default_rng(seed)
+    paths = []
+    for size in sizes:
+        path = os.path.join(directory, f"random_{size}.bin")
+        with open(path, 'wb') as f:
+            f.write(rng.integers(0, 256, size, dtype=np.uint8).tobytes())
+        paths.append(path)
+    return paths
+
+def kubo_cid(path):
+    return subprocess.check_output([ipfs_binary, "add", "-Qn", "--cid-version=1", path]).decode().strip()
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        paths = sys.argv[1:] or random_files(directory)
+        mismatches = 0
+        for path in paths:
+            t0 = time.time()
+            local = file_cid(path)
+            t1 = time.time()
+            kubo = kubo_cid(path)
+            t2 = time.time()
+            mismatches += local != kubo
+            print(f"{os.path.getsize(path):>12} {local} {'ok' if local == kubo else 'MISMATCH ' + kubo}"
+                  f" local {t1 - t0:.3f}s kubo {t2 - t1:.3f}s")
+        t0 = time.time()
+        file_cids(paths * 8)
+        print(f"process pool: {len(paths) * 8} files in {time.time() - t0:.2f}s")
+        sys.exit(1 if mismatches else 0)
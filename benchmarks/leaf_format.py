@@ -0,0 +1,61 @@
+'''
+Size and decode time of the text leaves of tree indexes (index_format='tree', one tuple repr
+per line) against the binary leaves (index_format='binary', delta / varint encoded):
+- size: total bytes of the leaf files and bytes per entry
+- decode: leaves already read into memory turned into {cid: [head, (a, b), ...]}, for text
+  leaves process_leaf_node's parsing plus the parse_tuple retrieve applies to every entry
+- lookup: LiteTreeOffset.query over the whole local index, reading the leaves from disk, and
+  the parse_tuple retrieve applies to its entries, then counted
+
+usage: python leaf_format.py file.geojson|file.parquet [precision]
+'''
+import os
+import sys
+import glob
+import time
+import tempfile
+sys.path.append("../")
+from geohashtree.geohashtree import LiteTreeOffset
+from geohashtree.binary_leaf import leaf_entries, LEAF_SUFFIX
+from geohashtree.util import parse_tuple
+
+def build(path, index_format, precision, destination):
+    tree = LiteTreeOffset(index_format=index_format)
+    if path.endswith('.parquet'):
+        tree.add_from_parquet(path, precision)
+    else:
+        tree.add_from_geojson(path, precision)
+    tree.generate_tree_index(destination)
+    return tree
+
+def decode_text(data):
+    lines = data.decode().split("\n")
+    return {lines[0].strip(): [parse_tuple(line.strip()) for line in lines[1:] if line.strip()]}
+
+def measure(tree, destination, suffix):
+    leaves = sorted(glob.glob(f"{destination}/**/*{suffix}", recursive=True))
+    contents = []
+    for leaf in leaves:
+        with open(leaf, 'rb') as f:
+            contents.append(f.read())
+    files = tree.file_table(destination)
+    t0 = time.time()
+    decoded = [leaf_entries(data, files) if suffix == LEAF_SUFFIX else decode_text(data) for data in contents]
+    decode = time.time() - t0
+    entries = sum(len(values) - 1 for result in decoded for values in result.values())
+    t0 = time.time()
+    result = tree.query(sorted({os.path.basename(leaf)[0] for leaf in leaves}), destination)
+    found = sum(len([parse_tuple(item) for item in result[cid]]) - 1 for cid in result)
+    lookup = time.time() - t0
+    return len(leaves), sum(map(len, contents)), entries, decode, lookup, found
+
+if __name__ == "__main__":
+    path = os.path.abspath(sys.argv[1])
+    precision = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{path}: {os.path.getsize(path) / 2**20:.1f} MiB, precision {precision}")
+    print(f"{'leaves':>7} {'format':>7} {'leaf bytes':>12} {'bytes/entry':>12} {'decode (s)':>11} {'lookup (s)':>11} {'found':>9}")
+    for index_format, suffix in [('tree', '.txt'), ('binary', LEAF_SUFFIX)]:
+        with tempfile.TemporaryDirectory() as destination:
+            tree = build(path, index_format, precision, destination)
+            count, size, entries, decode, lookup, found = measure(tree, destination, suffix)
+            print(f"{count:>7} {index_format:>7} {size:>12} {size / max(entries, 1):>12.2f} {decode:>11.3f} {lookup:>11.3f} {found:>9}")
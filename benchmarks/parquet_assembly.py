@@ -0,0 +1,106 @@
+'''
+Time and peak memory of turning fetched Parquet row groups into a pyarrow Table and a GeoDataFrame:
+- join: the previous assembly (slice copies, b''.join, bytes concatenation) read from a BytesIO
+- buffer: read_row_groups_from_ipfs, one preallocated buffer read through pa.BufferReader
+  (read_row_groups_table_from_ipfs for the table)
+Each variant runs in a fresh process; ranges are read from the local file instead of Kubo.
+Peak memory is the growth of the process's max RSS during the call.
+
+usage: python parquet_assembly.py file.parquet [every_nth_row_group]
+'''
+import io
+import os
+import sys
+import time
+import struct
+import resource
+import multiprocessing
+sys.path.append("../")
+
+class LocalFileClient:
+    '''
+    the cat / cat_ranges part of KuboClient, reading a local file whose path stands in for the CID
+    '''
+    def cat(self, path, offset=None, length=None):
+        with open(path, 'rb') as f:
+            f.seek(offset or 0)
+            return f.read() if length is None else f.read(length)
+
+    def cat_ranges(self, path, ranges, max_workers=None):
+        return [self.cat(path, offset, length) for offset, length in ranges]
+
+def footer_range(path):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(size - 8)
+        footer_length = struct.unpack('<I', f.read(4))[0]
+    return size - footer_length - 8, footer_length
+
+def join_assembly(path, chunks, client):
+    '''
+    the assembly read_row_groups_from_ipfs used before the preallocated buffer
+    '''
+    from thrift.protocol import TCompactProtocol
+    from thrift.transport import TTransport
+    from geohashtree.footer_cache import parse_footer, row_group_byte_range
+    from geohashtree.range_planner import RangePlanner
+    fmd = parse_footer(client.cat(path, *chunks[0]))
+    unique_group_ids = sorted({group_id for group_id, _ in chunks[1:]})
+    modified_row_groups = [fmd.row_groups[rg_idx] for rg_idx in unique_group_ids]
+    ranges = [row_group_byte_range(rg) for rg in modified_row_groups]
+    rg_buckets = RangePlanner().fetch(client, path, [(start, end - start) for start, end in ranges])
+    last_pos = 4
+    for rg, (rg_start_pos, rg_end_pos) in zip(modified_row_groups, ranges):
+        overhead_offset = rg_start_pos - last_pos
+        for column in rg.columns:
+            if column.file_offset:
+                column.file_offset -= overhead_offset
+            column.meta_data.data_page_offset -= overhead_offset
+            if column.meta_data.dictionary_page_offset:
+                column.meta_data.dictionary_page_offset -= overhead_offset
+        last_pos += rg_end_pos - rg_start_pos
+    fmd.row_groups = modified_row_groups
+    row_group_all = b''.join(rg_buckets)
+    transport = TTransport.TMemoryBuffer()
+    fmd.write(TCompactProtocol.TCompactProtocol(transport))
+    out_bytes = transport.getvalue()
+    return b'PAR1' + row_group_all + out_bytes + len(out_bytes).to_bytes(4, 'little') + b'PAR1'
+
+def run(variant, path, chunks, queue):
+    import geopandas as gpd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from geohashtree.footer_cache import FooterCache
+    from geohashtree.range_planner import RangePlanner
+    from geohashtree.filesystem import read_row_groups_from_ipfs, read_row_groups_table_from_ipfs
+    client = LocalFileClient()
+    assembly, output = variant
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.time()
+    if assembly == 'join':
+        source = io.BytesIO(join_assembly(path, chunks, client))
+        result = pq.read_table(source) if output == 'table' else gpd.read_parquet(source)
+    elif output == 'table':
+        result = read_row_groups_table_from_ipfs(path, chunks, client, None, RangePlanner(), FooterCache())
+    else:
+        buffer = read_row_groups_from_ipfs(path, chunks, client, None, RangePlanner(), FooterCache())
+        result = gpd.read_parquet(pa.BufferReader(pa.py_buffer(buffer)))
+    seconds = time.time() - t0
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((seconds, (rss1 - rss0) / 1024, len(result)))
+
+if __name__ == "__main__":
+    import pyarrow.parquet as pq
+    path = os.path.abspath(sys.argv[1])
+    every = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    num_row_groups = pq.ParquetFile(path).metadata.num_row_groups
+    chunks = [footer_range(path)] + [(rg, 0) for rg in range(0, num_row_groups, every)]
+    print(f"{path}: {os.path.getsize(path) / 2**20:.1f} MiB, {len(chunks) - 1}/{num_row_groups} row groups")
+    context = multiprocessing.get_context('spawn')
+    for variant in [(assembly, output) for output in ['table', 'gdf'] for assembly in ['join', 'buffer']]:
+        queue = context.Queue()
+        process = context.Process(target=run, args=(variant, path, chunks, queue))
+        process.start()
+        seconds, peak_mib, rows = queue.get()
+        process.join()
+        print(f"{variant[0]:>6} -> {variant[1]:<5}: {seconds:7.2f}s  peak +{peak_mib:8.1f} MiB  {rows} rows")
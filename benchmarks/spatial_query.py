@@ -41,7 +41,7 @@ from datetime import datetime
 sys.path.append("../")
 import warnings
 warnings.filterwarnings('ignore')
-from geohashtree.geohash_func import geohashes_covering_circle,h3tree_covering_circle, bounding_box
+from geohashtree.geohash_func import geohashes_covering_circle,geohashes_covering_circle_adaptive,h3tree_covering_circle, bounding_box
 from geohashtree.trie import trim_hashes
 from geohashtree.geohashtree import LiteTreeOffset,FullTreeFile,LiteTreeCID
 from geohashtree.filesystem import ipfs_get_index_folder,extract_and_concatenate_from_ipfs
@@ -160,7 +160,9 @@ def query_hashes(config,centre_x,centre_y):
     radius_proj = config['radius_factor']*radius
     precision = config['precision']
 
-    if config['grid'] == 'geohash':
+    if config['grid'] == 'geohash' and config.get('adaptive'):
+        result_hashes = geohashes_covering_circle_adaptive(centre_x,centre_y,radius_proj,precision,max_cells=config.get('max_cells'))
+    elif config['grid'] == 'geohash':
         result_hashes = geohashes_covering_circle(centre_x,centre_y,radius_proj,precision)
         result_hashes = trim_hashes(result_hashes)
     else:
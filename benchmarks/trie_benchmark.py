@@ -0,0 +1,58 @@
+'''
+Memory and build time of the dict-of-TrieNode Trie against the array-backed CompactTrie.
+
+usage: python trie_benchmark.py [n_keys ...]   (default: 1000000 10000000)
+'''
+import sys
+import time
+import tracemalloc
+import numpy as np
+sys.path.append("../")
+from geohashtree.trie import Trie, CompactTrie
+from geohashtree.geohash_func import geohash_encode_array
+
+def random_features(n, precision=5, seed=0):
+    '''
+    geohashes of random points over the US with an (n,2) array of (offset, length) values
+    '''
+    rng = np.random.default_rng(seed)
+    geohashes = geohash_encode_array(rng.uniform(25, 49, n), rng.uniform(-125, -67, n), precision)
+    lengths = rng.integers(200, 2000, n)
+    offsets = np.cumsum(lengths) - lengths
+    return geohashes, np.stack([offsets, lengths], axis=1)
+
+def build_trie(geohashes, offlen):
+    trie = Trie()
+    for index, (offset, length) in zip(geohashes.tolist(), offlen.tolist()):
+        trie.insert(index, (offset, length))
+    return trie
+
+def build_compact_trie(geohashes, offlen):
+    trie = CompactTrie()
+    trie.insert_many(geohashes, offlen)
+    trie.get(geohashes[0])  # includes the one-off sort
+    return trie
+
+def measure(build, *args):
+    '''
+    build time (without tracing), then retained and peak traced memory of a second build
+    '''
+    t0 = time.time()
+    trie = build(*args)
+    elapsed = time.time() - t0
+    del trie
+    tracemalloc.start()
+    trie = build(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del trie
+    return elapsed, current / 2**20, peak / 2**20
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [1000000, 10000000]
+    print(f"{'keys':>10} {'structure':>12} {'build (s)':>10} {'retained (MB)':>14} {'peak (MB)':>10}")
+    for n in sizes:
+        geohashes, offlen = random_features(n)
+        for name, build in [('Trie', build_trie), ('CompactTrie', build_compact_trie)]:
+            elapsed, retained, peak = measure(build, geohashes, offlen)
+            print(f"{n:>10} {name:>12} {elapsed:>10.2f} {retained:>14.1f} {peak:>10.1f}")
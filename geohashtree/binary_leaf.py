@@ -0,0 +1,175 @@
+'''
+Binary leaf files of tree indexes (index_format='binary'), an alternative to the text leaves
+holding one tuple repr per line.
+
+Layout:
+    header  magic b'GHLF', version (uint8), 3 reserved bytes
+    body    unsigned LEB128 varints: the group count, (file id, entry count) per group, then
+            the (a, b) entries of every group in order
+
+A group holds the entries of one file of the index file table (files.json), sorted:
+(offset, length) for GeoJSON, (row_group, row) for parquet. a is stored as the difference to
+the previous a of the group (the first one as is), b as the difference to the previous b when
+a repeats and as is otherwise, so most entries take two to four bytes. Leaves decode with a
+few NumPy operations, without parsing each entry.
+'''
+import struct
+import numpy as np
+
+MAGIC = b'GHLF'
+VERSION = 1
+HEADER = struct.Struct('<4sB3x')
+LEAF_SUFFIX = '.ghl'
+# bodies up to this many bytes decode faster in plain Python than with NumPy's per-call overhead
+SMALL_BODY = 256
+
+def encode_varints(values):
+    '''
+    unsigned LEB128 bytes of non-negative integers
+    '''
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b''
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    owner = np.repeat(np.arange(len(values)), lengths)
+    ends = np.cumsum(lengths)
+    position = np.arange(ends[-1]) - (ends - lengths)[owner]
+    out = ((values[owner] >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(0x7f)).astype(np.uint8)
+    out[position < lengths[owner] - 1] |= 0x80
+    return out.tobytes()
+
+def decode_varints(data):
+    '''
+    uint64 array of the unsigned LEB128 varints filling data
+    '''
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    last = (data & 0x80) == 0
+    if not last[-1]:
+        raise ValueError("truncated varint")
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7f).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    return np.bitwise_or.reduceat(parts, starts)
+
+def _decode_small(body):
+    '''
+    (file ids, value pairs) lists of a short leaf body, decode_leaf without NumPy
+    '''
+    numbers, number, shift = [], 0, 0
+    for byte in body:
+        number |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(number)
+            number = shift = 0
+    if shift:
+        raise ValueError("truncated varint")
+    n_groups = numbers[0] if numbers else 0
+    counts = numbers[2:1 + 2 * n_groups:2]
+    if len(counts) != n_groups or len(numbers) != 1 + 2 * n_groups + 2 * sum(counts):
+        raise ValueError("corrupt binary index leaf")
+    file_ids, values = [], []
+    position = 1 + 2 * n_groups
+    for i, count in enumerate(counts):
+        a = b = None
+        for _ in range(count):
+            delta_a, delta_b = numbers[position], numbers[position + 1]
+            position += 2
+            if a is None:
+                a, b = delta_a, delta_b
+            elif delta_a:
+                a, b = a + delta_a, delta_b
+            else:
+                b += delta_b
+            file_ids.append(numbers[1 + 2 * i])
+            values.append((a, b))
+    return file_ids, values
+
+def _segmented_cumsum(deltas, starts):
+    '''
+    cumulative sums of deltas restarting at each of the sorted positions starts (starting with 0)
+    '''
+    total = np.cumsum(deltas)
+    base = total[starts] - deltas[starts]
+    return total - np.repeat(base, np.diff(np.append(starts, len(deltas))))
+
+def encode_leaf(file_ids, values):
+    '''
+    binary leaf of entries given as file ids and an (n,2) array of non-negative value pairs
+    '''
+    file_ids = np.asarray(file_ids, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int64).reshape(-1, 2)
+    order = np.lexsort((values[:, 1], values[:, 0], file_ids))
+    file_ids, values = file_ids[order], values[order]
+    group_ids, counts = np.unique(file_ids, return_counts=True)
+    a, b = values[:, 0], values[:, 1]
+    group_start = np.ones(len(a), dtype=bool)
+    group_start[1:] = file_ids[1:] != file_ids[:-1]
+    delta_a = np.where(group_start, a, a - np.roll(a, 1))
+    same_a = ~group_start & (delta_a == 0)
+    delta_b = np.where(same_a, b - np.roll(b, 1), b)
+    body = np.concatenate(([len(group_ids)], np.stack([group_ids, counts], axis=1).ravel(),
+                           np.stack([delta_a, delta_b], axis=1).ravel()))
+    return HEADER.pack(MAGIC, VERSION) + encode_varints(body)
+
+def _body(data):
+    '''
+    varint bytes of a binary leaf after checking its header
+    '''
+    magic, version = HEADER.unpack_from(bytes(data[:HEADER.size]))
+    if magic != MAGIC:
+        raise ValueError("not a binary index leaf")
+    if version > VERSION:
+        raise ValueError(f"unsupported binary leaf version {version}")
+    return bytes(data[HEADER.size:])
+
+def decode_leaf(data):
+    '''
+    (file ids, (n,2) int64 values) of the entries of a binary leaf
+    '''
+    body = _body(data)
+    if len(body) <= SMALL_BODY:
+        file_ids, values = _decode_small(body)
+        return np.array(file_ids, dtype=np.uint32), np.array(values, dtype=np.int64).reshape(-1, 2)
+    body = decode_varints(body).astype(np.int64)
+    n_groups = int(body[0])
+    groups = body[1:1 + 2 * n_groups].reshape(-1, 2)
+    deltas = body[1 + 2 * n_groups:]
+    if len(deltas) % 2 or len(deltas) // 2 != groups[:, 1].sum():
+        raise ValueError("corrupt binary index leaf")
+    deltas = deltas.reshape(-1, 2)
+    file_ids = np.repeat(groups[:, 0], groups[:, 1]).astype(np.uint32)
+    group_starts = np.concatenate(([0], np.cumsum(groups[:, 1])[:-1]))
+    a = _segmented_cumsum(deltas[:, 0], group_starts)
+    b_start = np.zeros(len(a), dtype=bool)
+    b_start[group_starts] = True
+    b_start |= deltas[:, 0] != 0
+    b = _segmented_cumsum(deltas[:, 1], np.flatnonzero(b_start))
+    return file_ids, np.stack([a, b], axis=1)
+
+def leaf_entries(data, files):
+    '''
+    {cid: [head, value, ...]} of a binary leaf, files being the index's file table, values as tuples
+    '''
+    body = _body(data)
+    if len(body) <= SMALL_BODY:
+        file_ids, values = _decode_small(body)
+    else:
+        file_ids, values = decode_leaf(data)
+        file_ids, values = file_ids.tolist(), list(map(tuple, values.tolist()))
+    result = {}
+    start = 0
+    for end in range(1, len(file_ids) + 1):
+        if end == len(file_ids) or file_ids[end] != file_ids[start]:
+            f = files[file_ids[start]]
+            result[f['cid']] = [tuple(f['head'])] + values[start:end]
+            start = end
+    return result
@@ -1,3 +1,4 @@
+import os
 import subprocess
 
 # Execute the shell command to find the path of ipfs
@@ -7,4 +8,13 @@ except subprocess.CalledProcessError:
     # If 'which ipfs' fails, set the path to the default
     ipfs_binary = "/gpfs/data1/oshangp/easier/textile/kubo/ipfs"
 
-print("IPFS path:", ipfs_binary)
\ No newline at end of file
+# Kubo RPC API root, can be overridden with the KUBO_RPC_URL environment variable
+kubo_rpc_url = os.environ.get("KUBO_RPC_URL", "http://127.0.0.1:5001/api/v0/")
+
+# Byte-range cache of the default client: in-memory tier size (0 disables it) and an
+# optional on-disk tier directory with its size cap
+cache_memory_bytes = int(os.environ.get("GEOHASHTREE_CACHE_MEMORY_BYTES", 256 << 20))
+cache_dir = os.environ.get("GEOHASHTREE_CACHE_DIR")
+cache_disk_bytes = int(os.environ.get("GEOHASHTREE_CACHE_DISK_BYTES", 4 << 30))
+
+print("IPFS path:", ipfs_binary)
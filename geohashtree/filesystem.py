@@ -7,14 +7,19 @@ import pandas as pd
 import geopandas as gpd
 from io import StringIO
 from geohashtree.config import ipfs_binary
-import requests
+from geohashtree.unixfs import file_cid, file_cids
+from geohashtree.kubo import KuboClient, KuboError, get_client
+from geohashtree.range_planner import RangePlanner
+from geohashtree.footer_cache import get_footer_cache
+from geohashtree.geojson_decode import decode_features, feature_collection
+from geohashtree.parquet_select import needed_columns, project_schema, column_chunk_range, leaf_types, \
+    bbox_columns, row_group_may_match
 import os
+import copy
 import tqdm
-import json
 import pyarrow as pa
 import pyarrow.parquet as pq
 from shapely import wkb
-from parquet_tools.gen_py.parquet.ttypes import FileMetaData
 from thrift.protocol import TCompactProtocol
 from thrift.transport import TTransport
 class FileSystem(ABC):
@@ -34,13 +39,21 @@ class FileSystem(ABC):
     def readlines(self, path):
         pass
 
+    @abstractmethod
+    def read_bytes(self, path, offset, length):
+        pass
+
 class LocalFS(FileSystem):
+    is_local = True
     def listdir(self, path):
         return os.listdir(path)
 
     def path_isdir(self, path):
         return os.path.isdir(path)
 
+    def path_isdir_many(self, paths):
+        return [os.path.isdir(path) for path in paths]
+
     def path_exists(self, path):
         return os.path.exists(path)
     
@@ -48,26 +61,35 @@ class LocalFS(FileSystem):
         with open(path, 'r', encoding='utf-8') as file:
             lines = file.readlines()
         return lines
+
+    def read_bytes(self, path, offset, length):
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
     
 class InterPlanetaryFS(FileSystem):
+    is_local = False
 
-    def __init__(self,rpc_url="http://127.0.0.1:5001/api/v0/"):
-        self.url = rpc_url
+    def __init__(self,rpc_url=None,client=None):
+        self.client = client or (KuboClient(rpc_url) if rpc_url else get_client())
+        self.url = self.client.url
     def listdir(self, path):
-        response = requests.post(self.url+'ls', params={'arg': path})
-        return [c['Name'] for c in response.json()['Objects'][0]['Links']]
+        return [c['Name'] for c in self.client.ls(path)['Objects'][0]['Links']]
 
     def path_isdir(self, path):
-        response = requests.post(self.url+'ls', params={'arg': path})
-        return len(response.json()['Objects'][0]['Links']) > 0
+        return len(self.client.ls(path)['Objects'][0]['Links']) > 0
+
+    def path_isdir_many(self, paths):
+        return [len(ls['Objects'][0]['Links']) > 0 for ls in self.client.ls_many(paths)]
 
     def path_exists(self, path):
-        response = requests.post(self.url+'ls', params={'arg': path})
-        return not 'Type' in response.json()
+        return not 'Type' in self.client.ls(path)
     
     def readlines(self, path):
-        response = requests.post(self.url+'cat', params={'arg': path})
-        return response.content.decode().split("\n")
+        return self.client.cat(path).decode().split("\n")
+
+    def read_bytes(self, path, offset, length):
+        return self.client.cat(path, offset, length)
     
 def ipfs_ready():
     """
@@ -76,32 +98,17 @@ def ipfs_ready():
     result = subprocess.run([ipfs_binary,"swarm","addrs"],stdout=subprocess.PIPE)
     return not result.returncode
 
-def kubo_rpc_cat_offset_length(cid,offset,length):
+def kubo_rpc_cat_offset_length(cid,offset,length,client=None):
     """
-    Retrieve a file from IPFS using its CID
+    Retrieve a byte range of a file from IPFS using its CID
     """
-    # Define the URL
-    url = "http://127.0.0.1:5001/api/v0/cat"
-    # Define the query parameters
-    params = {
-        'arg': cid,
-        'offset':offset,
-        'length':length
-    }
-
-    # Make the POST request
-    response = requests.post(url, params=params)
-    return response.content
+    return (client or get_client()).cat(cid, offset, length)
 
-def kubo_rpc_cat(cid):
+def kubo_rpc_cat(cid,client=None):
     """
     Retrieve a file from IPFS using its CID
     """
-    # Define the URL
-    url = "http://127.0.0.1:5001/api/v0/cat"
-    # Make the POST request
-    response = requests.post(url, params={'arg': cid})
-    return response.content
+    return (client or get_client()).cat(cid)
 
 def kubo_cli_cat_offset_length(cid,offset,length):
     """
@@ -141,34 +148,66 @@ def parallel_cat(params):
     cid, offset, length = params
     return kubo_rpc_cat_offset_length(cid, offset, length).decode().rstrip(',\n')
 
-def read_row_groups_from_ipfs(cid,chunks):
-
+def read_row_groups_from_ipfs(cid,chunks,client=None,max_workers=None,planner=None,footer_cache=None,
+                              columns=None,filters=None,bbox=None):
+    """
+    Rebuild a parquet file holding only the row groups referenced by chunks[1:], chunks[0] being
+    the footer range. The parsed footer comes from the FooterCache (fetched and decoded once per
+    CID). Only the column chunks of columns (plus geometry and filter columns, all if None) are
+    fetched, and row groups whose statistics rule out the filters / bbox (see parquet_select.py)
+    are skipped. The column chunks are fetched concurrently, at most max_workers at a time, with
+    adjacent chunks merged into one request by the RangePlanner.
+    The file is assembled in one preallocated bytearray: the footer is serialized first (the
+    shifted offsets do not depend on the data) and each chunk is copied in once from the fetched
+    spans. Wrap it with pa.BufferReader(pa.py_buffer(...)) to read it without another copy.
+    """
+    client = client or get_client()
+    planner = planner or RangePlanner()
+    footer_cache = footer_cache or get_footer_cache()
     offset, length = chunks[0]
-    footer_bytes = kubo_rpc_cat_offset_length(cid, offset, length)
-    transportIn = TTransport.TMemoryBuffer(footer_bytes)
-    protocolIn = TCompactProtocol.TCompactProtocol(transportIn)
-    fmd = FileMetaData()
-    fmd.read(protocolIn)
-
-    unique_group_ids = list({group_id for group_id, _ in chunks[1:]})
-    modified_row_groups = [fmd.row_groups[rg_idx] for rg_idx in unique_group_ids]
-    dataframes = []
+    cached_fmd, _ = footer_cache.get(cid, offset, length, client)
+    fetch_columns = needed_columns(cached_fmd, columns, filters, bbox)
+
+    unique_group_ids = sorted({group_id for group_id, _ in chunks[1:]})
+    if filters or bbox is not None:
+        types, bbox_cols = leaf_types(cached_fmd), bbox_columns(cached_fmd)
+        unique_group_ids = [rg_idx for rg_idx in unique_group_ids
+                            if row_group_may_match(cached_fmd.row_groups[rg_idx], types, filters, bbox, bbox_cols)]
+    # the cached footer is shared: copy the row groups, column chunks and metadata whose offsets are shifted
+    modified_row_groups = []
+    ranges = []
+    for rg_idx in unique_group_ids:
+        rg = copy.copy(cached_fmd.row_groups[rg_idx])
+        rg.columns = [copy.copy(column) for column in rg.columns
+                      if fetch_columns is None or column.meta_data.path_in_schema[0] in fetch_columns]
+        for column in rg.columns:
+            column.meta_data = copy.copy(column.meta_data)
+            ranges.append(column_chunk_range(column))
+        modified_row_groups.append(rg)
     last_pos = 4
-    rg_buckets=[]
+    column_ranges = iter(ranges)
     for rg in modified_row_groups:
-        rg_start_pos = rg.columns[0].meta_data.dictionary_page_offset
-        rg_end_pos = rg.columns[len(rg.columns)-1].file_offset
-        row_group_raw = kubo_rpc_cat_offset_length(cid, rg_start_pos, rg_end_pos - rg_start_pos)
-        rg_buckets.append(row_group_raw)
-        overhead_offset = rg_start_pos - last_pos
-        rg.file_offset -= overhead_offset
-        for i in range(len(rg.columns)):
-            rg.columns[i].file_offset -= overhead_offset
-            rg.columns[i].meta_data.data_page_offset -= overhead_offset
-            rg.columns[i].meta_data.dictionary_page_offset -= overhead_offset
-        last_pos += rg_end_pos - rg_start_pos
+        if rg.file_offset:
+            rg.file_offset = last_pos
+        for column in rg.columns:
+            chunk_start, chunk_length = next(column_ranges)
+            overhead_offset = chunk_start - last_pos
+            if column.file_offset:
+                column.file_offset -= overhead_offset
+            column.meta_data.data_page_offset -= overhead_offset
+            if column.meta_data.dictionary_page_offset:
+                column.meta_data.dictionary_page_offset -= overhead_offset
+            # page indexes and bloom filters are not copied
+            column.offset_index_offset = column.offset_index_length = None
+            column.column_index_offset = column.column_index_length = None
+            column.meta_data.bloom_filter_offset = None
+            last_pos += chunk_length
+        rg.total_compressed_size = sum(column.meta_data.total_compressed_size for column in rg.columns)
+    fmd = copy.copy(cached_fmd)
     fmd.row_groups = modified_row_groups
-    row_group_all = b''.join(rg_buckets)
+    fmd.num_rows = sum(rg.num_rows for rg in modified_row_groups)
+    if fetch_columns is not None:
+        fmd.schema, fmd.column_orders = project_schema(cached_fmd, fetch_columns)
     transport = TTransport.TMemoryBuffer()
     protocolOut = TCompactProtocol.TCompactProtocol(transport)
     fmd.write(protocolOut)
@@ -177,47 +216,60 @@ def read_row_groups_from_ipfs(cid,chunks):
     PARQUET_MAGIC_BYTES = b'PAR1'
     footer_length = len(out_bytes)
 
-    # Return the complete file bytes
-    return (
-        PARQUET_MAGIC_BYTES+
-        row_group_all +                # Row group bytes
-        out_bytes +                   # Footer bytes
-        footer_length.to_bytes(4, 'little') +  # Footer length in little endian
-        PARQUET_MAGIC_BYTES              # Parquet magic bytes
-    )
+    # magic, row group bytes, footer, footer length in little endian, magic
+    buffer = bytearray(last_pos + footer_length + 8)
+    buffer[:4] = PARQUET_MAGIC_BYTES
+    pos = 4
+    for (chunk_start, chunk_length), chunk in zip(ranges, planner.fetch(client, cid, ranges, max_workers, views=True)):
+        if len(chunk) != chunk_length:
+            raise KuboError(f"short read of {cid}: {len(chunk)} of {chunk_length} bytes at offset {chunk_start}")
+        buffer[pos:pos + chunk_length] = chunk
+        pos += chunk_length
+    buffer[last_pos:last_pos + footer_length] = out_bytes
+    buffer[-8:-4] = footer_length.to_bytes(4, 'little')
+    buffer[-4:] = PARQUET_MAGIC_BYTES
+    return buffer
 
+def read_row_groups_table_from_ipfs(cid,chunks,client=None,max_workers=None,planner=None,footer_cache=None,
+                                    columns=None,filters=None,bbox=None):
+    """
+    pyarrow Table of the row groups referenced by chunks[1:] (see read_row_groups_from_ipfs),
+    decoded straight from the assembled buffer
+    """
+    buffer = read_row_groups_from_ipfs(cid,chunks,client,max_workers,planner,footer_cache,columns,filters,bbox)
+    return pq.read_table(pa.BufferReader(pa.py_buffer(buffer)))
 
 
 
-def extract_and_concatenate_from_ipfs(cid, chunks, suffix_string = "]\n}"):
-    concatenated_data = ""
-    res = []
-    #read header
-    offset, length = chunks[0]
-    print(offset,length)
-    header = kubo_rpc_cat_offset_length(cid, offset, length).decode().rstrip(',\n')
-    
-    feature_chunks = combine_tuples(chunks[1:])
-    print('comb',len(feature_chunks))
-    
-    # #multiprocessing
-    # params = [(cid,offset,length) for offset,length in feature_chunks]
-    # from multiprocessing import Pool
-    
-    # with Pool(8) as pool:
-    #     res = pool.map(parallel_cat, params)
-
-    #single loop
-    for i, (offset, length) in enumerate(feature_chunks):
-        content = kubo_rpc_cat_offset_length(cid,offset,length)
-        data = content.decode()
-        # Remove trailing comma from the second chunk
-        data = data.rstrip(',\n')
-        res.append(data)
-
-    concatenated_data += header+",".join(res)
-    concatenated_data += suffix_string
-    return concatenated_data
+
+def fetch_features_from_ipfs(cid, chunks, client=None, max_workers=None, planner=None):
+    """
+    (header bytes, [feature run bytes]) of a GeoJSON file on IPFS from the header range chunks[0]
+    and the feature ranges chunks[1:]. Runs of adjacent features and the header are planned into
+    requests by the RangePlanner (merging across small gaps), fetched concurrently, at most
+    max_workers at a time, and returned in offset order.
+    """
+    client = client or get_client()
+    planner = planner or RangePlanner()
+    feature_chunks = combine_tuples(sorted(chunks[1:]))
+    contents = planner.fetch(client, cid, [chunks[0]] + feature_chunks, max_workers)
+    return contents[0], contents[1:]
+
+def extract_and_concatenate_from_ipfs(cid, chunks, suffix_string = "]\n}", client=None, max_workers=None, planner=None):
+    """
+    Rebuild a GeoJSON FeatureCollection from the header range chunks[0] and the feature ranges
+    chunks[1:] of a file on IPFS (see fetch_features_from_ipfs).
+    """
+    header, contents = fetch_features_from_ipfs(cid, chunks, client, max_workers, planner)
+    return feature_collection(header, contents, suffix_string.encode()).decode()
+
+def read_features_from_ipfs(cid, chunks, suffix_string = "]\n}", client=None, max_workers=None, planner=None):
+    """
+    GeoDataFrame of the features at chunks[1:] of a GeoJSON file on IPFS, decoded without GDAL
+    where possible (see geojson_decode.py)
+    """
+    header, contents = fetch_features_from_ipfs(cid, chunks, client, max_workers, planner)
+    return decode_features(header, contents, suffix_string.encode())
 
 def write_raw_json_to_file(geojson, file_path):
     with open(file_path, 'w') as file:
@@ -226,17 +278,21 @@ def write_raw_json_to_file(geojson, file_path):
 
 def compute_cid(file_path):
     """
-    Compute the CID for a file
+    Compute the CIDv1 of a file locally, as `ipfs add --cid-version=1 -n` would
     """
+    return file_cid(file_path)
 
-    url = "http://127.0.0.1:5001/api/v0/add"
-    # Make the POST request
-    with open(file_path, mode='rb') as f:
-        r = requests.post(url='http://127.0.0.1:5001/api/v0/add?cid-version=1&only-hash=True',
-                          files={file_path: f})
-    
-    cid = json.loads(r.content)['Hash']
-    return cid
+def compute_cids(file_paths, processes=None):
+    """
+    Compute the CIDv1 of many files locally in a process pool
+    """
+    return file_cids(file_paths, processes=processes)
+
+def compute_cid_rpc(file_path,client=None):
+    """
+    Compute the CID for a file with the Kubo daemon (only-hash upload)
+    """
+    return (client or get_client()).add(file_path, only_hash=True)['Hash']
 
 def compute_cid_old(file_path):
     """
@@ -247,19 +303,15 @@ def compute_cid_old(file_path):
     cid = subprocess.check_output([ipfs_binary, "add", "-qn","--cid-version=1", file_path]).decode().strip()
     print(cid)
     return cid
-def ipfs_add_feature(geojson_path):
+def ipfs_add_feature(geojson_path,client=None):
+    """
+    Add a file (or a list of files, concurrently) to IPFS, returns the CID of each file
+    """
+    client = client or get_client()
     try:
         if isinstance(geojson_path, list):
-            result_list = []
-            for geojson in tqdm.tqdm(geojson_path):
-                result_list.append(ipfs_add_feature(geojson))
-            return result_list
-        # Use IPFS add command to add the file to IPFS
-        with open(geojson_path, mode='rb') as f:
-            r = requests.post(url='http://127.0.0.1:5001/api/v0/add?cid-version=1&quiet=True',
-                            files={geojson_path: f})
-        
-        return r.content
+            return [entry['Hash'] for entry in client.add_many(geojson_path)]
+        return client.add(geojson_path)['Hash']
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 def ipfs_add_feature_old(geojson_path):
@@ -292,6 +344,33 @@ def ipfs_add_index_folder(index_path):
         return result.stdout.strip()
     except Exception as e:
         print(f"An unexpected error occurred: {e[:100]}")
+def ipfs_update_index_folder(root_cid, index_path, changes, client=None):
+    """
+    Publish an in-place index update (the report of update_tree_index) on top of the index folder
+    already added as root_cid: only the changed files are added, and the folder is patched in MFS,
+    so unchanged subtrees keep their CIDs and no block of them is read or re-added.
+    Returns the CID of the updated folder.
+    """
+    client = client or get_client()
+    mfs_root = f"/geohashtree-update-{root_cid}"
+    try:
+        client.files('rm', mfs_root, recursive='true')
+    except KuboError:
+        pass
+    client.files('cp', f"/ipfs/{root_cid}", mfs_root)
+    try:
+        for folder in changes['directories']:
+            client.files('mkdir', f"{mfs_root}/{folder}", parents='true', **{'cid-version': 1})
+        added = client.add_many([os.path.join(index_path, path) for path in changes['leaves']])
+        for path, entry in zip(changes['leaves'], added):
+            try:
+                client.files('rm', f"{mfs_root}/{path}")
+            except KuboError:
+                pass
+            client.files('cp', f"/ipfs/{entry['Hash']}", f"{mfs_root}/{path}")
+        return client.files('stat', mfs_root)['Hash']
+    finally:
+        client.files('rm', mfs_root, recursive='true')
 def ipfs_list_folder(cid):
     """
     List the contents of an IPFS folder
@@ -304,14 +383,11 @@ def ipfs_list_folder(cid):
         return [row.split(" ")[-1] for row in result.stdout.strip().split('\n')]   
     except Exception as e:
         print(f"An unexpected error occurred: {e[:100]}")
-def ipfs_rpc_list_folder(cid):
+def ipfs_rpc_list_folder(cid,client=None):
     """
     List the contents of an IPFS folder
     """
-    url = "http://127.0.0.1:5001/api/v0/ls"
-    # Make the POST request
-    response = requests.post(url, params={'arg': cid})
-    return [c['Name'] for c in response.json()['Objects'][0]['Links']]
+    return [c['Name'] for c in (client or get_client()).ls(cid)['Objects'][0]['Links']]
 def ipfs_check_folder(cid):
     """
     Check if a CID is a folder on IPFS
@@ -327,14 +403,11 @@ def ipfs_check_folder(cid):
             return True
     except Exception as e:
         return False
-def ipfs_rpc_check_folder(cid):
+def ipfs_rpc_check_folder(cid,client=None):
     """
     Check if a CID is a folder on IPFS
     """
-    url = "http://127.0.0.1:5001/api/v0/ls"
-    # Make the POST request
-    response = requests.post(url, params={'arg': cid})
-    return len(response.json()['Objects'][0]['Links']) > 0
+    return len((client or get_client()).ls(cid)['Objects'][0]['Links']) > 0
 
 def ipfs_link_exists(cid):
     """
@@ -351,14 +424,11 @@ def ipfs_link_exists(cid):
     except Exception as e:
         print(f"An unexpected error occurred: {e[:100]}")
         return False
-def ipfs_rpc_link_exists(cid):
+def ipfs_rpc_link_exists(cid,client=None):
     """
       Check if a CID exists on IPFS with RPC
     """
-    url = "http://127.0.0.1:5001/api/v0/ls"
-    # Make the POST request
-    response = requests.post(url, params={'arg': cid})
-    return not 'Type' in response.json()
+    return not 'Type' in (client or get_client()).ls(cid)
 
 def ipfs_cat_file(cid):
     """
@@ -373,21 +443,21 @@ def ipfs_cat_file(cid):
     except Exception as e:
         print(f"An unexpected error occurred: {e[:100]}")
         return None
-def ipfs_get_feature(cid):
+def ipfs_get_feature(cid,client=None):
     """
     Retrieve a GeoJSON feature from IPFS using its CID
     """
-    content = kubo_rpc_cat(cid)
+    content = kubo_rpc_cat(cid,client)
     if content:
         return gpd.read_file(StringIO(content.decode()))
     else:
         return None
-def ipfs_get_parquet(cid):
+def ipfs_get_parquet(cid,client=None):
     """
     Retrieve a parquet file from IPFS using its CID
     """
     import io
-    pq_bytes = kubo_rpc_cat(cid)
+    pq_bytes = kubo_rpc_cat(cid,client)
     
     if pq_bytes:
         pq_file = io.BytesIO(pq_bytes)
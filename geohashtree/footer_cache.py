@@ -0,0 +1,98 @@
+'''
+Cache of parsed Parquet footers: the thrift FileMetaData of a file on IPFS and the byte span of
+each of its row groups, memoized per CID in process and optionally pickled to a directory
+(e.g. next to the index) so later runs skip both the footer fetch and the thrift decode.
+'''
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from parquet_tools.gen_py.parquet.ttypes import FileMetaData
+from thrift.protocol import TCompactProtocol
+from thrift.transport import TTransport
+from geohashtree.kubo import get_client
+
+def parse_footer(footer_bytes):
+    '''
+    thrift FileMetaData of the footer bytes of a parquet file
+    '''
+    fmd = FileMetaData()
+    fmd.read(TCompactProtocol.TCompactProtocol(TTransport.TMemoryBuffer(footer_bytes)))
+    return fmd
+
+def row_group_byte_range(rg):
+    """
+    [start, end) of a row group's column chunks in the file, from the page offsets and
+    compressed sizes (writers do not all set a usable ColumnChunk.file_offset)
+    """
+    starts = [c.meta_data.dictionary_page_offset or c.meta_data.data_page_offset for c in rg.columns]
+    ends = [start + c.meta_data.total_compressed_size for start, c in zip(starts, rg.columns)]
+    return min(starts), max(ends)
+
+class FooterCache:
+    def __init__(self, directory=None, max_entries=64):
+        '''
+        directory: where parsed footers are pickled as <cid>.footer, None to keep them in memory only
+        max_entries: footers kept in memory, least recently used dropped first
+        '''
+        self.directory = directory
+        self.max_entries = max_entries
+        self._footers = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, cid):
+        return os.path.join(self.directory, cid.replace('/', '_') + '.footer')
+
+    def _remember(self, cid, entry):
+        with self._lock:
+            self._footers[cid] = entry
+            self._footers.move_to_end(cid)
+            while len(self._footers) > self.max_entries:
+                self._footers.popitem(last=False)
+
+    def get(self, cid, offset, length, client=None):
+        '''
+        (FileMetaData, [(start, end) of each row group]) of the parquet file cid whose footer
+        is at [offset, offset+length). The FileMetaData is shared, copy what you modify.
+        '''
+        with self._lock:
+            entry = self._footers.get(cid)
+            if entry is not None:
+                self._footers.move_to_end(cid)
+                self.hits += 1
+                return entry
+        if self.directory and os.path.exists(self._path(cid)):
+            with open(self._path(cid), 'rb') as f:
+                entry = pickle.load(f)
+            with self._lock:
+                self.hits += 1
+        else:
+            fmd = parse_footer((client or get_client()).cat(cid, offset, length))
+            entry = (fmd, [row_group_byte_range(rg) for rg in fmd.row_groups])
+            with self._lock:
+                self.misses += 1
+            if self.directory:
+                path = self._path(cid)
+                with open(f"{path}.{threading.get_ident()}.tmp", 'wb') as f:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(f"{path}.{threading.get_ident()}.tmp", path)
+        self._remember(cid, entry)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._footers)}
+
+_default_cache = None
+
+def get_footer_cache():
+    '''
+    the in-process footer cache used when none is passed explicitly
+    '''
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FooterCache()
+    return _default_cache
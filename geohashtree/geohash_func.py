@@ -1,18 +1,161 @@
+import warnings
 import geopandas as gpd
+import numpy as np
 import pygeohash as pgh
 import h3
+import h3.api.basic_int as h3_int
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        from h3.unstable import vect as h3_vect
+except ImportError:
+    h3_vect = None
+import shapely
 from shapely.geometry import Polygon
-from geohashtree.geometry import rect_outside_a_circle, rect_overlap
+import math
+from geohashtree.trie import trim_hashes
+from geohashtree.geometry import rects_outside_a_circle, rects_overlap, \
+    rects_inside_a_circle, rects_disjoint_from_a_circle, rects_inside_a_rect, EARTH_RADIUS
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_BASE32_BYTES = np.frombuffer(BASE32.encode(), dtype=np.uint8)
+_HEX_BYTES = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
 
 def geohash_encode(lat,lon,precision):
     return pgh.encode(latitude=lat, longitude=lon, precision=precision)
 
+def axis_bits(precision):
+    '''
+    number of (longitude, latitude) bits in a geohash of the given precision
+    '''
+    nbits = 5*precision
+    return (nbits+1)//2, nbits//2
+
+def axis_cell_index(values,lo,hi,bits):
+    '''
+    Integer cell index of each value along one axis split into 2**bits cells.
+    Matches the `>= mid` bisection of pgh.encode: cell edges lo+k*(hi-lo)/2**bits are exact
+    dyadic values, so the float estimate is corrected by at most one cell against them.
+    '''
+    values = np.asarray(values,dtype=np.float64)
+    ncells = 1 << bits
+    step = (hi-lo)/ncells
+    idx = np.floor((values-lo)/step).astype(np.int64)
+    np.clip(idx,0,ncells-1,out=idx)
+    idx -= values < lo+idx*step
+    idx += (idx < ncells-1) & (values >= lo+(idx+1)*step)
+    return idx
+
+def _spread_bits(x):
+    '''
+    insert a zero bit between each of the low 32 bits of x
+    '''
+    x = np.asarray(x,dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x3333333333333333)
+    x = (x | (x << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return x
+
+def interleave_cell_index(lon_idx,lat_idx,precision):
+    '''
+    Interleave longitude/latitude cell indexes into the integer form of a geohash
+    (longitude bit first, 5 bits per character)
+    '''
+    # the last bit is a longitude bit when the total bit count is odd
+    lon_shift = np.uint64(1 - (5*precision) % 2)
+    return (_spread_bits(lon_idx) << lon_shift) | (_spread_bits(lat_idx) << (np.uint64(1)-lon_shift))
+
+def geohash_int_to_str(code,precision):
+    '''
+    Convert integer geohashes to their base32 string form
+    '''
+    code = np.atleast_1d(np.asarray(code,dtype=np.uint64))
+    chars = np.empty((code.shape[0],precision),dtype=np.uint8)
+    for c in range(precision):
+        chars[:,c] = _BASE32_BYTES[(code >> np.uint64(5*(precision-1-c))) & np.uint64(31)]
+    return chars.view(f'S{precision}').ravel().astype(str)
+
+def geohash_encode_array(lat,lon,precision,return_int=False):
+    '''
+    Vectorized geohash encoding of coordinate arrays, identical to pgh.encode per point.
+    Returns an array of geohash strings, plus their bit-interleaved integers if `return_int`.
+    '''
+    lat = np.asarray(lat,dtype=np.float64)
+    lon = np.asarray(lon,dtype=np.float64)
+    if not 1 <= precision <= 12:
+        raise ValueError(f"Precision must be between 1 and 12, but got {precision}.")
+    if not np.all((lat >= -90.0) & (lat <= 90.0)):
+        raise ValueError("Latitude must be between -90.0 and 90.0 degrees.")
+    if not np.all((lon >= -180.0) & (lon <= 180.0)):
+        raise ValueError("Longitude must be between -180.0 and 180.0 degrees.")
+    lon_bits,lat_bits = axis_bits(precision)
+    lon_idx = axis_cell_index(lon,-180.0,180.0,lon_bits)
+    lat_idx = axis_cell_index(lat,-90.0,90.0,lat_bits)
+    code = interleave_cell_index(lon_idx,lat_idx,precision)
+    geohashes = geohash_int_to_str(code,precision)
+    if return_int:
+        return geohashes,code
+    return geohashes
+
+def encode_cells(lat,lon,grid,precision):
+    '''
+    index keys of coordinate arrays: geohashes for grid 'geohash', h3tree paths of the h3 cells for 'h3'
+    '''
+    if grid == 'geohash':
+        return geohash_encode_array(lat,lon,precision)
+    if grid == 'h3':
+        return h3_encode_array(lat,lon,precision,return_tree=True)[1]
+    raise ValueError(f"unknown grid {grid!r}, expected 'geohash' or 'h3'")
+
 def h3_encode(lat,lon,precision):
     return h3.geo_to_h3(lat,lon,precision)
 
 def h3_to_h3tree(h3str):
     return h3str[1:].rstrip('f')
 
+def h3_encode_int_array(lat,lon,precision):
+    '''
+    Vectorized h3 encoding of coordinate arrays into integer cell ids
+    '''
+    lat = np.asarray(lat,dtype=np.float64)
+    lon = np.asarray(lon,dtype=np.float64)
+    if h3_vect is not None:
+        return np.asarray(h3_vect.geo_to_h3(lat,lon,precision),dtype=np.uint64)
+    return np.fromiter((h3_int.geo_to_h3(y,x,precision) for y,x in zip(lat,lon)),dtype=np.uint64,count=len(lat))
+
+def _h3_int_to_hex_chars(cells):
+    '''
+    hex digits of integer h3 cells as a (n,15) byte matrix, same as the h3 string form
+    '''
+    cells = np.atleast_1d(np.asarray(cells,dtype=np.uint64))
+    chars = np.empty((cells.shape[0],15),dtype=np.uint8)
+    for c in range(15):
+        chars[:,c] = _HEX_BYTES[(cells >> np.uint64(4*(14-c))) & np.uint64(15)]
+    return chars
+
+def h3_encode_array(lat,lon,precision,return_tree=False):
+    '''
+    Vectorized h3_encode for coordinate arrays, returns h3 strings
+    (and the h3tree path of each cell if `return_tree`)
+    '''
+    chars = _h3_int_to_hex_chars(h3_encode_int_array(lat,lon,precision))
+    h3strs = chars.view('S15').ravel().astype(str)
+    if return_tree:
+        return h3strs,_hex_chars_to_h3tree(chars)
+    return h3strs
+
+def _hex_chars_to_h3tree(chars):
+    tree = np.ascontiguousarray(chars[:,1:]).view('S14').ravel()
+    return np.char.rstrip(tree,b'f').astype(str)
+
+def h3_int_to_h3tree(cells):
+    '''
+    vectorized h3_to_h3tree for integer h3 cells
+    '''
+    return _hex_chars_to_h3tree(_h3_int_to_hex_chars(cells))
+
 def h3tree_to_h3(geohash):
     return "8"+geohash+"f"*(14-len(geohash))
 
@@ -34,38 +177,199 @@ def bounding_box_to_gdf(min_lon,max_lon,min_lat,max_lat):
     return gdf
 
 
+def _axis_candidates(lo_value,hi_value,lo,hi,bits):
+    '''
+    cell indexes along one axis covering [lo_value,hi_value], padded by one cell so that
+    cells only touching the range are still tested
+    '''
+    ncells = 1 << bits
+    lo_value,hi_value = max(lo_value,lo),min(hi_value,hi)
+    if lo_value > hi_value:
+        return np.arange(0)
+    i0,i1 = axis_cell_index([lo_value,hi_value],lo,hi,bits)
+    return np.arange(max(i0-1,0),min(i1+1,ncells-1)+1)
+
+def _wrap_lon_ranges(min_lon,max_lon):
+    '''
+    split a longitude range that may run past the antimeridian into ranges within [-180,180]
+    '''
+    if max_lon - min_lon >= 360:
+        return [(-180.0,180.0)]
+    shift = math.floor((min_lon+180)/360)*360
+    min_lon,max_lon = min_lon-shift,max_lon-shift
+    if max_lon <= 180:
+        return [(min_lon,max_lon)]
+    return [(min_lon,180.0),(-180.0,max_lon-360)]
+
+def _cell_bounds(lon_idx,lat_idx,precision):
+    '''
+    (min_lon,max_lon,min_lat,max_lat) arrays of cells given by their integer indexes
+    '''
+    lon_bits,lat_bits = axis_bits(precision)
+    lon_step = 360.0/(1 << lon_bits)
+    lat_step = 180.0/(1 << lat_bits)
+    return (-180.0+lon_idx*lon_step,-180.0+(lon_idx+1)*lon_step,
+            -90.0+lat_idx*lat_step,-90.0+(lat_idx+1)*lat_step)
+
+def _candidate_cells(lon_ranges,min_lat,max_lat,precision):
+    '''
+    candidate cells for a set of longitude ranges and a latitude range, enumerated row by row.
+    Returns the cell indexes and cell bounds as flat arrays.
+    '''
+    lon_bits,lat_bits = axis_bits(precision)
+    cols = np.unique(np.concatenate([_axis_candidates(a,b,-180.0,180.0,lon_bits) for a,b in lon_ranges]))
+    rows = _axis_candidates(min_lat,max_lat,-90.0,90.0,lat_bits)
+    lat_idx,lon_idx = (a.ravel() for a in np.meshgrid(rows,cols,indexing='ij'))
+    return lon_idx,lat_idx,_cell_bounds(lon_idx,lat_idx,precision)
+
+def _child_cells(lon_idx,lat_idx,precision):
+    '''
+    indexes of the 32 children at precision+1 of each cell
+    '''
+    lon_bits,lat_bits = axis_bits(precision)
+    child_lon_bits,child_lat_bits = axis_bits(precision+1)
+    d_lon,d_lat = child_lon_bits-lon_bits,child_lat_bits-lat_bits
+    sub_lat,sub_lon = np.meshgrid(np.arange(1 << d_lat),np.arange(1 << d_lon),indexing='ij')
+    child_lon = (lon_idx[:,None] << d_lon) + sub_lon.ravel()
+    child_lat = (lat_idx[:,None] << d_lat) + sub_lat.ravel()
+    return child_lon.ravel(),child_lat.ravel()
+
+def _cells_to_geohashes(lon_idx,lat_idx,precision):
+    return geohash_int_to_str(interleave_cell_index(lon_idx,lat_idx,precision),precision).tolist()
+
+def adaptive_covering(classify,max_precision,max_cells=None):
+    '''
+    Mixed-precision covering that starts from the 32 precision-1 cells and only refines
+    cells on the boundary of a shape.
+    classify(bounds,precision) returns (inside,outside) masks for cells given by their
+    bounds; inside cells are kept at their precision, outside cells are dropped.
+    Refinement stops at max_precision, or before the level that would take the covering
+    over max_cells cells.
+    Returns (interior,boundary) lists of geohashes.
+    '''
+    lon_bits,lat_bits = axis_bits(1)
+    lat_idx,lon_idx = (a.ravel() for a in np.meshgrid(np.arange(1 << lat_bits),np.arange(1 << lon_bits),indexing='ij'))
+    precision = 1
+    inside,outside = classify(_cell_bounds(lon_idx,lat_idx,precision),precision)
+    interior,boundary = [],[]
+    count = 0
+    while True:
+        emit,refine = inside,~inside & ~outside
+        if precision >= max_precision or not refine.any():
+            break
+        child_lon,child_lat = _child_cells(lon_idx[refine],lat_idx[refine],precision)
+        child_inside,child_outside = classify(_cell_bounds(child_lon,child_lat,precision+1),precision+1)
+        if max_cells is not None and count+emit.sum()+(~child_outside).sum() > max_cells:
+            break
+        interior += _cells_to_geohashes(lon_idx[emit],lat_idx[emit],precision)
+        count += emit.sum()
+        lon_idx,lat_idx,precision = child_lon,child_lat,precision+1
+        inside,outside = child_inside,child_outside
+    interior += _cells_to_geohashes(lon_idx[emit],lat_idx[emit],precision)
+    boundary += _cells_to_geohashes(lon_idx[refine],lat_idx[refine],precision)
+    return interior,boundary
+
 def geohashes_covering_rectangle(min_lon,max_lon,min_lat,max_lat,precision):
-    # Get the geohash for the center of the rectangle
-    cgh = pgh.encode(latitude=(min_lat+max_lat)/2, longitude=(min_lon+max_lon)/2, precision=precision)
-    visited = {}
-    queue = [cgh]
-    while queue:
-        p = queue.pop(0)
-        if p in visited:
-            continue
-        visited[p] = 1
-        directions = ["top","right","bottom","left"]
-        for dir in directions:
-            nei = pgh.get_adjacent(p,dir)
-            if rect_overlap(*bounding_box(nei),min_lon,max_lon,min_lat,max_lat):
-                queue.append(nei)
-    return list(visited.keys())
+    '''
+    Get the geohashes whose cells overlap a rectangle (boundaries included).
+    A rectangle with min_lon > max_lon is taken to cross the antimeridian.
+    '''
+    if min_lon > max_lon:
+        lon_ranges = _wrap_lon_ranges(min_lon,max_lon+360)
+    else:
+        lon_ranges = [(min_lon,max_lon)]
+    lon_idx,lat_idx,bounds = _candidate_cells(lon_ranges,min_lat,max_lat,precision)
+    inside = np.zeros(lon_idx.shape,dtype=bool)
+    for a,b in lon_ranges:
+        inside |= rects_overlap(*bounds,a,b,min_lat,max_lat)
+    return _cells_to_geohashes(lon_idx[inside],lat_idx[inside],precision)
+
 def geohashes_covering_circle(xc,yc,radius,precision,distance_type='eculidean'):
-    cgh = pgh.encode(latitude=yc, longitude=xc, precision=precision)
-    visited = {}
-    queue = [cgh]
-    while queue:
-        p = queue.pop(0)
-        if p in visited:
-            continue
-        visited[p] = 1
-        directions = ["top","right","bottom","left"]
-        for dir in directions:
-            nei = pgh.get_adjacent(p,dir)
-            if not rect_outside_a_circle(*bounding_box(nei),xc,yc,radius,distance_type):
-                queue.append(nei)
-
-    return list(visited.keys())
+    '''
+    Get the geohashes whose cells are not outside a circle.
+    `radius` is in degrees for eculidean distance and in meters for haversine distance,
+    in which case the covering wraps across the antimeridian and over the poles.
+    '''
+    if distance_type == 'eculidean':
+        lon_ranges = [(xc-radius,xc+radius)]
+        min_lat,max_lat = yc-radius,yc+radius
+    else:
+        # bounding box of the spherical cap
+        angle = radius/EARTH_RADIUS
+        min_lat,max_lat = yc-math.degrees(angle),yc+math.degrees(angle)
+        if min_lat <= -90 or max_lat >= 90 or angle >= math.pi/2:
+            lon_ranges = [(-180.0,180.0)]
+        else:
+            d_lon = math.degrees(math.asin(min(1.0,math.sin(angle)/math.cos(math.radians(yc)))))
+            lon_ranges = _wrap_lon_ranges(xc-d_lon,xc+d_lon)
+    lon_idx,lat_idx,bounds = _candidate_cells(lon_ranges,min_lat,max_lat,precision)
+    inside = ~rects_outside_a_circle(*bounds,xc,yc,radius,distance_type)
+    return _cells_to_geohashes(lon_idx[inside],lat_idx[inside],precision)
+
+def geohashes_covering_rectangle_adaptive(min_lon,max_lon,min_lat,max_lat,max_precision,max_cells=None):
+    '''
+    Mixed-precision version of geohashes_covering_rectangle: cells inside the rectangle stay
+    coarse, boundary cells are refined down to max_precision (see adaptive_covering).
+    Complete groups of 32 siblings are merged into their parent.
+    '''
+    if min_lon > max_lon:
+        lon_ranges = _wrap_lon_ranges(min_lon,max_lon+360)
+    else:
+        lon_ranges = [(min_lon,max_lon)]
+    def classify(bounds,precision):
+        inside = np.zeros(bounds[0].shape,dtype=bool)
+        overlap = np.zeros(bounds[0].shape,dtype=bool)
+        for a,b in lon_ranges:
+            inside |= rects_inside_a_rect(*bounds,a,b,min_lat,max_lat)
+            overlap |= rects_overlap(*bounds,a,b,min_lat,max_lat)
+        return inside,~overlap
+    interior,boundary = adaptive_covering(classify,max_precision,max_cells)
+    return trim_hashes(interior+boundary)
+
+def geohashes_covering_circle_adaptive(xc,yc,radius,max_precision,max_cells=None,distance_type='eculidean'):
+    '''
+    Mixed-precision version of geohashes_covering_circle: cells inside the circle stay
+    coarse, boundary cells are refined down to max_precision (see adaptive_covering) and
+    complete groups of 32 siblings are merged into their parent. Without a cell budget,
+    expanding the result to max_precision gives geohashes_covering_circle at max_precision.
+    max_precision should not exceed the precision of the index being queried.
+    '''
+    def classify(bounds,precision):
+        inside = rects_inside_a_circle(*bounds,xc,yc,radius,distance_type)
+        if precision == max_precision:
+            outside = rects_outside_a_circle(*bounds,xc,yc,radius,distance_type)
+        else:
+            outside = rects_disjoint_from_a_circle(*bounds,xc,yc,radius,distance_type)
+        return inside,outside
+    interior,boundary = adaptive_covering(classify,max_precision,max_cells)
+    return trim_hashes(interior+boundary)
+
+def geohashes_covering_polygon(polygon,max_precision,max_cells=None):
+    '''
+    Mixed-precision covering of a shapely (multi)polygon in lon/lat.
+    Returns (interior,boundary): interior cells lie completely inside the polygon,
+    boundary cells (refined down to max_precision, see adaptive_covering) intersect its boundary.
+    '''
+    shapely.prepare(polygon)
+    def classify(bounds,precision):
+        xmin,xmax,ymin,ymax = bounds
+        cells = shapely.box(xmin,ymin,xmax,ymax)
+        return shapely.contains(polygon,cells),~shapely.intersects(polygon,cells)
+    return adaptive_covering(classify,max_precision,max_cells)
+
+def geohash_prefix_mask(geohashes,prefixes):
+    '''
+    mask of the geohashes that start with any of the (mixed-length) prefixes
+    '''
+    geohashes = np.asarray(geohashes,dtype=str)
+    mask = np.zeros(geohashes.shape,dtype=bool)
+    by_length = {}
+    for prefix in prefixes:
+        by_length.setdefault(len(prefix),[]).append(prefix)
+    for length,group in by_length.items():
+        mask |= np.isin(geohashes.astype(f'<U{length}'),group)
+    return mask
+
 def h3tree_covering_circle(xc,yc,radius,precision):
     '''
     Get the h3 (tree encoding) covering a circle
@@ -1,22 +1,36 @@
 from abc import ABC, abstractmethod
 import geopandas as gpd
 import pandas as pd
+import pyarrow as pa
 import pyarrow.parquet as pq
-import ast
 import os
-import io
-import struct
-from .trie import Trie
-from .util import merge_dict,compose_path
+import json
+import numpy as np
+import shapely
+from .trie import CompactTrie
+from .util import merge_dict,compose_path,parse_tuple,dataset_leaf_lines,parse_dataset_leaf
+from .packed_index import PackedIndex,write_packed_index
+from .binary_leaf import encode_leaf,decode_leaf,leaf_entries,LEAF_SUFFIX
+from .geojson_stream import geojson_feature_offsets,iter_geojson_points,first_feature_offset,CHUNK_SIZE
+from .parquet_stream import iter_parquet_points,footer_offset_and_length
+from .parquet_cluster import cluster_parquet
+from .parquet_select import filter_frame
+from .parallel_build import parquet_runs,geojson_runs,trie_from_runs,export_text_leaves,export_geojson_leaves,\
+    export_binary_leaves,write_feature_files,write_group_files,dataset_paths,ingest_files
 from .filesystem import *
-from .geohash_func import geohash_encode,h3_encode,h3_to_h3tree
+from .geohash_func import geohash_encode_array,h3_encode_array,\
+    geohashes_covering_polygon,geohash_prefix_mask,encode_cells
+
+# file table of a multi-file tree index, at the index root
+FILE_TABLE = "files.json"
+
 def append_geohash_to_dataframe(df,precision=4):
     """
     Append geohash to a dataframe
     """
     if 'x' not in df.columns:
         df = pd.concat([df,df.get_coordinates()],axis=1)
-    df['geohash'] = df.apply(lambda row: geohash_encode(row['y'], row['x'],precision), axis=1)
+    df['geohash'] = geohash_encode_array(df['y'].values, df['x'].values,precision)
     return df
 
 def append_h3_to_dataframe(df,precision=8):
@@ -25,16 +39,22 @@ def append_h3_to_dataframe(df,precision=8):
     """
     if 'x' not in df.columns:
         df = pd.concat([df,df.get_coordinates()],axis=1)
-    df['h3'] = df.apply(lambda row: h3_encode(row['y'], row['x'],precision), axis=1)
-    df['geohash'] = df['h3'].map(lambda x: h3_to_h3tree(x))
+    df['h3'],df['geohash'] = h3_encode_array(df['y'].values, df['x'].values,precision,return_tree=True)
     return df
 
-def splitting_dataframe_to_files(df, target_directory,bucket_size = 1):
+def splitting_dataframe_to_files(df, target_directory,bucket_size = 1,processes=1):
+    # processes: files are written by a process pool unless 1 (None for every core)
     # Initialize an empty list to store file paths
     file_paths = []
     # Make sure the directory exists, if not create it
     if not os.path.exists(target_directory):
         os.makedirs(target_directory)
+    if bucket_size == 1 and processes != 1:
+        df['single_path'] = write_feature_files(df, target_directory, processes)
+        return df
+    elif bucket_size == -1 and processes != 1:
+        geohashes,file_paths = write_group_files(df, target_directory, processes)
+        return pd.DataFrame({'geohash':geohashes,'parquet_path':file_paths})
     if bucket_size == 1:
         # Loop through each row in GeoDataFrame
         for index, row in df.iterrows():
@@ -84,12 +104,40 @@ class GeohashTree(ABC):
     def query(self, geohashes):
         pass
 
+    def retrieve_polygon(self,polygon,index_root,precision,max_cells=None):
+        '''
+        Retrieve the features intersecting a shapely (multi)polygon in lon/lat.
+        Point features from cells lying inside the polygon are accepted without a geometry
+        test, only features from boundary cells are tested against the polygon.
+        precision should not exceed the precision of the index.
+        '''
+        if getattr(self,'grid','geohash') != 'geohash':
+            raise ValueError("polygon retrieval requires a geohash index")
+        interior,boundary = geohashes_covering_polygon(polygon,precision,max_cells)
+        gdf = self.retrieve(interior+boundary,index_root)
+        if gdf is None or gdf.empty:
+            return gdf
+        geometries = gdf.geometry.values
+        accepted = np.zeros(len(gdf),dtype=bool)
+        # empty points have no coordinates, intersects drops them below
+        points = (shapely.get_type_id(geometries) == 0) & ~shapely.is_empty(geometries)
+        point_hashes = geohash_encode_array(shapely.get_y(geometries[points]),shapely.get_x(geometries[points]),precision)
+        accepted[points] = geohash_prefix_mask(point_hashes,interior)
+        tested = ~accepted
+        accepted[tested] = shapely.intersects(geometries[tested],polygon)
+        return gdf[accepted]
+
 class LiteTreeCID(GeohashTree):
-    def __init__(self,mode="offline"):
+    def __init__(self,mode="offline",client=None):
+        '''
+        client: KuboClient for IPFS calls, the shared default client if None
+        '''
         self.mode = mode
-    def add_from_parquet(self, parquet, target_directory,precision=4):
+        self.client = client or get_client()
+    def add_from_parquet(self, parquet, target_directory,precision=4,processes=1):
         """
         prepare a geoparquet file to be indexed
+        processes: the per-geohash files are written by a process pool unless 1 (None for every core)
         """
         self.file_format = 'parquet'
         # Read the geoparquet file
@@ -97,34 +145,29 @@ class LiteTreeCID(GeohashTree):
         # calculate geohash
         features = append_geohash_to_dataframe(features,precision)
         # Split the GeoDataFrame into multiple parquet files by their geohash groups
-        pqs = splitting_dataframe_to_files(features, target_directory,bucket_size=-1)
+        pqs = splitting_dataframe_to_files(features, target_directory,bucket_size=-1,processes=processes)
         print(pqs.head())
         # create dataframe with parquet paths
         # calculate CID for each parquet file
-        pqs['cid'] = pqs.apply(lambda x: compute_cid(x['parquet_path']),axis=1)
-        pairs = list(zip(pqs['geohash'],pqs['cid']))
-        # Create an empty Trie dictionary
-        self.trie_dict = Trie()
-        # Insert each index-value pair into the Trie dictionary
-        for index, value in pairs:
-            self.trie_dict.insert(index, value)
+        pqs['cid'] = compute_cids(pqs['parquet_path'])
+        # Insert all index-value pairs into an array-backed trie
+        self.trie_dict = CompactTrie()
+        self.trie_dict.insert_many(pqs['geohash'].values,list(pqs['cid']))
 
 
-    def add_from_geojson(self, geojson, target_directory):
+    def add_from_geojson(self, geojson, target_directory,processes=1):
         """
         Add a GeoJSON file to the index tree
+        processes: the per-feature files are written by a process pool unless 1 (None for every core)
         """
         self.file_format = 'geojson'
         features = gpd.read_file(geojson)
         features = append_geohash_to_dataframe(features)
-        features = splitting_dataframe_to_files(features, target_directory,bucket_size = 1)
-        features['single_cid'] = features.apply(lambda x: compute_cid(x['single_path']),axis=1)
-        pairs = list(zip(features['geohash'],features['single_cid']))
-        # Create an empty Trie dictionary
-        self.trie_dict = Trie()
-        # Insert each index-value pair into the Trie dictionary
-        for index, value in pairs:
-            self.trie_dict.insert(index, value)
+        features = splitting_dataframe_to_files(features, target_directory,bucket_size = 1,processes=processes)
+        features['single_cid'] = compute_cids(features['single_path'])
+        # Insert all index-value pairs into an array-backed trie
+        self.trie_dict = CompactTrie()
+        self.trie_dict.insert_many(features['geohash'].values,list(features['single_cid']))
 
     def export_trie(self,trie_node,geohash,root_path):
         #export geojson at current hash level
@@ -143,9 +186,13 @@ class LiteTreeCID(GeohashTree):
             child_hash = geohash+ch
             self.export_trie(trie_node.children[ch],child_hash,next_path)
 
-    def generate_tree_index(self,destination_path):
+    def generate_tree_index(self,destination_path,processes=1):
         # Implementation specific to Backend2
-        self.export_trie(self.trie_dict.root,"",destination_path)
+        # processes: leaves are written by a process pool unless 1 (None for every core)
+        if processes != 1:
+            export_text_leaves(self.trie_dict,destination_path,"",processes)
+        else:
+            self.export_trie(self.trie_dict.root,"",destination_path)
 
     def upload_parquet_files(self, target_directory):
         """
@@ -154,7 +201,7 @@ class LiteTreeCID(GeohashTree):
         # Get a list of all parquet files in the target directory
         files = [f for f in os.listdir(target_directory) if f.endswith('.parquet')]
         # Upload each parquet file to IPFS
-        ipfs_add_feature([os.path.join(target_directory, file) for file in files])
+        ipfs_add_feature([os.path.join(target_directory, file) for file in files],self.client)
             
     
     def process_leaf_node(self,leaf):
@@ -218,88 +265,50 @@ class LiteTreeCID(GeohashTree):
             print('file_format not found')
             return None
         if self.file_format == 'geojson':
-            ipfs_retrieval = pd.concat([ipfs_get_feature(cid) for cid in results])
+            ipfs_retrieval = pd.concat([ipfs_get_feature(cid,self.client) for cid in results])
         elif self.file_format == 'parquet':
-            ipfs_retrieval = pd.concat([ipfs_get_parquet(cid) for cid in results])
+            ipfs_retrieval = pd.concat([ipfs_get_parquet(cid,self.client) for cid in results])
         else:
             
             ipfs_retrieval = None
         return ipfs_retrieval
     
 class LiteTreeOffset(GeohashTree):
-    def __init__(self,mode="offline",grid='geohash'):
+    def __init__(self,mode="offline",grid='geohash',index_format='tree',client=None,range_planner=None,
+                 footer_cache=None):
+        '''
+        index_format: 'tree' for a folder of leaf txt files, 'binary' for a folder of binary leaf
+        files (see binary_leaf.py), 'packed' for a single binary index file (see packed_index.py)
+        client: KuboClient for IPFS calls, the shared default client if None
+        range_planner: RangePlanner merging nearby byte ranges on retrieval, its summary()
+        reports the requests and over-read of the last retrieve
+        footer_cache: FooterCache of parsed parquet footers, the shared in-process one if None;
+        FooterCache(directory) persists them, e.g. next to the index
+        '''
         self.mode = mode
         self.grid = grid
-        self.fs = InterPlanetaryFS() if mode == "online" else LocalFS()
+        self.index_format = index_format
+        self.leaf_suffix = LEAF_SUFFIX if index_format == 'binary' else '.txt'
+        self.client = client or get_client()
+        self.range_planner = range_planner or RangePlanner()
+        self.footer_cache = footer_cache or get_footer_cache()
+        self.fs = InterPlanetaryFS(client=self.client) if mode == "online" else LocalFS()
         print(f"Index Mode: {mode}")
         self.offsets = []
+        self.packed_indexes = {}
+        # file table of a multi-file index (add_from_dataset), None when one file is indexed
+        self.files = None
+        self.file_tables = {}
+        self.file_formats = {}
     def parquet_footer_offset_and_length(self,file_path):
-        file_size = os.path.getsize(file_path)
-        with open(file_path, 'rb') as f:
-            f.seek(file_size-8)
-            footer_length = struct.unpack('<I', f.read(4))[0]
-        return (file_size-footer_length - 8,footer_length)
+        return footer_offset_and_length(file_path)
     
     def calculate_row_group_index_offsets(self,file_path):
-        parquet_file = pq.ParquetFile(file_path)
-        row_group_size = parquet_file.metadata.row_group(0).num_rows
-        rows = parquet_file.metadata.num_rows
-        return [ (i // row_group_size, i % row_group_size) for i in range(rows)]
+        metadata = pq.ParquetFile(file_path).metadata
+        return [(i,row) for i in range(metadata.num_row_groups) for row in range(metadata.row_group(i).num_rows)]
 
     def calculate_offsets_and_lengths_stream(self,geojson_file_path):
-        def count_char_outside_quotes(line, char):
-            count = 0
-            in_quotes = False
-            escape_next = False  # Track whether the next character is escaped
-            
-            for c in line:
-                # If the current character is a backslash and escape_next is False, toggle escape_next
-                if c == '\\' and not escape_next:
-                    escape_next = True
-                    continue
-                elif c == '\"' and not escape_next:
-                    # Toggle in_quotes if not preceded by an unescaped backslash
-                    in_quotes = not in_quotes
-                elif c == char and not in_quotes:
-                    # Count the char if it's not inside quotes
-                    count += 1
-                escape_next = False if escape_next else escape_next  # Reset escape_next if it was True
-            
-            return count
-        offsets_and_lengths = []
-        feature_start_token = '"type": "Feature"'
-        
-        with open(geojson_file_path, 'r') as file:
-            feature_start = None
-            brace_count = 0
-
-            while True:
-                # Track the current position
-                current_position = file.tell()
-
-                # Read the next line
-                line = file.readline()
-
-                if not line:
-                    break  # End of file
-
-                # Check for the start of a feature
-                if feature_start_token in line and feature_start is None:
-                    feature_start = current_position
-                    brace_count = 0
-
-                # Count braces to find the end of the feature
-                if feature_start is not None:
-                    brace_count += count_char_outside_quotes(line,'{')
-                    brace_count -= count_char_outside_quotes(line,'}')
-
-                # When the braces balance out, we've found the end of the feature
-                if feature_start is not None and brace_count == 0:
-                    feature_end = current_position + len(line.encode())
-                    offsets_and_lengths.append((feature_start, feature_end - feature_start))
-                    feature_start = None
-
-        return offsets_and_lengths
+        return geojson_feature_offsets(geojson_file_path)
     
     
     
@@ -307,13 +316,18 @@ class LiteTreeOffset(GeohashTree):
         #export geojson at current hash level
         next_path = root_path+"/"+"".join(geohash)
         leaf_path = root_path+f"/{geohash}.txt"
-        cid = self.CID if self.CID else "[CID placeholder]"
         if trie_node.value:
             # Open a file in write mode
             with open(leaf_path, 'w') as f:
-                f.write(f"{cid}\n{self.head_offset_length}\n")
-                for item in trie_node.value:
-                    f.write(f"{item}\n")
+                if self.files is not None:
+                    # files are listed once in files.json, leaves refer to them by position
+                    for line in dataset_leaf_lines(trie_node.value):
+                        f.write(f"{line}\n")
+                else:
+                    cid = self.CID if self.CID else "[CID placeholder]"
+                    f.write(f"{cid}\n{self.head_offset_length}\n")
+                    for item in trie_node.value:
+                        f.write(f"{item}\n")
         #make path and export to sub folder
         import os 
         if trie_node.children and not os.path.exists(next_path):
@@ -321,64 +335,261 @@ class LiteTreeOffset(GeohashTree):
         for ch in trie_node.children:
             child_hash = geohash+ch
             self.export_trie(trie_node.children[ch],child_hash,next_path)
-    def add_from_geojson(self, geojson,precision=4):
+    def add_from_geojson(self, geojson,precision=4,chunk_size=CHUNK_SIZE,processes=1):
         '''
-        Partial retrieval for geojson with offset and length
+        Partial retrieval for geojson with offset and length.
+        The file is streamed in windows of chunk_size bytes, features without geometry are not indexed.
+        processes: byte windows are scanned and encoded by a process pool unless 1 (None for every core),
+        giving the same index as the serial build (see parallel_build.py)
         '''
         self.file_format = 'geojson'
-        offsets_lengths = self.calculate_offsets_and_lengths_stream(geojson)
-        features = gpd.read_file(geojson)
-        features['offlen'] = offsets_lengths
-        self.head_offset_length = (0,offsets_lengths[0][0])
-        if self.grid == 'geohash':
-            features = append_geohash_to_dataframe(features,precision)
-        elif self.grid == 'h3':
-            features = append_h3_to_dataframe(features,precision)
-        pairs = list(zip(features['geohash'],features['offlen']))
-        # Create an empty Trie dictionary
-        self.trie_dict = Trie()
-        # Insert each index-value pair into the Trie dictionary
-        for index, value in pairs:
-            self.trie_dict.insert(index, value)
+        self.head_offset_length = None
+        self.files = None
+        if processes != 1:
+            first = first_feature_offset(geojson,chunk_size)
+            self.head_offset_length = (0,first) if first is not None else None
+            self.trie_dict = trie_from_runs(geojson_runs(geojson,self.grid,precision,processes,chunk_size))
+            self.CID = compute_cid(geojson)
+            return
+        self.trie_dict = CompactTrie()
+        # one pass over the file: byte ranges and points of a window of features at a time,
+        # the features themselves are never loaded
+        for offsets,lengths,x,y in iter_geojson_points(geojson,chunk_size):
+            if self.head_offset_length is None and len(offsets):
+                self.head_offset_length = (0,int(offsets[0]))
+            located = ~np.isnan(x)
+            hashes = encode_cells(y[located],x[located],self.grid,precision)
+            self.trie_dict.insert_many(hashes,np.stack([offsets[located],lengths[located]],axis=1))
         self.CID = compute_cid(geojson)
 
-    def add_from_parquet(self, parquet_path,precision=4):
+    def add_from_parquet(self, parquet_path,precision=4,processes=1):
         '''
-        Partial retrieval for geojson by reading one row group 
+        Partial retrieval for geojson by reading one row group.
+        Rows without geometry are not indexed.
+        processes: row groups are read and encoded by a process pool unless 1 (None for every core),
+        giving the same index as the serial build (see parallel_build.py)
         '''
         self.file_format = 'parquet'
+        self.files = None
         self.head_offset_length = self.parquet_footer_offset_and_length(parquet_path)
         print('footer',self.head_offset_length)
-        row_group_offsets = self.calculate_row_group_index_offsets(parquet_path)
-        features = gpd.read_parquet(parquet_path)
-        features['offlen'] = row_group_offsets
-        
-        
-        if self.grid == 'geohash':
-            features = append_geohash_to_dataframe(features,precision)
-        elif self.grid == 'h3':
-            features = append_h3_to_dataframe(features,precision)
-        pairs = list(zip(features['geohash'],features['offlen']))
-        # Create an empty Trie dictionary
-        self.trie_dict = Trie()
-        # Insert each index-value pair into the Trie dictionary
-        for index, value in pairs:
-            self.trie_dict.insert(index, value)
+        if processes != 1:
+            self.trie_dict = trie_from_runs(parquet_runs(parquet_path,self.grid,precision,processes))
+            self.CID = compute_cid(parquet_path)
+            return
+        self.trie_dict = CompactTrie()
+        # only the position columns are read, one row group at a time
+        for row_group,x,y in iter_parquet_points(parquet_path):
+            rows = np.flatnonzero(~np.isnan(x))
+            hashes = encode_cells(y[rows],x[rows],self.grid,precision)
+            self.trie_dict.insert_many(hashes,np.stack([np.full(len(rows),row_group),rows],axis=1))
         self.CID = compute_cid(parquet_path)
 
-    def generate_tree_index(self,destination_path):
+    def add_from_parquet_clustered(self, parquet_path, clustered_path, precision=4, row_group_bytes=32 << 20,
+                                   processes=1, **cluster_kwargs):
+        '''
+        Rewrite parquet_path in geohash order to clustered_path with row groups cut at geohash prefix
+        boundaries (see parquet_cluster.py), then index the rewritten file, so each cell maps to a run
+        of consecutive row groups. Returns the summary of cluster_parquet.
+        '''
+        summary = cluster_parquet(parquet_path, clustered_path, precision=precision,
+                                  row_group_bytes=row_group_bytes, **cluster_kwargs)
+        print('clustered',summary)
+        self.add_from_parquet(clustered_path,precision,processes)
+        return summary
+
+    def add_from_dataset(self, dataset,precision=4,processes=1):
+        '''
+        Index several parquet / GeoJSON files in one tree: a directory (searched recursively for
+        .parquet, .geojson and .json files) or a list of paths.
+        The files are listed once, with their CID, format and header/footer range, in a file table
+        (files.json next to the tree leaves, or the packed index file table); each entry refers to
+        its file by position in it.
+        processes: files are indexed one per worker of a process pool unless 1 (None for every core)
+        '''
+        self.files = []
+        self.CID = None
+        self.head_offset_length = None
+        self.trie_dict = CompactTrie()
+        for file_id,(entry,keys,values) in enumerate(ingest_files(dataset_paths(dataset),self.grid,precision,processes)):
+            self.files.append(entry)
+            self.trie_dict.insert_many(keys,np.column_stack([np.full(len(keys),file_id),values]))
+        self.file_formats = {f['cid']:f['format'] for f in self.files}
+        formats = set(self.file_formats.values())
+        self.file_format = formats.pop() if len(formats) == 1 else 'mixed'
+        print('dataset files',len(self.files))
+
+    def _first_leaf(self,index_root):
+        '''
+        path of a leaf of a local tree index, following the first folder down, None if it has none
+        '''
+        node = index_root
+        while True:
+            names = sorted(os.listdir(node))
+            leaves = [name for name in names if name.endswith(self.leaf_suffix)]
+            if leaves:
+                return os.path.join(node,leaves[0])
+            folders = [name for name in names if os.path.isdir(os.path.join(node,name))]
+            if not folders:
+                return None
+            node = os.path.join(node,folders[0])
+
+    def update_tree_index(self,index_root,source,precision=None):
+        '''
+        Add the features of another parquet / GeoJSON file to an exported (local) tree index in place,
+        rewriting only the leaves of the cells it touches and creating only the folders they need; the
+        rewritten leaves are those a full add_from_dataset build with the file appended would write.
+        A single-file text index gets a files.json file table listing its file first, and only its
+        rewritten leaves are converted to the multi-file layout: the others keep their CID and header
+        lines, which queries read as before. Leaves are text or binary as the index_format of this
+        instance says.
+        precision: geohash precision of the new entries, that of the existing leaves if None.
+        Returns {'file_id', 'cid', 'leaves', 'directories', 'subtrees'}: the files written (leaves and
+        files.json), the folders created and every folder whose content changed, as paths relative to
+        index_root ('' for the root). Nothing changes if the file is already indexed.
+        Only these paths need re-publishing, see ipfs_update_index_folder.
+        '''
+        table_path = os.path.join(index_root,FILE_TABLE)
+        leaf = self._first_leaf(index_root)
+        if os.path.exists(table_path):
+            with open(table_path) as f:
+                files = json.load(f)
+        elif leaf is not None:
+            # single-file index: its CID and header range head every leaf
+            with open(leaf) as f:
+                cid,head = f.readline().strip(),parse_tuple(f.readline().strip())
+            # a geojson header starts the file, a parquet footer cannot
+            files = [{'cid':cid,'format':'geojson' if head[0] == 0 else 'parquet','head':list(head)}]
+        else:
+            files = []
+        if precision is None:
+            if leaf is None:
+                raise ValueError("precision is needed to add to an empty index")
+            precision = len(os.path.basename(leaf)) - len(self.leaf_suffix)
+        entry,keys,values = next(ingest_files([source],self.grid,precision))
+        known = [f['cid'] for f in files]
+        if entry['cid'] in known:
+            return {'file_id':known.index(entry['cid']),'cid':entry['cid'],'leaves':[],'directories':[],'subtrees':[]}
+        file_id = len(files)
+        files.append(entry)
+        written,created = [],[]
+        bounds = np.concatenate(([0],np.flatnonzero(keys[1:] != keys[:-1])+1,[len(keys)])) if len(keys) else [0]
+        for a,b in zip(bounds[:-1],bounds[1:]):
+            key = str(keys[a])
+            folders = ["/".join(key[:j] for j in range(1,i+1)) for i in range(1,len(key))]
+            for folder in folders:
+                if not os.path.isdir(os.path.join(index_root,folder)):
+                    os.makedirs(os.path.join(index_root,folder))
+                    created.append(folder)
+            relative = "/".join(folders[-1:]+[f"{key}{self.leaf_suffix}"])
+            if self.index_format == 'binary':
+                file_ids,pairs = np.empty(0,dtype=np.int64),np.empty((0,2),dtype=np.int64)
+                if os.path.exists(os.path.join(index_root,relative)):
+                    with open(os.path.join(index_root,relative),'rb') as f:
+                        file_ids,pairs = decode_leaf(f.read())
+                with open(os.path.join(index_root,relative),'wb') as f:
+                    f.write(encode_leaf(np.append(file_ids,np.full(b-a,file_id)),np.concatenate((pairs,values[a:b]))))
+                written.append(relative)
+                continue
+            lines = []
+            if os.path.exists(os.path.join(index_root,relative)):
+                with open(os.path.join(index_root,relative)) as f:
+                    lines = [line.rstrip('\n') for line in f if line.strip()]
+                if lines and not lines[0].startswith('@'):
+                    lines = ["@0"]+lines[2:]
+            lines += dataset_leaf_lines([(file_id,*value) for value in values[a:b].tolist()])
+            with open(os.path.join(index_root,relative),'w') as f:
+                for line in lines:
+                    f.write(f"{line}\n")
+            written.append(relative)
+        with open(table_path,'w') as f:
+            json.dump(files,f)
+        written.append(FILE_TABLE)
+        subtrees = {"/".join(path.split("/")[:i]) for path in written for i in range(path.count("/")+1)}
+        self.file_tables.pop(index_root,None)
+        self.file_formats.update({f['cid']:f['format'] for f in files})
+        return {'file_id':file_id,'cid':entry['cid'],'leaves':written,'directories':created,'subtrees':sorted(subtrees)}
+
+    def export_packed(self,destination_file):
+        '''
+        export the trie as a single packed index file
+        '''
+        keys,values = self.trie_dict.arrays()
+        if self.files is not None:
+            write_packed_index(destination_file,keys,values[:,0],values[:,1:],self.files)
+            return
+        write_packed_index(destination_file,keys,np.zeros(len(keys),dtype=np.uint32),values,self.index_files())
+
+    def index_files(self):
+        '''
+        file table of the index: the dataset's files, or the one indexed file
+        '''
+        if self.files is not None:
+            return self.files
+        cid = self.CID if self.CID else "[CID placeholder]"
+        return [{'cid':cid,'format':self.file_format,'head':list(self.head_offset_length)}]
+
+    def generate_tree_index(self,destination_path,processes=1):
         # Implementation specific to Backend2
-        self.export_trie(self.trie_dict.root,"",destination_path)
+        # processes: tree leaves are written by a process pool unless 1 (None for every core)
+        if self.index_format == 'packed':
+            self.export_packed(destination_path)
+            return
+        if self.files is not None or self.index_format == 'binary':
+            # binary leaves refer to files by position, also when a single file is indexed
+            os.makedirs(destination_path,exist_ok=True)
+            with open(os.path.join(destination_path,FILE_TABLE),'w') as f:
+                json.dump(self.index_files(),f)
+        if self.index_format == 'binary':
+            export_binary_leaves(self.trie_dict,destination_path,processes)
+        elif processes != 1:
+            header = "" if self.files is not None else \
+                f"{self.CID if self.CID else '[CID placeholder]'}\n{self.head_offset_length}\n"
+            export_text_leaves(self.trie_dict,destination_path,header,processes,dataset=self.files is not None)
+        else:
+            self.export_trie(self.trie_dict.root,"",destination_path)
+
+    def open_packed(self,index_path):
+        '''
+        open (and keep) a packed index from a local path or a CID in online mode
+        '''
+        if index_path not in self.packed_indexes:
+            index = PackedIndex.open(index_path,self.fs)
+            if not hasattr(self,'file_format') and index.files:
+                self.file_format = index.files[0]['format']
+            self.file_formats.update({f['cid']:f['format'] for f in index.files})
+            self.packed_indexes[index_path] = index
+        return self.packed_indexes[index_path]
     
-    def process_leaf_node(self,leaf):
+    def file_table(self,index_root):
+        '''
+        file table of a multi-file tree index (its files.json), None for a single-file index
+        '''
+        if index_root not in self.file_tables:
+            path = index_root+"/"+FILE_TABLE
+            files = json.loads("".join(self.fs.readlines(path))) if self.fs.path_exists(path) else None
+            if files is not None:
+                self.file_formats.update({f['cid']:f['format'] for f in files})
+            self.file_tables[index_root] = files
+        return self.file_tables[index_root]
+
+    def file_format_of(self,cid):
+        return self.file_formats.get(cid,getattr(self,'file_format',None))
+
+    def process_leaf_node(self,leaf,files=None):
         """
         process index leaf. [TODO]
-        leaf: txt file path of a index leaf, like a//ab/abc.txt
+        leaf: txt file path of a index leaf, like a//ab/abc.txt, or a binary leaf a/ab/abc.ghl
+        files: file table of the index for the leaves of a multi-file index or binary leaves
         """
+        if leaf.endswith(LEAF_SUFFIX):
+            return leaf_entries(self.fs.read_bytes(leaf,0,None),files)
         lines = self.fs.readlines(leaf)
+        if files is not None and lines and lines[0].startswith('@'):
+            return parse_dataset_leaf(lines,files)
         return {lines[0].strip():[line.strip() for line in lines[1:] if line.strip()] }
 
-    def traverse_sub_node(self,node):
+    def traverse_sub_node(self,node,files=None):
         """
         recursively collect all the leaf node under the current node
         """
@@ -386,16 +597,17 @@ class LiteTreeOffset(GeohashTree):
         results={}
         excludes = [".ipynb_checkpoints"]
         # Get list of items in the directory
-        subfolders = [d for d in self.fs.listdir(node) if self.fs.path_isdir(os.path.join(node, d)) and d not in excludes]
+        names = [d for d in self.fs.listdir(node) if d not in excludes]
+        subfolders = [d for d,isdir in zip(names,self.fs.path_isdir_many([os.path.join(node, d) for d in names])) if isdir]
         # If there are subfolders, traverse them
         if subfolders:
             for subfolder in subfolders:
-                results = merge_dict(results,self.traverse_sub_node(os.path.join(node, subfolder)))
+                results = merge_dict(results,self.traverse_sub_node(os.path.join(node, subfolder),files))
         else:
             # Otherwise, process txt files in the directory
-            txt_files = [f for f in self.fs.listdir(node) if f.endswith('.txt')]
+            txt_files = [f for f in self.fs.listdir(node) if f.endswith(('.txt',LEAF_SUFFIX))]
             for txt_file in txt_files:
-                results = merge_dict(results,self.process_leaf_node(os.path.join(node, txt_file)))
+                results = merge_dict(results,self.process_leaf_node(os.path.join(node, txt_file),files))
         return results
 
 
@@ -406,18 +618,21 @@ class LiteTreeOffset(GeohashTree):
         import os
         file_exists_func = self.fs.path_exists
         target_path = compose_path(geohash,index_root)
+        files = self.file_table(index_root)
         cid_dict = {}
         if file_exists_func(target_path):
-            cid_dict = self.traverse_sub_node(target_path)
-        if file_exists_func(target_path+'.txt'):
-            cid_dict = self.process_leaf_node(target_path+'.txt')
+            cid_dict = self.traverse_sub_node(target_path,files)
+        if file_exists_func(target_path+self.leaf_suffix):
+            cid_dict = self.process_leaf_node(target_path+self.leaf_suffix,files)
         return cid_dict
     
     def query(self, geohashes,index_root):
         # Implementation specific to Backend2
         results = {}
+        query_single = self.open_packed(index_root).query_single if self.index_format == 'packed' else \
+            lambda geohash: self.query_single(geohash,index_root)
         for nei in geohashes:
-            query = self.query_single(nei,index_root)
+            query = query_single(nei)
             if query:
                 results = merge_dict(results,query)
         return results
@@ -425,44 +640,126 @@ class LiteTreeOffset(GeohashTree):
     def count(self,geohashes,index_root):
         query_ret = self.query(geohashes,index_root)
         return sum([len(query_ret[cid])-1 for cid in query_ret]) if query_ret else 0
-    def retrieve(self,geohashes,index_root):
+    def _read_frame(self,cid,offset_list,max_workers=None,columns=None,filters=None,bbox=None):
+        '''
+        (GeoDataFrame, decode seconds) of the features of one file, offset_list being the parsed
+        [head, values...] of its index entries
+        '''
         from time import time
+        file_format = self.file_format_of(cid)
+        if file_format == "geojson":
+            offset_list = offset_list[:1] + sorted(offset_list[1:],key=lambda x:x[0])
+            header,contents = fetch_features_from_ipfs(cid, offset_list, client=self.client,
+                                                       max_workers=max_workers, planner=self.range_planner)
+            t21 = time()
+            gdf = decode_features(header,contents,b"]\n}")
+            t22 = time()
+        elif file_format == "parquet":
+            parquet_bytes = read_row_groups_from_ipfs(cid,offset_list,self.client,max_workers,self.range_planner,
+                                                      self.footer_cache,columns,filters,bbox)
+            t21 = time()
+            gdf = gpd.read_parquet(pa.BufferReader(pa.py_buffer(parquet_bytes)))
+            t22 = time()
+        gdf = filter_frame(gdf,filters,bbox)
+        if columns is not None:
+            gdf = gdf[[c for c in gdf.columns if c in columns or c == gdf.geometry.name]]
+        return gdf,t22-t21
+
+    def retrieve(self,geohashes,index_root,max_workers=None,columns=None,filters=None,bbox=None,max_files=8):
+        '''
+        features of the geohashes, max_workers bounds the concurrent range requests per file and
+        max_files the files read at once when several match
+        columns: attribute columns to return (the geometry is always kept), None for all
+        filters: (column, op, value) tuples the rows must all pass, bbox: (minx, miny, maxx, maxy)
+        the geometries must intersect. For parquet, only the needed column chunks are fetched and
+        row groups whose statistics rule out the filters are skipped (see parquet_select.py).
+        '''
+        from time import time
+        from concurrent.futures import ThreadPoolExecutor
         t0 = time()
         query_ret = self.query(geohashes,index_root)
         t1 = time()
+        self.range_planner.reset()
         results = []
         t_pd = 0
         print('json file cid',query_ret.keys())
-        for cid in query_ret:
-            
-            offset_list = [ast.literal_eval(str_tuple) for str_tuple in query_ret[cid]]
-            self.offsets = offset_list
-            if self.file_format == "geojson":
-                offset_list.sort(key=lambda x:x[0])
-                
-                geojson = extract_and_concatenate_from_ipfs(cid, offset_list, suffix_string = "]\n}")
-                t21 = time()
-                gdf = gpd.read_file(io.StringIO(geojson))
-                t22 = time()
-            elif self.file_format == "parquet":
-                parquet_bytes = read_row_groups_from_ipfs(cid,offset_list)
-                t21 = time()
-                gdf = gpd.read_parquet(io.BytesIO(parquet_bytes))
-                t22 = time()
-            results.append(gdf)
-
-            
-            t_pd+=t22-t21
+        offset_lists = {cid:[parse_tuple(item) for item in query_ret[cid]] for cid in query_ret}
+        read = lambda cid: self._read_frame(cid,offset_lists[cid],max_workers,columns,filters,bbox)
+        with ThreadPoolExecutor(max(1,min(max_files,len(offset_lists)))) as executor:
+            for cid,(gdf,t_read) in zip(offset_lists,executor.map(read,offset_lists)):
+                self.offsets = offset_lists[cid]
+                results.append(gdf)
+                t_pd+=t_read
         t2 = time()
         print(t1-t0,t2-t1-t_pd,t_pd)
         ret = pd.concat(results)
         return ret
-        
+
+    def _batches(self,cid,offset_list,batch_size):
+        '''
+        [head, values...] lists of about batch_size features each: feature ranges in offset order for
+        geojson, whole row groups adding up to batch_size rows for parquet
+        '''
+        head,values = offset_list[0],offset_list[1:]
+        if self.file_format_of(cid) == "geojson":
+            values = sorted(values)
+            for i in range(0,len(values),batch_size):
+                yield [head]+values[i:i+batch_size]
+        else:
+            fmd,_ = self.footer_cache.get(cid,head[0],head[1],self.client)
+            batch,rows = [],0
+            for rg in sorted({rg for rg,_ in values}):
+                batch.append((rg,0))
+                rows += fmd.row_groups[rg].num_rows
+                if rows >= batch_size:
+                    yield [head]+batch
+                    batch,rows = [],0
+            if batch:
+                yield [head]+batch
+
+    def iter_retrieve(self,geohashes,index_root,batch_size=10000,limit=None,max_workers=None,columns=None,
+                      filters=None,bbox=None):
+        '''
+        features of the geohashes as a stream of GeoDataFrames of about batch_size features (whole
+        row groups for parquet), so memory stays bounded by a couple of batches. The next batch is
+        fetched while the caller handles the current one. With limit, fetching stops once that
+        many features have been yielded. columns / filters / bbox as in retrieve.
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        query_ret = self.query(geohashes,index_root)
+        self.range_planner.reset()
+        batches = ((cid,chunks) for cid in query_ret
+                   for chunks in self._batches(cid,[parse_tuple(item) for item in query_ret[cid]],batch_size))
+        read = lambda batch: self._read_frame(batch[0],batch[1],max_workers,columns,filters,bbox)[0]
+        remaining = limit
+        executor = ThreadPoolExecutor(1)
+        batch = next(batches,None)
+        future = executor.submit(read,batch) if batch and (remaining is None or remaining > 0) else None
+        try:
+            while future is not None:
+                gdf = future.result()
+                if remaining is not None:
+                    gdf = gdf.iloc[:remaining]
+                    remaining -= len(gdf)
+                batch = next(batches,None) if remaining is None or remaining > 0 else None
+                future = executor.submit(read,batch) if batch else None
+                if len(gdf):
+                    yield gdf
+        finally:
+            # a consumer stopping early leaves at most the prefetched batch running
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
 
 class FullTreeFile(GeohashTree):
 
-    def __init__(self):
-        self.fs = InterPlanetaryFS()
+    def __init__(self,client=None):
+        '''
+        client: KuboClient for IPFS calls, the shared default client if None
+        '''
+        self.client = client or get_client()
+        self.fs = InterPlanetaryFS(client=self.client)
         
     def add_from_geojson(self, geojson):
         """
@@ -470,12 +767,9 @@ class FullTreeFile(GeohashTree):
         """
         features = gpd.read_file(geojson)
         self.features = append_geohash_to_dataframe(features)
-        pairs = list(zip(self.features['geohash'],self.features.index.values))
-        # Create an empty Trie dictionary
-        self.trie_dict = Trie()
-        # Insert each index-value pair into the Trie dictionary
-        for index, value in pairs:
-            self.trie_dict.insert(index, value)
+        # Insert all index-value pairs into an array-backed trie
+        self.trie_dict = CompactTrie()
+        self.trie_dict.insert_many(self.features['geohash'].values,self.features.index.values)
     def export_trie(self,trie_node,geohash,root_path):
         #export geojson at current hash level
         next_path = root_path+"/"+"".join(geohash)
@@ -490,8 +784,12 @@ class FullTreeFile(GeohashTree):
         for ch in trie_node.children:
             child_hash = geohash+ch
             self.export_trie(trie_node.children[ch],child_hash,next_path)
-    def generate_tree_index(self,destination_path):
-        self.export_trie(self.trie_dict.root,"",destination_path)
+    def generate_tree_index(self,destination_path,processes=1):
+        # processes: leaves are written by a process pool unless 1 (None for every core)
+        if processes != 1:
+            export_geojson_leaves(self.trie_dict,self.features,destination_path,processes)
+        else:
+            self.export_trie(self.trie_dict.root,"",destination_path)
 
     def process_leaf_node(self,leaf):
         """
@@ -499,7 +797,7 @@ class FullTreeFile(GeohashTree):
         leaf: CID path of a index leaf, like CID/a/ab/abc.txt
         """
         
-        return [ipfs_get_feature(leaf)]
+        return [ipfs_get_feature(leaf,self.client)]
 
     def traverse_sub_node(self,node):
         """
@@ -510,7 +808,8 @@ class FullTreeFile(GeohashTree):
         results=[]
         excludes = [".ipynb_checkpoints"]
         # Get list of items in the directory
-        subfolders = [d for d in self.fs.listdir(node) if self.fs.path_isdir(os.path.join(node, d)) and d not in excludes]
+        names = [d for d in self.fs.listdir(node) if d not in excludes]
+        subfolders = [d for d,isdir in zip(names,self.fs.path_isdir_many([os.path.join(node, d) for d in names])) if isdir]
         # If there are subfolders, traverse them
         if subfolders:
             for subfolder in subfolders:
@@ -0,0 +1,137 @@
+'''
+GDAL-free decoding of GeoJSON features fetched by byte range into the same GeoDataFrame
+gpd.read_file gives for the equivalent FeatureCollection. The features are parsed in one call
+(orjson when installed, json otherwise), the columns are typed in bulk following OGR's GeoJSON
+field type rules and the geometries are built with vectorized shapely constructors. Anything
+whose OGR typing is not reproduced here (time or mixed date strings, lists, objects, mixed value
+types, feature ids, properties in varying order) falls back to gpd.read_file.
+'''
+import io
+import json
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+# OGR types a string property as Date, Time or DateTime only when every value parses as one;
+# any value without this prefix rules that out
+DATE_PREFIX = r'^\s*(-?\d+[-/]\d+[-/]\d+|\d+:\d+)'
+# columns made only of these are converted here, other date-like columns go through GDAL
+DATE_FORMATS = [
+    (r'^\d{4}-\d{2}-\d{2}$', '%Y-%m-%d', None),
+    (r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,3})?$', 'ISO8601', None),
+    (r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,3})?Z$', 'ISO8601', 'UTC'),
+]
+
+_crs_cache = {}
+
+def _loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _dumps(obj):
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj)
+
+def feature_collection(header, features, suffix=b"]\n}"):
+    '''
+    FeatureCollection bytes of a header (up to the opening '[' of "features") and feature byte runs
+    '''
+    return header.rstrip(b',\n') + b",".join(bytes(feature).rstrip(b',\n') for feature in features) + suffix
+
+def header_crs(header, suffix=b"]\n}"):
+    '''
+    CRS GDAL assigns to a FeatureCollection with this header (read once per distinct header)
+    '''
+    header = bytes(header)
+    if header not in _crs_cache:
+        _crs_cache[header] = gpd.read_file(io.BytesIO(header.rstrip(b',\n') + suffix)).crs
+    return _crs_cache[header]
+
+def _typed_column(values):
+    '''
+    values of one property in OGR's type, None if it needs GDAL's own typing
+    '''
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    has_null = values.isna().any()
+    if kind == 'empty':
+        return values.astype(object).where(values.notna(), None)
+    if kind == 'integer':
+        if values.dtype == np.uint64:
+            return None
+        if has_null:
+            return values.astype(np.float64)
+        values = values.astype(np.int64)
+        if values.min() >= INT32_MIN and values.max() <= INT32_MAX:
+            return values.astype(np.int32)
+        return values
+    if kind in ('floating', 'mixed-integer-float'):
+        return values.astype(np.float64)
+    if kind == 'boolean':
+        return values.astype(np.float64) if has_null else values.astype(bool)
+    if kind == 'string':
+        strings = values.dropna()
+        if strings.str.match(DATE_PREFIX).all():
+            for pattern, date_format, tz in DATE_FORMATS:
+                if strings.str.match(pattern).all():
+                    dates = pd.to_datetime(values, format=date_format, utc=tz is not None, errors='coerce')
+                    if dates.isna().sum() > values.isna().sum():
+                        # date-shaped but not a valid date: OGR keeps 2020-13-45 a string, while
+                        # 2021-02-30 passes its check and then fails to read, so keep strings
+                        return values.astype(object).where(values.notna(), None)
+                    return dates.astype('datetime64[ms, UTC]' if tz else 'datetime64[ms]')
+            return None
+        return values.astype(object).where(values.notna(), None)
+    return None
+
+def _geometries(geometries):
+    '''
+    shapely geometries of GeoJSON geometry objects (None for null geometry)
+    '''
+    points = [g is not None and g.get('type') == 'Point' and len(g.get('coordinates') or ()) == 2
+              for g in geometries]
+    out = np.empty(len(geometries), dtype=object)
+    points = np.array(points, dtype=bool)
+    if points.any():
+        coordinates = np.array([geometries[i]['coordinates'] for i in np.flatnonzero(points)], dtype=np.float64)
+        out[points] = shapely.points(coordinates)
+    others = np.flatnonzero(~points)
+    if len(others):
+        out[others] = shapely.from_geojson([_dumps(geometries[i]) if geometries[i] is not None else None
+                                            for i in others])
+    return out
+
+def decode_features(header, features, suffix=b"]\n}"):
+    '''
+    GeoDataFrame of GeoJSON feature byte runs (one or more ",\\n" separated features each) under
+    a FeatureCollection header, equal to gpd.read_file of the reassembled collection
+    '''
+    try:
+        parsed = _loads(b"[" + b",".join(bytes(feature).rstrip(b',\n') for feature in features) + b"]")
+    except ValueError:
+        parsed = None
+    frame = _decode_parsed(parsed) if parsed is not None else None
+    if frame is None:
+        return gpd.read_file(io.BytesIO(feature_collection(header, features, suffix)))
+    properties, geometries = frame
+    return gpd.GeoDataFrame(properties, geometry=geometries, crs=header_crs(header, suffix))
+
+def _decode_parsed(parsed):
+    if any(type(f) is not dict or 'id' in f for f in parsed):
+        return None
+    props = [f.get('properties') or {} for f in parsed]
+    keys = list(props[0]) if props else []
+    if any(list(p) != keys for p in props):
+        return None
+    properties = pd.DataFrame(props, columns=keys) if keys else pd.DataFrame(index=pd.RangeIndex(len(props)))
+    columns = {}
+    for key in keys:
+        column = _typed_column(properties[key])
+        if column is None:
+            return None
+        columns[key] = column
+    properties = pd.DataFrame(columns, index=pd.RangeIndex(len(props))) if keys else properties
+    return properties, _geometries([f.get('geometry') for f in parsed])
@@ -0,0 +1,265 @@
+'''
+Byte-level scanning of GeoJSON FeatureCollections, one feature per line as written by GDAL.
+'''
+import json
+import mmap
+import re
+import numpy as np
+
+FEATURE_TOKEN = b'"type": "Feature"'
+CHUNK_SIZE = 1 << 23
+_NUMBER = rb'(-?[0-9][0-9.eE+-]*)'
+GEOMETRY_PATTERN = re.compile(rb'"geometry"\s*:\s*\{[^{}]*?"coordinates"\s*:\s*[\[\s]*' + _NUMBER + rb'\s*,\s*' + _NUMBER)
+
+def line_brace_balance(a, line_starts):
+    '''
+    `{` minus `}` outside of string literals for each line of a uint8 buffer.
+    Like the text scanner, quote state restarts on every line and a quote preceded by an
+    odd run of backslashes does not open or close a string.
+    Works on the positions of quotes and braces only, which are sparse in feature text.
+    '''
+    quotes = np.flatnonzero(a == 34)
+    escaped = quotes[(quotes > 0) & (a[quotes - 1] == 92)]
+    if escaped.size:
+        # length of the backslash run in front of each candidate quote
+        run = np.ones(len(escaped), dtype=np.int64)
+        pending = np.arange(len(escaped))
+        while pending.size:
+            before = escaped[pending] - run[pending] - 1
+            more = (before >= 0) & (a[np.maximum(before, 0)] == 92)
+            pending = pending[more]
+            run[pending] += 1
+        quotes = np.setdiff1d(quotes, escaped[run % 2 == 1], assume_unique=True)
+    braces = np.flatnonzero((a == 123) | (a == 125))
+    lines = np.searchsorted(line_starts, braces, side='right') - 1
+    quotes_before = np.searchsorted(quotes, braces) - np.searchsorted(quotes, line_starts[lines])
+    outside = quotes_before % 2 == 0
+    signs = np.where(a[braces[outside]] == 123, 1, -1)
+    return np.bincount(lines[outside], weights=signs, minlength=len(line_starts)).astype(np.int64)
+
+def _first_balanced_line(balance, start, count):
+    '''
+    first line j >= start where count + sum(balance[start:j+1]) == 0, searching in growing windows
+    '''
+    window = 64
+    while start < len(balance):
+        running = count + np.cumsum(balance[start:start + window])
+        zero = np.flatnonzero(running == 0)
+        if zero.size:
+            return start + int(zero[0]), 0
+        count = int(running[-1])
+        start += window
+        window *= 4
+    return None, count
+
+def _window_end(mm, base, chunk_size):
+    '''
+    end of the last complete line within chunk_size bytes from base (or of the line crossing it)
+    '''
+    size = len(mm)
+    limit = base + chunk_size
+    if limit >= size:
+        return size
+    end = mm.rfind(b'\n', base, limit) + 1
+    if end <= base:
+        end = mm.find(b'\n', limit) + 1
+    return end if end > base else size
+
+def find_token(a, token):
+    '''
+    start positions of every occurrence of token in a uint8 buffer
+    '''
+    token = np.frombuffer(token, dtype=np.uint8)
+    candidates = np.flatnonzero(a[:len(a) - len(token) + 1] == token[0])
+    for i in range(1, len(token)):
+        candidates = candidates[a[candidates + i] == token[i]]
+    return candidates
+
+def scan_window(mm, base, end, token):
+    '''
+    line bounds, brace balance and feature token lines of mm[base:end]
+    '''
+    a = np.frombuffer(mm, dtype=np.uint8, count=end - base, offset=base)
+    line_ends = np.flatnonzero(a == 10) + 1
+    if len(line_ends) == 0 or line_ends[-1] != len(a):
+        line_ends = np.append(line_ends, len(a))
+    line_starts = np.concatenate(([0], line_ends[:-1]))
+    balance = line_brace_balance(a, line_starts)
+    token_lines = np.unique(np.searchsorted(line_ends, find_token(a, token), side='right'))
+    return line_starts, line_ends, balance, token_lines
+
+def window_bounds(mm, chunk_size):
+    '''
+    [(start, end)] of the windows of about chunk_size bytes, cut at line ends, scanned one at a time
+    '''
+    bounds = []
+    base = 0
+    while base < len(mm):
+        end = _window_end(mm, base, chunk_size)
+        bounds.append((base, end))
+        base = end
+    return bounds
+
+def compact_scan(scan):
+    '''
+    a scan_window result reduced to its feature token lines and lines with unbalanced braces,
+    the only lines the feature walk looks at
+    '''
+    line_starts, line_ends, balance, token_lines = scan
+    keep = balance != 0
+    keep[token_lines] = True
+    kept = np.cumsum(keep) - 1
+    return line_starts[keep], line_ends[keep], balance[keep], kept[token_lines]
+
+class FeatureWalk:
+    '''
+    Walks the scanned windows of a file in order, carrying a feature that spans windows over
+    from one window to the next.
+    '''
+    def __init__(self):
+        self.feature_start = None
+        self.brace_count = 0
+
+    def window(self, base, scan):
+        '''
+        (starts, lengths) int64 arrays of the features completed in the window at base,
+        None when the whole window lies inside a feature running on from an earlier one
+        '''
+        line_starts, line_ends, balance, token_lines = scan
+        starts, stops = [], []
+        line = 0
+        if self.feature_start is not None:
+            # a feature running on from the previous window
+            line, self.brace_count = _first_balanced_line(balance, 0, self.brace_count)
+            if line is None:
+                return None
+            starts.append([self.feature_start - base])
+            stops.append(line_ends[line:line + 1])
+            self.feature_start, line = None, line + 1
+        multi_line = token_lines[balance[token_lines] != 0]
+        while True:
+            # features held on a single line, up to the next one spanning several lines
+            m = int(np.searchsorted(multi_line, line))
+            token_line = int(multi_line[m]) if m < len(multi_line) else len(balance)
+            single = token_lines[np.searchsorted(token_lines, line):np.searchsorted(token_lines, token_line)]
+            starts.append(line_starts[single])
+            stops.append(line_ends[single])
+            if m == len(multi_line):
+                break
+            last, count = _first_balanced_line(balance, token_line, 0)
+            if last is None:
+                self.feature_start, self.brace_count = base + int(line_starts[token_line]), count
+                break
+            starts.append(line_starts[token_line:token_line + 1])
+            stops.append(line_ends[last:last + 1])
+            line = last + 1
+        starts = np.concatenate(starts).astype(np.int64) + base
+        return starts, np.concatenate(stops) + base - starts
+
+def _feature_ranges(mm, chunk_size, token):
+    '''
+    yields (window end, starts, lengths) with int64 arrays of the features completed in each window
+    '''
+    walk = FeatureWalk()
+    for base, end in window_bounds(mm, chunk_size):
+        ranges = walk.window(base, scan_window(mm, base, end, token))
+        if ranges is not None:
+            yield (end,) + ranges
+
+def open_mmap(geojson_file_path):
+    '''
+    read-only memory map of a file, None when it is empty
+    '''
+    with open(geojson_file_path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def geojson_feature_offsets(geojson_file_path, chunk_size=CHUNK_SIZE, token=FEATURE_TOKEN):
+    '''
+    (offset, length) in bytes of every feature of a GeoJSON file, including its trailing ",\\n".
+    A feature starts at the line holding `token` and ends at the line where its braces balance.
+    '''
+    offsets_and_lengths = []
+    mm = open_mmap(geojson_file_path)
+    if mm is None:
+        return offsets_and_lengths
+    with mm:
+        for _, starts, lengths in _feature_ranges(mm, chunk_size, token):
+            offsets_and_lengths.extend(zip(starts.tolist(), lengths.tolist()))
+    return offsets_and_lengths
+
+def first_feature_offset(geojson_file_path, chunk_size=CHUNK_SIZE, token=FEATURE_TOKEN):
+    '''
+    byte offset of the first feature of a GeoJSON file (the length of its header), None without features
+    '''
+    mm = open_mmap(geojson_file_path)
+    if mm is None:
+        return None
+    with mm:
+        for _, starts, _ in _feature_ranges(mm, chunk_size, token):
+            if len(starts):
+                return int(starts[0])
+    return None
+
+def _first_position(coordinates):
+    '''
+    first [x, y] of a GeoJSON coordinates array of any nesting depth
+    '''
+    while coordinates and isinstance(coordinates[0], list):
+        coordinates = coordinates[0]
+    return coordinates[:2] if len(coordinates) >= 2 else None
+
+def _decode_point(feature):
+    '''
+    representative (x, y) of one feature's bytes, (nan, nan) without geometry
+    '''
+    try:
+        geometry = json.loads(feature.rstrip(b', \t\r\n')).get('geometry')
+    except ValueError:
+        raise ValueError("feature bytes are not a JSON object, expected one feature per line as written by GDAL")
+    while geometry and geometry.get('type') == 'GeometryCollection':
+        geometry = geometry['geometries'][0] if geometry['geometries'] else None
+    position = _first_position(geometry.get('coordinates')) if geometry else None
+    return tuple(position) if position else (np.nan, np.nan)
+
+def feature_points(mm, starts, lengths):
+    '''
+    x and y of the first position of each feature's geometry, read from its bytes.
+    Simple geometries are matched with a regular expression over the whole range,
+    anything else (geometry collections, unusual layouts) falls back to json.
+    '''
+    x = np.full(len(starts), np.nan)
+    y = np.full(len(starts), np.nan)
+    if len(starts) == 0:
+        return x, y
+    matches = [(m.start(), m.group(1), m.group(2))
+               for m in GEOMETRY_PATTERN.finditer(mm, int(starts[0]), int(starts[-1] + lengths[-1]))]
+    found = np.zeros(len(starts), dtype=bool)
+    if matches:
+        positions, xs, ys = zip(*matches)
+        feature = np.searchsorted(starts, positions, side='right') - 1
+        feature, first = np.unique(feature, return_index=True)
+        inside = np.asarray(positions)[first] < starts[feature] + lengths[feature]
+        feature, first = feature[inside], first[inside]
+        x[feature] = np.array(xs, dtype='S')[first].astype(np.float64)
+        y[feature] = np.array(ys, dtype='S')[first].astype(np.float64)
+        found[feature] = True
+    for i in np.flatnonzero(~found).tolist():
+        x[i], y[i] = _decode_point(mm[int(starts[i]):int(starts[i] + lengths[i])])
+    return x, y
+
+def iter_geojson_points(geojson_file_path, chunk_size=CHUNK_SIZE, token=FEATURE_TOKEN):
+    '''
+    Single pass over a GeoJSON file yielding, per window of about chunk_size bytes,
+    (offsets, lengths, x, y) arrays of the features completed in it. x and y are the first
+    position of each geometry (the point itself for points), NaN for null geometries.
+    Only one window is held in memory at a time.
+    '''
+    mm = open_mmap(geojson_file_path)
+    if mm is None:
+        return
+    with mm:
+        for _, starts, lengths in _feature_ranges(mm, chunk_size, token):
+            x, y = feature_points(mm, starts, lengths)
+            yield starts, lengths, x, y
@@ -1,10 +1,14 @@
 import math
+import numpy as np
+
+# Radius of the Earth in meters
+EARTH_RADIUS = 6371000
+
 def eculidean_distance(x1,y1,x2,y2):
     return math.sqrt((x2-x1)**2+(y2-y1)**2)
 
 def haversine_distance(lon1,lat1,lon2,lat2):
-    # Radius of the Earth in meters
-    R = 6371000
+    R = EARTH_RADIUS
     
     # Convert latitude and longitude from degrees to radians
     lat1_rad = math.radians(lat1)
@@ -37,9 +41,94 @@ def closest_point_in_rect_to_outside_point(xmin,xmax,ymin,ymax,x,y):
     return (x,y)
 
 def rect_outside_a_circle(xmin,xmax,ymin,ymax,cx,cy,r,distance_type='eculidean'):
-    distance_func = eculidean_distance if distance_type=='eculidean' else haversine_distance
-    closest = closest_point_in_rect_to_outside_point(xmin,xmax,ymin,ymax,cx,cy)
-    return distance_func(closest[0],closest[1],cx,cy) > r
+    if distance_type == 'eculidean':
+        closest = closest_point_in_rect_to_outside_point(xmin,xmax,ymin,ymax,cx,cy)
+        return eculidean_distance(closest[0],closest[1],cx,cy) > r
+    # longitudes wrap: the centre may be closest to the rectangle one turn away
+    distance = min(haversine_distance(*closest_point_in_rect_to_outside_point(xmin,xmax,ymin,ymax,cx+shift,cy),cx,cy)
+                   for shift in (-360,0,360))
+    return distance > r
 
 def rect_overlap(xmin1,xmax1,ymin1,ymax1,xmin2,xmax2,ymin2,ymax2):
-    return not (xmax1 < xmin2 or xmax2 < xmin1 or ymax1 < ymin2 or ymax2 < ymin1)
\ No newline at end of file
+    return not (xmax1 < xmin2 or xmax2 < xmin1 or ymax1 < ymin2 or ymax2 < ymin1)
+
+def haversine_distance_array(lon1,lat1,lon2,lat2):
+    """
+    vectorized haversine_distance, same formula and operation order
+    """
+    lat1_rad = np.radians(lat1)
+    lon1_rad = np.radians(lon1)
+    lat2_rad = np.radians(lat2)
+    lon2_rad = np.radians(lon2)
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+    a = np.sin(dlat / 2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+def rects_outside_a_circle(xmin,xmax,ymin,ymax,cx,cy,r,distance_type='eculidean'):
+    """
+    vectorized rect_outside_a_circle over arrays of rectangles.
+    Rectangles whose distance is within float noise of r are re-tested with the scalar
+    function so the result always agrees with rect_outside_a_circle.
+    """
+    y = np.minimum(np.maximum(cy,ymin),ymax)
+    if distance_type == 'eculidean':
+        x = np.minimum(np.maximum(cx,xmin),xmax)
+        distance = np.sqrt((cx-x)**2+(cy-y)**2)
+    else:
+        # longitudes wrap: the centre may be closest to the rectangle one turn away
+        distance = np.min([haversine_distance_array(np.minimum(np.maximum(cx+shift,xmin),xmax),y,cx,cy)
+                           for shift in (-360,0,360)],axis=0)
+    outside = distance > r
+    for i in np.flatnonzero(np.abs(distance-r) <= 1e-9*max(abs(r),1.0)):
+        outside[i] = rect_outside_a_circle(xmin[i],xmax[i],ymin[i],ymax[i],cx,cy,r,distance_type)
+    return outside
+
+def rects_overlap(xmin1,xmax1,ymin1,ymax1,xmin2,xmax2,ymin2,ymax2):
+    """
+    vectorized rect_overlap, the first rectangle may be arrays
+    """
+    return ~((xmax1 < xmin2) | (xmax2 < xmin1) | (ymax1 < ymin2) | (ymax2 < ymin1))
+
+def _rect_corners(xmin,xmax,ymin,ymax):
+    return [(xmin,ymin),(xmin,ymax),(xmax,ymin),(xmax,ymax)]
+
+def rects_inside_a_circle(xmin,xmax,ymin,ymax,cx,cy,r,distance_type='eculidean'):
+    """
+    vectorized test whether every point of each rectangle is within r of the centre.
+    The farthest point of a lon/lat rectangle is one of its corners, except for haversine
+    rectangles that contain the meridian opposite the centre, which are never reported inside.
+    """
+    inside = np.ones(np.shape(xmin),dtype=bool)
+    for x,y in _rect_corners(xmin,xmax,ymin,ymax):
+        if distance_type == 'eculidean':
+            inside &= np.sqrt((cx-x)**2+(cy-y)**2) <= r
+        else:
+            inside &= haversine_distance_array(x,y,cx,cy) <= r
+    if distance_type != 'eculidean':
+        opposite = cx-180 if cx > 0 else cx+180
+        inside &= ~((xmin <= opposite) & (opposite <= xmax))
+        if abs(opposite) == 180:
+            inside &= ~((xmin <= -opposite) & (-opposite <= xmax))
+    return inside
+
+def rects_disjoint_from_a_circle(xmin,xmax,ymin,ymax,cx,cy,r,distance_type='eculidean'):
+    """
+    vectorized test that is True only when no point of a rectangle is within r of the centre.
+    Exact for eculidean distance; for haversine distance it uses the triangle inequality
+    through the rectangle centre, so it never drops a rectangle that reaches the circle.
+    """
+    if distance_type == 'eculidean':
+        return rects_outside_a_circle(xmin,xmax,ymin,ymax,cx,cy,r,distance_type)
+    mx,my = (xmin+xmax)/2,(ymin+ymax)/2
+    half_diagonal = np.zeros(np.shape(xmin))
+    for x,y in _rect_corners(xmin,xmax,ymin,ymax):
+        half_diagonal = np.maximum(half_diagonal,haversine_distance_array(x,y,mx,my))
+    return haversine_distance_array(mx,my,cx,cy)-half_diagonal > r*(1+1e-9)+1e-6
+
+def rects_inside_a_rect(xmin1,xmax1,ymin1,ymax1,xmin2,xmax2,ymin2,ymax2):
+    """
+    vectorized test whether each first rectangle lies within the second one
+    """
+    return (xmin1 >= xmin2) & (xmax1 <= xmax2) & (ymin1 >= ymin2) & (ymax1 <= ymax2)
@@ -0,0 +1,188 @@
+'''
+Kubo RPC client shared by the filesystem helpers and index classes: one keep-alive
+connection pool per endpoint, timeouts, retries with exponential backoff on transient
+failures, bounded-concurrency batch calls and per-command byte/latency counters.
+`cat` reads can go through a RangeCache, as content under a CID never changes.
+'''
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from geohashtree.config import kubo_rpc_url, cache_memory_bytes, cache_dir, cache_disk_bytes
+from geohashtree.range_cache import RangeCache
+
+RETRY_STATUS = {429, 502, 503, 504}
+
+class KuboError(Exception):
+    '''
+    error reported by the Kubo RPC API
+    '''
+
+class KuboClient:
+    def __init__(self, rpc_url=None, max_workers=8, timeout=(5, 120), retries=3, backoff=0.2, cache=None):
+        '''
+        rpc_url: RPC API root like http://127.0.0.1:5001/api/v0/ (default from config / KUBO_RPC_URL)
+        max_workers: concurrent requests of the batch methods, also the connection pool size
+        timeout: (connect, read) seconds per request
+        retries: extra attempts after connection errors, timeouts and 429/502/503/504 responses
+        cache: RangeCache serving repeated `cat` reads, None to always ask the daemon
+        '''
+        self.url = (rpc_url or kubo_rpc_url).rstrip('/') + '/'
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {}
+
+    def stats(self):
+        '''
+        {command: {calls, retries, errors, bytes_in, bytes_out, seconds, mean_ms, max_ms}}
+        '''
+        with self._lock:
+            stats = {command: dict(s) for command, s in self._stats.items()}
+        for s in stats.values():
+            s['mean_ms'] = 1000 * s['seconds'] / s['calls'] if s['calls'] else 0.0
+            s['max_ms'] = 1000 * s.pop('max_seconds')
+        return stats
+
+    def _record(self, command, seconds, bytes_in, bytes_out, retries, error):
+        with self._lock:
+            s = self._stats.setdefault(command, {'calls': 0, 'retries': 0, 'errors': 0, 'bytes_in': 0,
+                                                 'bytes_out': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            s['calls'] += 1
+            s['retries'] += retries
+            s['errors'] += error
+            s['bytes_in'] += bytes_in
+            s['bytes_out'] += bytes_out
+            s['seconds'] += seconds
+            s['max_seconds'] = max(s['max_seconds'], seconds)
+
+    def post(self, command, params=None, file_path=None):
+        '''
+        POST an RPC command and return the response. Transient failures are retried;
+        Kubo command errors (HTTP 500 with a JSON message) are returned to the caller.
+        '''
+        t0 = time.time()
+        bytes_out = os.path.getsize(file_path) if file_path else 0
+        for attempt in range(self.retries + 1):
+            try:
+                if file_path:
+                    with open(file_path, 'rb') as f:
+                        response = self.session.post(self.url + command, params=params,
+                                                     files={os.path.basename(file_path): f}, timeout=self.timeout)
+                else:
+                    response = self.session.post(self.url + command, params=params, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    self._record(command, time.time() - t0, 0, bytes_out, attempt, True)
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+        self._record(command, time.time() - t0, len(response.content), bytes_out, attempt, response.status_code != 200)
+        return response
+
+    def _check(self, response):
+        if response.status_code != 200:
+            try:
+                message = response.json().get('Message', response.text)
+            except ValueError:
+                message = response.text
+            raise KuboError(f"{response.status_code}: {message}")
+        return response
+
+    def cat(self, cid, offset=None, length=None):
+        '''
+        bytes of a file, or of [offset, offset+length) of it
+        '''
+        if self.cache is not None and self.cache.cacheable(cid):
+            return self.cache.read(cid, offset, length, lambda offset, length: self._cat(cid, offset, length))
+        return self._cat(cid, offset, length)
+
+    def _cat(self, cid, offset=None, length=None):
+        params = {'arg': cid}
+        if offset is not None:
+            params['offset'] = offset
+        if length is not None:
+            params['length'] = length
+        return self._check(self.post('cat', params)).content
+
+    def ls(self, path):
+        '''
+        raw `ls` JSON of a path; errors come back as {"Message", "Code", "Type": "error"}
+        '''
+        return self.post('ls', {'arg': path}).json()
+
+    def add(self, file_path, only_hash=False, cid_version=1, **options):
+        '''
+        add a file, returns {"Name", "Hash", "Size"}
+        '''
+        params = {'cid-version': cid_version, 'only-hash': str(only_hash).lower(), **options}
+        return self._check(self.post('add', params, file_path)).json()
+
+    def files(self, command, *args, **options):
+        '''
+        MFS `files/<command>` (cp, rm, mkdir, stat, ...) on positional args, returns its JSON ({} if none)
+        '''
+        response = self._check(self.post(f'files/{command}', {'arg': list(args), **options}))
+        return response.json() if response.content.strip() else {}
+
+    def _map(self, func, items, max_workers=None):
+        items = list(items)
+        max_workers = min(max_workers or self.max_workers, len(items))
+        if max_workers <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(func, items))
+
+    def cat_ranges(self, cid, ranges, max_workers=None):
+        '''
+        bytes of each (offset, length) range of a file, in the order given, fetched concurrently
+        by at most max_workers threads (the client's max_workers by default)
+        '''
+        return self._map(lambda r: self.cat(cid, r[0], r[1]), ranges, max_workers)
+
+    def ls_many(self, paths, max_workers=None):
+        '''
+        `ls` JSON of each path, fetched concurrently
+        '''
+        return self._map(self.ls, paths, max_workers)
+
+    def add_many(self, file_paths, only_hash=False, cid_version=1, max_workers=None, **options):
+        '''
+        add files concurrently, returns their {"Name", "Hash", "Size"} in order
+        '''
+        return self._map(lambda path: self.add(path, only_hash, cid_version, **options), file_paths, max_workers)
+
+_default_client = None
+
+def get_client():
+    '''
+    the shared client used when none is passed explicitly
+    '''
+    global _default_client
+    if _default_client is None:
+        cache = None
+        if cache_memory_bytes or cache_dir:
+            cache = RangeCache(cache_memory_bytes, cache_dir, cache_disk_bytes)
+        _default_client = KuboClient(cache=cache)
+    return _default_client
+
+def set_client(client):
+    '''
+    replace the shared client, e.g. to point every helper at another endpoint
+    '''
+    global _default_client
+    _default_client = client
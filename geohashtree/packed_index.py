@@ -0,0 +1,144 @@
+'''
+Single-file binary index for geohashtree.
+
+Layout (little endian, sections 8-byte aligned):
+    header      magic, version, key width, block size, entry count and section offsets
+    file table  JSON list of source files: {"cid", "format", "head": [offset, length]}
+    fences      every block_size-th key, used to find key blocks without reading all keys
+    keys        sorted geohash keys, fixed width, NUL padded
+    file ids    uint32 index into the file table per entry
+    values      int64 pairs per entry: (offset, length) or (row_group, row)
+
+A prefix query is a binary search over the keys, so the file can be memory-mapped
+locally or added to IPFS as a single object and range-read with `cat`.
+'''
+import json
+import struct
+import numpy as np
+
+MAGIC = b'GHIX'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIQQQQQQQ')
+HEADER_SIZE = 72
+BLOCK_SIZE = 1024
+
+def _align(n, alignment=8):
+    return (n + alignment - 1) // alignment * alignment
+
+def _prefix_successor(prefix):
+    '''
+    smallest key greater than every key starting with prefix
+    '''
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+def write_packed_index(path, keys, file_ids, values, files, block_size=BLOCK_SIZE):
+    '''
+    Write a packed index.
+    keys: geohash strings, file_ids: index into `files` per key, values: (n,2) integer pairs,
+    files: list of {"cid", "format", "head"} dicts.
+    '''
+    keys = np.asarray(keys, dtype='S')
+    key_width = max(keys.dtype.itemsize, 1)
+    keys = keys.astype(f'S{key_width}')
+    file_ids = np.asarray(file_ids, dtype=np.uint32)
+    values = np.asarray(values, dtype=np.int64).reshape(-1, 2)
+    order = np.lexsort((values[:, 1], values[:, 0], file_ids, keys))
+    keys, file_ids, values = keys[order], file_ids[order], values[order]
+    fences = keys[::block_size]
+
+    table = json.dumps(files).encode()
+    table_offset = HEADER_SIZE
+    fences_offset = _align(table_offset + len(table))
+    keys_offset = _align(fences_offset + fences.nbytes)
+    ids_offset = _align(keys_offset + keys.nbytes)
+    values_offset = _align(ids_offset + file_ids.nbytes)
+    header = HEADER.pack(MAGIC, VERSION, key_width, block_size, len(keys),
+                         table_offset, len(table), fences_offset, keys_offset, ids_offset, values_offset)
+    with open(path, 'wb') as f:
+        for offset, data in [(0, header), (table_offset, table), (fences_offset, fences.tobytes()),
+                             (keys_offset, keys.tobytes()), (ids_offset, file_ids.tobytes()),
+                             (values_offset, values.tobytes())]:
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(data)
+
+class PackedIndex:
+    '''
+    Reader for a packed index. `read(offset, length)` returns the bytes of the index file
+    in that range, from a memory map or from IPFS range requests.
+    '''
+    def __init__(self, read):
+        self.read = read
+        (magic, version, self.key_width, self.block_size, self.n_entries, table_offset, table_length,
+         fences_offset, self.keys_offset, self.ids_offset, self.values_offset) = HEADER.unpack_from(bytes(read(0, HEADER_SIZE)))
+        if magic != MAGIC:
+            raise ValueError("not a packed geohash index")
+        if version > VERSION:
+            raise ValueError(f"unsupported packed index version {version}")
+        # the file table and fences are contiguous, fetch them with one read
+        meta = read(table_offset, self.keys_offset - table_offset)
+        self.files = json.loads(bytes(meta[:table_length]))
+        n_fences = -(-self.n_entries // self.block_size)
+        start = fences_offset - table_offset
+        self.fences = np.frombuffer(meta, dtype=f'S{self.key_width}', count=n_fences, offset=start)
+        self._blocks = {}
+
+    @classmethod
+    def open(cls, path, fs=None):
+        '''
+        open an index file on the local disk (memory-mapped) or through a FileSystem
+        '''
+        if fs is None or fs.is_local:
+            mm = np.memmap(path, dtype=np.uint8, mode='r')
+            return cls(lambda offset, length: mm[offset:offset + length])
+        return cls(lambda offset, length: fs.read_bytes(path, offset, length))
+
+    def _key_block(self, block):
+        if block not in self._blocks:
+            start = block * self.block_size
+            count = min(self.block_size, self.n_entries - start)
+            data = self.read(self.keys_offset + start * self.key_width, count * self.key_width)
+            self._blocks[block] = np.frombuffer(data, dtype=f'S{self.key_width}', count=count)
+        return self._blocks[block]
+
+    def _lower_bound(self, key):
+        '''
+        position of the first key >= key
+        '''
+        i = int(np.searchsorted(self.fences, key, side='left'))
+        if i == 0:
+            return 0
+        block = self._key_block(i - 1)
+        return (i - 1) * self.block_size + int(np.searchsorted(block, key, side='left'))
+
+    def prefix_range(self, prefix):
+        '''
+        [start, stop) entry range of the keys starting with prefix
+        '''
+        prefix = prefix.encode() if isinstance(prefix, str) else prefix
+        if not prefix:
+            return 0, self.n_entries
+        if len(prefix) > self.key_width:
+            return 0, 0
+        return self._lower_bound(prefix), self._lower_bound(_prefix_successor(prefix))
+
+    def entries(self, start, stop):
+        '''
+        file ids and value pairs of the entries in [start, stop)
+        '''
+        count = stop - start
+        if count <= 0:
+            return np.empty(0, dtype=np.uint32), np.empty((0, 2), dtype=np.int64)
+        file_ids = np.frombuffer(self.read(self.ids_offset + 4 * start, 4 * count), dtype=np.uint32)
+        values = np.frombuffer(self.read(self.values_offset + 16 * start, 16 * count), dtype=np.int64)
+        return file_ids, values.reshape(-1, 2)
+
+    def query_single(self, geohash):
+        '''
+        {cid: [head, value, ...]} for one geohash prefix, values as tuples
+        '''
+        file_ids, values = self.entries(*self.prefix_range(geohash))
+        result = {}
+        for file_id in np.unique(file_ids):
+            f = self.files[file_id]
+            result[f['cid']] = [tuple(f['head'])] + list(map(tuple, values[file_ids == file_id].tolist()))
+        return result
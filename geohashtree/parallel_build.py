@@ -0,0 +1,275 @@
+'''
+Process-pool index building. The input is split by row group (parquet), by byte window
+(GeoJSON) or, for datasets, by file; workers decode positions, encode cells and return (keys, values) runs sorted by key,
+which are inserted into one CompactTrie in input order. CompactTrie sorts stably, so the merged
+trie holds exactly what the serial build inserts, in the same order. Leaves are then exported
+by workers in key ranges, to the same paths and with the same content as export_trie.
+
+processes follows multiprocessing.Pool: None for every core.
+'''
+import os
+from multiprocessing import Pool
+import numpy as np
+import pyarrow.parquet as pq
+from .geohash_func import encode_cells
+from .geojson_stream import open_mmap, window_bounds, scan_window, compact_scan, FeatureWalk, \
+    feature_points, iter_geojson_points, first_feature_offset, FEATURE_TOKEN, CHUNK_SIZE
+from .parquet_stream import point_columns, table_points, footer_offset_and_length
+from .trie import CompactTrie
+from .unixfs import file_cid
+from .binary_leaf import encode_leaf, LEAF_SUFFIX
+from .util import compose_path, dataset_leaf_lines
+
+TASKS_PER_PROCESS = 4
+MIN_WINDOW = 1 << 20
+
+def sorted_run(keys, values):
+    '''
+    keys and values in stable key order
+    '''
+    order = np.argsort(keys, kind='stable')
+    return keys[order], values[order]
+
+def _task_count(processes, items):
+    return max(1, min(items, (processes or os.cpu_count()) * TASKS_PER_PROCESS))
+
+def _parquet_task(task):
+    parquet_path, row_groups, grid, precision = task
+    parquet_file = pq.ParquetFile(parquet_path)
+    kind, columns = point_columns(parquet_file)
+    keys, values = [], []
+    for row_group in row_groups:
+        x, y = table_points(parquet_file.read_row_group(row_group, columns=columns), kind, columns)
+        rows = np.flatnonzero(~np.isnan(x))
+        keys.append(encode_cells(y[rows], x[rows], grid, precision))
+        values.append(np.stack([np.full(len(rows), row_group), rows], axis=1))
+    return sorted_run(np.concatenate(keys), np.concatenate(values))
+
+def parquet_runs(parquet_path, grid, precision, processes=None):
+    '''
+    yields sorted (keys, (row_group, row) values) runs of consecutive row groups of a parquet file,
+    in file order
+    '''
+    num_row_groups = pq.ParquetFile(parquet_path).metadata.num_row_groups
+    if num_row_groups == 0:
+        return
+    tasks = np.array_split(np.arange(num_row_groups), _task_count(processes, num_row_groups))
+    with Pool(processes) as pool:
+        yield from pool.imap(_parquet_task, [(parquet_path, t.tolist(), grid, precision) for t in tasks])
+
+def _scan_task(task):
+    geojson_path, base, end, token = task
+    with open_mmap(geojson_path) as mm:
+        return compact_scan(scan_window(mm, base, end, token))
+
+def _points_task(task):
+    geojson_path, starts, lengths, grid, precision = task
+    with open_mmap(geojson_path) as mm:
+        x, y = feature_points(mm, starts, lengths)
+    located = ~np.isnan(x)
+    return sorted_run(encode_cells(y[located], x[located], grid, precision),
+                      np.stack([starts[located], lengths[located]], axis=1))
+
+def geojson_runs(geojson_path, grid, precision, processes=None, chunk_size=CHUNK_SIZE, token=FEATURE_TOKEN):
+    '''
+    yields sorted (keys, (offset, length) values) runs of consecutive features of a GeoJSON file,
+    in file order. Workers scan byte windows; the features are delimited here, walking the
+    windows in order, and their positions decoded and encoded by workers again.
+    '''
+    mm = open_mmap(geojson_path)
+    if mm is None:
+        return
+    with mm:
+        window = max(MIN_WINDOW, min(chunk_size, len(mm) // _task_count(processes, len(mm))))
+        bounds = window_bounds(mm, window)
+    with Pool(processes) as pool:
+        scans = pool.imap(_scan_task, [(geojson_path, base, end, token) for base, end in bounds])
+        walk = FeatureWalk()
+        runs = []
+        for (base, _), scan in zip(bounds, scans):
+            ranges = walk.window(base, scan)
+            if ranges is not None and len(ranges[0]):
+                runs.append(pool.apply_async(_points_task, ((geojson_path,) + ranges + (grid, precision),)))
+        for run in runs:
+            yield run.get()
+
+FILE_FORMATS = {'.parquet': 'parquet', '.geojson': 'geojson', '.json': 'geojson'}
+
+def file_format(path):
+    '''
+    'parquet' or 'geojson' from the file extension
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FILE_FORMATS:
+        raise ValueError(f"cannot index {path}: expected one of {sorted(FILE_FORMATS)}")
+    return FILE_FORMATS[extension]
+
+def dataset_paths(dataset):
+    '''
+    sorted paths of the parquet / GeoJSON files of a directory (searched recursively), or the given list
+    '''
+    if not isinstance(dataset, (str, os.PathLike)):
+        return list(dataset)
+    paths = [os.path.join(root, name) for root, _, names in os.walk(dataset) for name in names
+             if os.path.splitext(name)[1].lower() in FILE_FORMATS]
+    return sorted(paths)
+
+def _ingest_task(task):
+    path, grid, precision = task
+    fmt = file_format(path)
+    keys, values = [np.empty(0, dtype=str)], [np.empty((0, 2), dtype=np.int64)]
+    if fmt == 'parquet':
+        head = footer_offset_and_length(path)
+        num_row_groups = pq.ParquetFile(path).metadata.num_row_groups
+        if num_row_groups:
+            run = _parquet_task((path, list(range(num_row_groups)), grid, precision))
+            keys.append(run[0])
+            values.append(run[1])
+    else:
+        first = first_feature_offset(path)
+        head = (0, first) if first is not None else None
+        for offsets, lengths, x, y in iter_geojson_points(path):
+            located = ~np.isnan(x)
+            keys.append(encode_cells(y[located], x[located], grid, precision))
+            values.append(np.stack([offsets[located], lengths[located]], axis=1))
+    entry = {'cid': file_cid(path), 'format': fmt, 'head': list(head) if head is not None else None}
+    return (entry,) + sorted_run(np.concatenate(keys), np.concatenate(values))
+
+def ingest_files(paths, grid, precision, processes=1):
+    '''
+    yields ({"cid", "format", "head"} file table entry, keys, values) of each file in order, the
+    (keys, values) run sorted by key, files indexed one per worker unless processes is 1
+    '''
+    tasks = [(path, grid, precision) for path in paths]
+    if processes == 1:
+        yield from map(_ingest_task, tasks)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(_ingest_task, tasks)
+
+def trie_from_runs(runs):
+    '''
+    CompactTrie of sorted (keys, values) runs inserted in order
+    '''
+    trie = CompactTrie()
+    for keys, values in runs:
+        trie.insert_many(keys, values)
+    return trie
+
+def _leaf_chunks(trie, processes):
+    '''
+    (keys, values) slices of a trie cut between keys, about TASKS_PER_PROCESS per process
+    '''
+    keys, values = trie.arrays()
+    if len(keys) == 0:
+        return []
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    cuts = [int(c[0]) for c in np.array_split(starts, _task_count(processes, len(starts)))] + [len(keys)]
+    return [(keys[a:b], values[a:b]) for a, b in zip(cuts[:-1], cuts[1:])]
+
+def _index_dirs(trie, destination_path):
+    '''
+    create the folder of every node with children, as export_trie does
+    '''
+    keys = np.unique(trie.arrays()[0]).tolist()
+    if keys:
+        os.makedirs(destination_path, exist_ok=True)
+    for prefix in sorted({key[:i] for key in keys for i in range(1, len(key))}):
+        os.makedirs(compose_path(prefix, destination_path), exist_ok=True)
+
+def _text_leaves_task(task):
+    destination_path, header, keys, values, dataset = task
+    for key, items in trie_from_runs([(keys, values)]).items():
+        with open(compose_path(key[:-1], destination_path) + f"/{key}.txt", 'w') as f:
+            f.write(header)
+            for line in dataset_leaf_lines(items) if dataset else items:
+                f.write(f"{line}\n")
+
+def export_text_leaves(trie, destination_path, header="", processes=None, dataset=False):
+    '''
+    export_trie of the tree index formats with txt leaves: header then one value per line
+    (dataset leaves of (file_id, a, b) values when dataset)
+    '''
+    _index_dirs(trie, destination_path)
+    chunks = _leaf_chunks(trie, processes)
+    with Pool(processes) as pool:
+        pool.map(_text_leaves_task, [(destination_path, header, keys, values, dataset) for keys, values in chunks])
+
+def _binary_leaves_task(task):
+    destination_path, keys, values = task
+    bounds = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(keys)]))
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        key = keys[a]
+        if values.shape[1] == 3:
+            file_ids, pairs = values[a:b, 0], values[a:b, 1:]
+        else:
+            file_ids, pairs = np.zeros(b - a, dtype=np.int64), values[a:b]
+        with open(compose_path(key[:-1], destination_path) + f"/{key}{LEAF_SUFFIX}", 'wb') as f:
+            f.write(encode_leaf(file_ids, pairs))
+
+def export_binary_leaves(trie, destination_path, processes=None):
+    '''
+    export_trie of index_format='binary': one binary leaf per key, the (a, b) values of a
+    single-file index being entries of file 0; written in this process if processes is 1
+    '''
+    _index_dirs(trie, destination_path)
+    tasks = [(destination_path, keys, values) for keys, values in _leaf_chunks(trie, processes)]
+    if processes == 1:
+        list(map(_binary_leaves_task, tasks))
+        return
+    with Pool(processes) as pool:
+        pool.map(_binary_leaves_task, tasks)
+
+def _geojson_leaves_task(task):
+    destination_path, keys, features = task
+    bounds = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(keys)]))
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        key = keys[a]
+        features.iloc[a:b].to_file(compose_path(key[:-1], destination_path) + f"/{key}.geojson", driver="GeoJSON")
+
+def export_geojson_leaves(trie, features, destination_path, processes=None):
+    '''
+    export_trie of FullTreeFile: the features (rows of `features` by position) of each leaf as GeoJSON
+    '''
+    _index_dirs(trie, destination_path)
+    chunks = _leaf_chunks(trie, processes)
+    with Pool(processes) as pool:
+        pool.map(_geojson_leaves_task, [(destination_path, keys, features.iloc[values]) for keys, values in chunks])
+
+def _write_rows_task(task):
+    target_directory, features = task
+    paths = []
+    for i in range(len(features)):
+        path = os.path.join(target_directory, f"{features['osm_id'].iloc[i]}.geojson")
+        features.iloc[[i]].to_file(path, driver="GeoJSON")
+        paths.append(path)
+    return paths
+
+def write_feature_files(df, target_directory, processes=None):
+    '''
+    one GeoJSON file per row named by osm_id, written by a process pool; returns the paths in row order
+    '''
+    chunks = np.array_split(np.arange(len(df)), _task_count(processes, len(df)))
+    with Pool(processes) as pool:
+        paths = pool.map(_write_rows_task, [(target_directory, df.iloc[rows]) for rows in chunks if len(rows)])
+    return [path for chunk in paths for path in chunk]
+
+def _write_groups_task(task):
+    target_directory, groups = task
+    paths = []
+    for name, group in groups:
+        path = os.path.join(target_directory, f"{name}.parquet")
+        group.to_parquet(path)
+        paths.append(path)
+    return paths
+
+def write_group_files(df, target_directory, processes=None):
+    '''
+    one parquet file per geohash group, written by a process pool; returns (geohashes, paths) in group order
+    '''
+    groups = list(df.groupby('geohash'))
+    chunks = np.array_split(np.arange(len(groups)), _task_count(processes, len(groups)))
+    with Pool(processes) as pool:
+        paths = pool.map(_write_groups_task, [(target_directory, [groups[i] for i in rows])
+                                              for rows in chunks if len(rows)])
+    return [name for name, _ in groups], [path for chunk in paths for path in chunk]
@@ -0,0 +1,143 @@
+'''
+Rewrite a (Geo)Parquet file in geohash order with row groups cut at geohash prefix boundaries,
+so the rows of an index cell sit in a few consecutive row groups (one contiguous byte range)
+instead of being spread over the whole file.
+
+Rows are sorted out of core: sorted runs of run_rows rows go to a scratch directory and are
+merged block by block. The sort key is the 60-bit geohash code at precision 12, i.e. the
+Z-order of the lon/lat bits, so sorting by it is sorting by geohash at every precision.
+Rows without geometry go last.
+'''
+import os
+import tempfile
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .geohash_func import geohash_encode_array
+from .parquet_stream import point_columns, table_points
+
+KEY_COLUMN = '__geohash_key'
+KEY_PRECISION = 12
+NO_GEOMETRY_KEY = np.uint64(1 << 5 * KEY_PRECISION)
+
+def geohash_keys(x, y):
+    '''
+    sort keys of point arrays: geohash codes at precision 12, NO_GEOMETRY_KEY for NaN positions
+    '''
+    keys = np.full(len(x), NO_GEOMETRY_KEY, dtype=np.uint64)
+    located = ~np.isnan(x)
+    if located.any():
+        keys[located] = geohash_encode_array(y[located], x[located], KEY_PRECISION, return_int=True)[1]
+    return keys
+
+def key_prefix(keys, level):
+    '''
+    geohash codes of the level-character prefix of sort keys
+    '''
+    return keys >> np.uint64(5 * (KEY_PRECISION - level))
+
+def _cut(keys, target_rows, precision):
+    '''
+    number of rows for the next row group from sorted keys (more than target_rows of them):
+    the last prefix boundary of the coarsest level falling in the second half of the target,
+    else the last boundary of a precision cell, else target_rows when one cell outgrows it
+    '''
+    window = keys[:target_rows + 1]
+    for level in range(1, precision + 1):
+        prefix = key_prefix(window, level)
+        boundaries = np.flatnonzero(prefix[1:] != prefix[:-1]) + 1
+        if len(boundaries) and boundaries[-1] > target_rows // 2:
+            return int(boundaries[-1])
+    return int(boundaries[-1]) if len(boundaries) else target_rows
+
+def _write_runs(parquet_file, kind, columns, run_rows, directory):
+    '''
+    sorted runs of the source with their key column; returns (run paths, bytes per row)
+    '''
+    runs = []
+    rows = nbytes = 0
+    for batch in parquet_file.iter_batches(batch_size=run_rows):
+        table = pa.Table.from_batches([batch])
+        x, y = table_points(table.select(columns), kind, columns)
+        keys = geohash_keys(x, y)
+        order = np.argsort(keys, kind='stable')
+        rows += table.num_rows
+        nbytes += table.nbytes
+        table = table.append_column(KEY_COLUMN, pa.array(keys)).take(order)
+        path = os.path.join(directory, f"run_{len(runs)}.parquet")
+        pq.write_table(table, path, row_group_size=max(1, min(run_rows, 1 << 16)))
+        runs.append(path)
+    return runs, nbytes / max(rows, 1)
+
+def _merge_runs(runs, block_rows):
+    '''
+    yields the rows of the sorted runs as key-sorted tables, reading block_rows rows of each run at a time.
+    Every row up to the smallest last key of the buffered blocks can be emitted, which empties at
+    least one block per step.
+    '''
+    readers = [pq.ParquetFile(path).iter_batches(batch_size=block_rows) for path in runs]
+    def refill(i):
+        batch = next(readers[i], None)
+        return pa.Table.from_batches([batch]) if batch is not None else None
+    blocks = [refill(i) for i in range(len(readers))]
+    while any(block is not None for block in blocks):
+        live = [i for i, block in enumerate(blocks) if block is not None]
+        bound = min(blocks[i].column(KEY_COLUMN)[-1].as_py() for i in live)
+        parts = []
+        for i in live:
+            keys = blocks[i].column(KEY_COLUMN).to_numpy()
+            n = int(np.searchsorted(keys, bound, side='right'))
+            parts.append(blocks[i].slice(0, n))
+            blocks[i] = blocks[i].slice(n)
+            while blocks[i] is not None and blocks[i].num_rows == 0:
+                blocks[i] = refill(i)
+        merged = pa.concat_tables(parts)
+        # stable on run order, so equal keys keep their source order
+        yield merged.take(np.argsort(merged.column(KEY_COLUMN).to_numpy(), kind='stable'))
+
+def cluster_parquet(source, destination, precision=4, row_group_bytes=32 << 20, run_rows=1 << 20,
+                    scratch_dir=None, **writer_kwargs):
+    '''
+    Write source sorted by geohash to destination, cutting row groups of about row_group_bytes
+    (in-memory Arrow size) at geohash prefix boundaries: preferably a coarse prefix, always a
+    precision-character cell unless a single cell outgrows a row group, which then fills
+    consecutive row groups.
+    precision: geohash precision of the index built on the result
+    run_rows: rows sorted in memory at a time, which bounds memory use
+    scratch_dir: where sorted runs are kept while merging, the system temp dir if None
+    writer_kwargs: passed to pq.ParquetWriter (compression, ...)
+    Returns {'rows', 'row_groups', 'cells', 'row_groups_per_cell'} of the written file, cells
+    counting the distinct precision-character geohashes.
+    '''
+    parquet_file = pq.ParquetFile(source)
+    kind, columns = point_columns(parquet_file)
+    schema = parquet_file.schema_arrow
+    summary = {'rows': 0, 'row_groups': 0, 'cells': 0, 'row_groups_per_cell': 0.0}
+    cell_groups = 0
+    last_cell = None
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as directory:
+        runs, row_bytes = _write_runs(parquet_file, kind, columns, run_rows, directory)
+        target_rows = max(1, int(row_group_bytes // max(row_bytes, 1)))
+        block_rows = max(1, run_rows // max(len(runs), 1))
+        with pq.ParquetWriter(destination, schema, **writer_kwargs) as writer:
+            def write(table):
+                nonlocal cell_groups, last_cell
+                cells = np.unique(key_prefix(table.column(KEY_COLUMN).to_numpy(), precision))
+                cells = cells[cells < key_prefix(NO_GEOMETRY_KEY, precision)]
+                cell_groups += len(cells)
+                summary['cells'] += len(cells) - int(len(cells) > 0 and cells[0] == last_cell)
+                last_cell = cells[-1] if len(cells) else last_cell
+                writer.write_table(table.drop_columns([KEY_COLUMN]), row_group_size=table.num_rows)
+                summary['rows'] += table.num_rows
+                summary['row_groups'] += 1
+            pending = None
+            for table in _merge_runs(runs, block_rows):
+                pending = table if pending is None else pa.concat_tables([pending, table])
+                while pending.num_rows > target_rows:
+                    cut = _cut(pending.column(KEY_COLUMN).to_numpy(), target_rows, precision)
+                    write(pending.slice(0, cut))
+                    pending = pending.slice(cut)
+            if pending is not None and pending.num_rows:
+                write(pending)
+    summary['row_groups_per_cell'] = float(cell_groups / summary['cells']) if summary['cells'] else 0.0
+    return summary
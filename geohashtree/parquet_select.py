@@ -0,0 +1,241 @@
+'''
+Column projection and row-group pruning on a parsed Parquet footer (thrift FileMetaData), used to
+fetch only the column chunks a query needs and to skip row groups whose min/max statistics rule
+out every filter, plus the matching row filter applied to the decoded frame.
+
+filters are (column, op, value) tuples on top-level columns that must all hold, op one of
+==, !=, <, <=, >, >=, in, not in; bbox is (minx, miny, maxx, maxy).
+'''
+import json
+import struct
+import shapely
+from parquet_tools.gen_py.parquet.ttypes import Type, ConvertedType
+
+STAT_FORMATS = {Type.INT32: '<i', Type.INT64: '<q', Type.FLOAT: '<f', Type.DOUBLE: '<d'}
+UNSIGNED_STAT_FORMATS = {Type.INT32: '<I', Type.INT64: '<Q'}
+UNSIGNED_TYPES = {ConvertedType.UINT_8, ConvertedType.UINT_16, ConvertedType.UINT_32, ConvertedType.UINT_64}
+
+def key_value_metadata(fmd, key):
+    '''
+    JSON metadata of a footer under key ("geo", "pandas"), {} if absent
+    '''
+    for kv in fmd.key_value_metadata or []:
+        if kv.key == key:
+            return json.loads(kv.value)
+    return {}
+
+def geo_metadata(fmd):
+    return key_value_metadata(fmd, 'geo')
+
+def top_level_fields(fmd):
+    '''
+    [(name, schema elements of the field and its descendants)] in file order
+    '''
+    fields = []
+    i = 1
+    while i < len(fmd.schema):
+        start, pending = i, 1
+        while pending:
+            pending += (fmd.schema[i].num_children or 0) - 1
+            i += 1
+        fields.append((fmd.schema[start].name, fmd.schema[start:i]))
+    return fields
+
+def needed_columns(fmd, columns, filters=None, bbox=None):
+    '''
+    top-level columns to fetch for a projection: the requested ones, the geometry column and
+    whatever the filters read (plus stored pandas index columns). None keeps every column.
+    '''
+    if columns is None:
+        return None
+    names = [name for name, _ in top_level_fields(fmd)]
+    geo = geo_metadata(fmd)
+    wanted = set(columns) | {column for column, _, _ in filters or []}
+    if geo.get('primary_column') in names:
+        wanted.add(geo['primary_column'])
+    wanted |= {c for c in key_value_metadata(fmd, 'pandas').get('index_columns', []) if isinstance(c, str)}
+    if bbox is not None:
+        wanted |= {column[0] for column in bbox_columns(fmd).values()}
+    missing = wanted - set(names)
+    if missing:
+        raise ValueError(f"columns not in parquet file: {sorted(missing)}")
+    return [name for name in names if name in wanted]
+
+def project_schema(fmd, columns):
+    '''
+    (schema, column_orders) of the footer restricted to the top-level columns
+    '''
+    root = fmd.schema[0]
+    kept = [elements for name, elements in top_level_fields(fmd) if name in columns]
+    schema = [type(root)(**{**vars(root), 'num_children': len(kept)})] + [e for elements in kept for e in elements]
+    column_orders = fmd.column_orders
+    if column_orders:
+        leaves = [c.meta_data.path_in_schema[0] for c in fmd.row_groups[0].columns] if fmd.row_groups else []
+        column_orders = [order for order, leaf in zip(column_orders, leaves) if leaf in columns]
+    return schema, column_orders
+
+def column_chunk_range(column):
+    '''
+    (offset, length) of a column chunk in the file
+    '''
+    start = column.meta_data.dictionary_page_offset or column.meta_data.data_page_offset
+    return start, column.meta_data.total_compressed_size
+
+def _stat_order(element):
+    '''
+    how the statistics of a leaf column are ordered: 'string', 'unsigned', 'signed', or None
+    when they cannot be compared safely (decimals, INT96, other binary columns)
+    '''
+    logical = element.logicalType
+    if element.converted_type == ConvertedType.DECIMAL or (logical is not None and logical.DECIMAL is not None):
+        return None
+    if element.type == Type.BYTE_ARRAY:
+        is_string = element.converted_type == ConvertedType.UTF8 or (logical is not None and logical.STRING is not None)
+        return 'string' if is_string else None
+    if element.type in UNSIGNED_STAT_FORMATS and (element.converted_type in UNSIGNED_TYPES or
+            logical is not None and logical.INTEGER is not None and logical.INTEGER.isSigned is False):
+        return 'unsigned'
+    if element.type in STAT_FORMATS or element.type == Type.BOOLEAN:
+        return 'signed'
+    return None
+
+def leaf_types(fmd):
+    '''
+    {dotted column path: (physical type, statistics order)} of the leaf columns, see _stat_order
+    '''
+    types = {}
+    def walk(i, prefix):
+        element = fmd.schema[i]
+        path = prefix + [element.name]
+        i += 1
+        if element.num_children:
+            for _ in range(element.num_children):
+                i = walk(i, path)
+        else:
+            types['.'.join(path[1:])] = (element.type, _stat_order(element))
+        return i
+    walk(0, [])
+    return types
+
+def bbox_columns(fmd):
+    '''
+    {'xmin'|'ymin'|'xmax'|'ymax': column path} of the columns bounding each row: the GeoParquet
+    bbox covering, or x/y point columns. {} if there are none.
+    '''
+    geo = geo_metadata(fmd)
+    covering = geo.get('columns', {}).get(geo.get('primary_column'), {}).get('covering', {}).get('bbox')
+    if covering:
+        return {key: covering[key] for key in ('xmin', 'ymin', 'xmax', 'ymax')}
+    names = {name for name, _ in top_level_fields(fmd)}
+    if {'x', 'y'} <= names:
+        return {'xmin': ['x'], 'ymin': ['y'], 'xmax': ['x'], 'ymax': ['y']}
+    return {}
+
+def _decode_stat(value, physical_type, order):
+    if value is None or order is None:
+        return None
+    if order == 'unsigned':
+        return struct.unpack(UNSIGNED_STAT_FORMATS[physical_type], value)[0]
+    if order == 'string':
+        return value.decode('utf-8', 'replace')
+    if physical_type in STAT_FORMATS:
+        return struct.unpack(STAT_FORMATS[physical_type], value)[0]
+    if physical_type == Type.BOOLEAN:
+        return bool(value[0])
+    return None
+
+def column_min_max(column, types):
+    '''
+    decoded (min, max) statistics of a column chunk, (None, None) when unknown
+    '''
+    stats = column.meta_data.statistics
+    if stats is None:
+        return None, None
+    physical_type, order = types.get('.'.join(column.meta_data.path_in_schema), (None, None))
+    low, high = stats.min_value, stats.max_value
+    if low is None and high is None and order == 'signed' and physical_type in STAT_FORMATS:
+        # deprecated fields, only meaningful with signed numeric ordering
+        low, high = stats.min, stats.max
+    return _decode_stat(low, physical_type, order), _decode_stat(high, physical_type, order)
+
+def _may_match(low, high, op, value):
+    try:
+        if op == '==':
+            return low <= value <= high
+        if op == '!=':
+            return not (low == high == value)
+        if op == '<':
+            return low < value
+        if op == '<=':
+            return low <= value
+        if op == '>':
+            return high > value
+        if op == '>=':
+            return high >= value
+        if op == 'in':
+            return any(low <= v <= high for v in value)
+        if op == 'not in':
+            return not (low == high and low in value)
+    except TypeError:
+        return True
+    raise ValueError(f"unsupported filter operator {op!r}")
+
+def row_group_may_match(rg, types, filters=None, bbox=None, bbox_cols=None):
+    '''
+    False when the row group statistics show no row can pass the filters and bbox
+    '''
+    columns = {'.'.join(c.meta_data.path_in_schema): c for c in rg.columns}
+    for column, op, value in filters or []:
+        chunk = columns.get(column)
+        if chunk is None:
+            continue
+        low, high = column_min_max(chunk, types)
+        if op in ('!=', 'not in') and (chunk.meta_data.statistics is None or
+                                       chunk.meta_data.statistics.null_count != 0):
+            # filter_frame keeps null rows for these operators, a chunk with nulls always matches
+            continue
+        if low is not None and high is not None and not _may_match(low, high, op, value):
+            return False
+    if bbox is not None and bbox_cols:
+        bounds = {}
+        for key, path in bbox_cols.items():
+            chunk = columns.get('.'.join(path))
+            bounds[key] = column_min_max(chunk, types) if chunk is not None else (None, None)
+        minx, miny, maxx, maxy = bbox
+        if bounds['xmin'][0] is not None and bounds['xmin'][0] > maxx or \
+                bounds['ymin'][0] is not None and bounds['ymin'][0] > maxy or \
+                bounds['xmax'][1] is not None and bounds['xmax'][1] < minx or \
+                bounds['ymax'][1] is not None and bounds['ymax'][1] < miny:
+            return False
+    return True
+
+def filter_frame(gdf, filters=None, bbox=None):
+    '''
+    rows of a (Geo)DataFrame passing every filter and intersecting bbox
+    '''
+    mask = None
+    for column, op, value in filters or []:
+        series = gdf[column]
+        if op == '==':
+            m = series == value
+        elif op == '!=':
+            m = series != value
+        elif op == '<':
+            m = series < value
+        elif op == '<=':
+            m = series <= value
+        elif op == '>':
+            m = series > value
+        elif op == '>=':
+            m = series >= value
+        elif op == 'in':
+            m = series.isin(value)
+        elif op == 'not in':
+            m = ~series.isin(value)
+        else:
+            raise ValueError(f"unsupported filter operator {op!r}")
+        mask = m if mask is None else mask & m
+    if bbox is not None:
+        m = gdf.geometry.intersects(shapely.box(*bbox))
+        mask = m if mask is None else mask & m
+    return gdf if mask is None else gdf[mask.values]
@@ -0,0 +1,97 @@
+'''
+Row-group streaming of point coordinates from (Geo)Parquet files, reading only the
+columns needed to place each row.
+'''
+import os
+import json
+import struct
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+WKB_POINT_SIZE = 21
+
+def footer_offset_and_length(parquet_path):
+    '''
+    (offset, length) of the footer (FileMetaData) of a parquet file
+    '''
+    file_size = os.path.getsize(parquet_path)
+    with open(parquet_path, 'rb') as f:
+        f.seek(file_size - 8)
+        footer_length = struct.unpack('<I', f.read(4))[0]
+    return (file_size - footer_length - 8, footer_length)
+
+def point_columns(parquet_file):
+    '''
+    columns to read for the position of each row of a pq.ParquetFile and how to decode them:
+    ('xy', [x, y]) for plain coordinate columns, ('bbox', [bbox]) for a GeoParquet bbox
+    covering of a point geometry, ('wkb', [geometry]) otherwise
+    '''
+    schema = parquet_file.schema_arrow
+    if 'x' in schema.names and 'y' in schema.names:
+        return 'xy', ['x', 'y']
+    geo = json.loads((schema.metadata or {}).get(b'geo', b'{}'))
+    geometry_column = geo.get('primary_column', 'geometry')
+    column = geo.get('columns', {}).get(geometry_column, {})
+    bbox = column.get('covering', {}).get('bbox', {})
+    if column.get('geometry_types') == ['Point'] and bbox.get('xmin', [None])[0] in schema.names:
+        # for points the bbox covering holds the coordinates, no need to touch the geometry
+        return 'bbox', [bbox['xmin'][0]]
+    if geometry_column not in schema.names:
+        raise ValueError(f"no geometry column '{geometry_column}' or x/y columns in parquet file")
+    return 'wkb', [geometry_column]
+
+def wkb_points(array):
+    '''
+    x, y arrays of a pyarrow binary array of WKB geometries: the first position of each
+    geometry, NaN for nulls and empty geometries.
+    Little-endian 2D points are read straight from the array's data buffer.
+    '''
+    if isinstance(array, pa.ExtensionArray):
+        array = array.storage
+    n = len(array)
+    if n and array.null_count == 0:
+        _, offsets, data = array.buffers()
+        offset_type = np.dtype(np.int64 if pa.types.is_large_binary(array.type) else np.int32)
+        offsets = np.frombuffer(offsets, dtype=offset_type, count=n + 1, offset=array.offset * offset_type.itemsize)
+        if offsets[-1] - offsets[0] == n * WKB_POINT_SIZE:
+            # every geometry is 21 bytes: byte order, type, x, y
+            records = np.frombuffer(data, dtype=np.uint8, count=n * WKB_POINT_SIZE,
+                                    offset=int(offsets[0])).reshape(n, WKB_POINT_SIZE)
+            if (records[:, 0] == 1).all() and (records[:, 1:5].copy().view('<u4')[:, 0] == 1).all():
+                xy = records[:, 5:].copy().view('<f8')
+                return xy[:, 0], xy[:, 1]
+    geometries = shapely.from_wkb(array.to_numpy(zero_copy_only=False))
+    x = np.full(n, np.nan)
+    y = np.full(n, np.nan)
+    coordinates, index = shapely.get_coordinates(geometries, return_index=True)
+    index, first = np.unique(index, return_index=True)
+    x[index], y[index] = coordinates[first, 0], coordinates[first, 1]
+    return x, y
+
+def table_points(table, kind, columns):
+    '''
+    x, y arrays of the rows of a pyarrow table holding the point_columns (kind, columns)
+    '''
+    if kind == 'xy':
+        return tuple(table.column(name).to_numpy().astype(np.float64) for name in columns)
+    if kind == 'bbox':
+        bbox = table.column(columns[0]).combine_chunks()
+        x = bbox.field('xmin').to_numpy(zero_copy_only=False).astype(np.float64)
+        y = bbox.field('ymin').to_numpy(zero_copy_only=False).astype(np.float64)
+        return x, y
+    return wkb_points(table.column(columns[0]).combine_chunks())
+
+def iter_parquet_points(parquet_path):
+    '''
+    yields (row_group, x, y) per row group of a parquet file, with x/y the position of
+    each row (NaN when it has no geometry). Only one row group of the position columns
+    is held in memory at a time.
+    '''
+    parquet_file = pq.ParquetFile(parquet_path)
+    kind, columns = point_columns(parquet_file)
+    for row_group in range(parquet_file.metadata.num_row_groups):
+        table = parquet_file.read_row_group(row_group, columns=columns)
+        x, y = table_points(table, kind, columns)
+        yield row_group, x, y
@@ -0,0 +1,235 @@
+'''
+Cache of byte ranges of immutable IPFS content, keyed by CID (or CID-rooted path) and offset.
+Pieces live in an in-memory LRU tier and, optionally, in an on-disk tier with its own size cap.
+A read that partly overlaps cached pieces fetches only the missing gaps. Content under a CID
+never changes, so nothing is ever invalidated; /ipns/ paths are not cached.
+'''
+import os
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict
+
+class RangeCache:
+    def __init__(self, memory_bytes=256 << 20, disk_dir=None, disk_bytes=4 << 30):
+        '''
+        memory_bytes: size cap of the in-memory tier, 0 to keep pieces on disk only
+        disk_dir: directory of the on-disk tier (kept across runs), None for memory only
+        disk_bytes: size cap of the on-disk tier, least recently used pieces are evicted first
+        '''
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._offsets = {}              # key -> sorted offsets of cached pieces
+        self._lengths = {}              # (key, offset) -> length
+        self._memory = OrderedDict()    # (key, offset) -> bytes, in LRU order
+        self._disk = OrderedDict()      # (key, offset) -> length, in LRU order
+        self._sizes = {}                # key -> file size, once a read hit the end of the file
+        self._memory_used = 0
+        self._disk_used = 0
+        self.reset_stats()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk()
+
+    @staticmethod
+    def key(path):
+        return hashlib.sha1(path.encode()).hexdigest()
+
+    @staticmethod
+    def cacheable(path):
+        return not path.startswith('/ipns/')
+
+    def reset_stats(self):
+        self._stats = {'reads': 0, 'hits': 0, 'partial_hits': 0, 'misses': 0,
+                       'bytes_memory': 0, 'bytes_disk': 0, 'bytes_fetched': 0}
+
+    def stats(self):
+        '''
+        read counts (hits served entirely from cache, partial hits, misses), bytes served by
+        each tier and fetched, and the current size of both tiers
+        '''
+        with self._lock:
+            return {**self._stats, 'memory_used': self._memory_used, 'disk_used': self._disk_used,
+                    'pieces': len(self._lengths)}
+
+    def _disk_path(self, key, offset):
+        return os.path.join(self.disk_dir, f"{key}.{offset}")
+
+    def _load_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            key, _, offset = name.partition('.')
+            path = os.path.join(self.disk_dir, name)
+            if offset == 'size':
+                with open(path) as f:
+                    self._sizes[key] = int(f.read())
+            if not offset.isdigit():
+                continue
+            entries.append((os.path.getmtime(path), key, int(offset), os.path.getsize(path)))
+        for _, key, offset, length in sorted(entries):
+            self._disk[(key, offset)] = length
+            self._disk_used += length
+            self._catalog_add(key, offset, length)
+
+    def _catalog_add(self, key, offset, length):
+        if (key, offset) not in self._lengths:
+            bisect.insort(self._offsets.setdefault(key, []), offset)
+        self._lengths[(key, offset)] = length
+
+    def _catalog_drop(self, entry):
+        if entry in self._memory or entry in self._disk:
+            return
+        key, offset = entry
+        del self._lengths[entry]
+        offsets = self._offsets[key]
+        offsets.pop(bisect.bisect_left(offsets, offset))
+        if not offsets:
+            del self._offsets[key]
+
+    def _plan(self, key, start, end):
+        '''
+        (start, stop, piece offset or None) parts covering [start, end): cached pieces and missing
+        gaps, stop None for a gap running to the end of the file
+        '''
+        offsets = self._offsets.get(key, [])
+        parts = []
+        pos = start
+        while end is None or pos < end:
+            i = bisect.bisect_right(offsets, pos) - 1
+            if i >= 0 and offsets[i] + self._lengths[(key, offsets[i])] > pos:
+                stop = offsets[i] + self._lengths[(key, offsets[i])]
+                stop = stop if end is None else min(stop, end)
+                parts.append((pos, stop, offsets[i]))
+                if key in self._sizes and stop >= self._sizes[key]:
+                    break
+            else:
+                stop = offsets[i + 1] if i + 1 < len(offsets) else None
+                if end is not None:
+                    stop = end if stop is None else min(stop, end)
+                parts.append((pos, stop, None))
+                if stop is None:
+                    break
+            pos = stop
+        return parts
+
+    def _get(self, key, offset, start, stop):
+        '''
+        bytes [start, stop) of the file from the cached piece at offset, None if it no longer holds them
+        '''
+        entry = (key, offset)
+        with self._lock:
+            data = self._memory.get(entry)
+            if data is not None and len(data) >= stop - offset:
+                self._memory.move_to_end(entry)
+                self._stats['bytes_memory'] += stop - start
+                return data[start - offset:stop - offset]
+            if entry not in self._disk:
+                return None
+            self._disk.move_to_end(entry)
+        try:
+            with open(self._disk_path(key, offset), 'rb') as f:
+                f.seek(start - offset)
+                data = f.read(stop - start)
+            os.utime(self._disk_path(key, offset))
+        except FileNotFoundError:
+            data = None
+        if data is None or len(data) < stop - start:
+            # evicted, or replaced by a piece of another length, since the read was planned
+            return None
+        with self._lock:
+            self._stats['bytes_disk'] += len(data)
+        return data
+
+    def _put(self, key, offset, data):
+        entry = (key, offset)
+        with self._lock:
+            if entry in self._lengths and self._lengths[entry] >= len(data):
+                return
+            self._catalog_add(key, offset, len(data))
+            self._memory_used -= len(self._memory.pop(entry, b''))
+            if len(data) <= self.memory_bytes:
+                self._memory_used += len(data)
+                self._memory[entry] = data
+                while self._memory_used > self.memory_bytes:
+                    evicted, evicted_data = self._memory.popitem(last=False)
+                    self._memory_used -= len(evicted_data)
+                    self._catalog_drop(evicted)
+            if not self.disk_dir or len(data) > self.disk_bytes:
+                self._disk_used -= self._disk.pop(entry, 0)
+                self._catalog_drop(entry)
+                return
+            # files are written and removed under the lock so the catalog always matches the directory
+            path = self._disk_path(key, offset)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+            self._disk_used += len(data) - self._disk.pop(entry, 0)
+            self._disk[entry] = len(data)
+            while self._disk_used > self.disk_bytes:
+                evicted, length = self._disk.popitem(last=False)
+                self._disk_used -= length
+                os.remove(self._disk_path(*evicted))
+                self._catalog_drop(evicted)
+
+    def _set_size(self, key, size):
+        with self._lock:
+            if self._sizes.get(key) == size:
+                return
+            self._sizes[key] = size
+            if self.disk_dir:
+                with open(self._disk_path(key, 'size'), 'w') as f:
+                    f.write(str(size))
+
+    def read(self, path, offset, length, fetch):
+        '''
+        bytes [offset, offset+length) of path (to the end of the file if length is None),
+        calling fetch(offset, length) only for the gaps not cached yet
+        '''
+        key = self.key(path)
+        offset = offset or 0
+        end = None if length is None else offset + length
+        if end is None and key in self._sizes:
+            end = self._sizes[key]
+        with self._lock:
+            parts = self._plan(key, offset, end)
+        out = []
+        cached = fetched = False
+        for start, stop, piece in parts:
+            data = None
+            if piece is not None:
+                data = self._get(key, piece, start, stop)
+                cached = cached or data is not None
+            if data is None:
+                data = fetch(start, None if stop is None else stop - start)
+                fetched = True
+                with self._lock:
+                    self._stats['bytes_fetched'] += len(data)
+                if stop is None or len(data) < stop - start:
+                    # read up to the end of the file
+                    self._set_size(key, start + len(data))
+                if data:
+                    self._put(key, start, data)
+            out.append(data)
+            if stop is not None and len(data) < stop - start:
+                break
+        with self._lock:
+            self._stats['reads'] += 1
+            self._stats['hits' if not fetched else 'partial_hits' if cached else 'misses'] += 1
+        return b''.join(out)
+
+    def clear(self):
+        '''
+        drop every cached piece, including the on-disk tier
+        '''
+        with self._lock:
+            disk = list(self._disk) + [(key, 'size') for key in self._sizes]
+            self._offsets, self._lengths, self._sizes = {}, {}, {}
+            self._memory, self._disk = OrderedDict(), OrderedDict()
+            self._memory_used = self._disk_used = 0
+        for entry in disk:
+            try:
+                os.remove(self._disk_path(*entry))
+            except FileNotFoundError:
+                pass
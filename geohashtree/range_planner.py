@@ -0,0 +1,114 @@
+'''
+Planning of byte-range requests: nearby (offset, length) ranges are merged into one request
+when reading the gap between them is cheaper than another round trip, and the wanted ranges
+are sliced back out of the fetched spans.
+'''
+
+class RangePlan:
+    '''
+    spans to request for a list of ranges and where each range sits in them
+    '''
+    def __init__(self, ranges, spans, span_of):
+        self.ranges = ranges
+        self.spans = spans
+        self.span_of = span_of
+
+    @property
+    def requests(self):
+        return len(self.spans)
+
+    @property
+    def wanted_bytes(self):
+        return sum(length for _, length in self.ranges)
+
+    @property
+    def fetched_bytes(self):
+        return sum(length for _, length in self.spans)
+
+    @property
+    def over_read(self):
+        '''
+        fetched / wanted bytes, 1.0 when nothing extra is read
+        '''
+        return self.fetched_bytes / self.wanted_bytes if self.wanted_bytes else 1.0
+
+    def slice(self, span_bytes, views=False):
+        '''
+        bytes of each range, in the order the ranges were given, from the bytes of each span;
+        memoryviews into the span bytes instead of copies if views
+        '''
+        if views:
+            span_bytes = [memoryview(data) for data in span_bytes]
+        out = []
+        for (offset, length), span in zip(self.ranges, self.span_of):
+            start = offset - self.spans[span][0]
+            out.append(span_bytes[span][start:start + length])
+        return out
+
+    def __repr__(self):
+        return (f"RangePlan({len(self.ranges)} ranges -> {self.requests} requests, "
+                f"{self.fetched_bytes} bytes fetched, over-read {self.over_read:.3f})")
+
+class RangePlanner:
+    def __init__(self, max_gap=None, latency=0.05, bandwidth=12.5e6, max_span=1 << 23):
+        '''
+        max_gap: largest gap in bytes read through to merge two ranges; if None it is the
+            break-even gap of the cost model, latency (s per request) * bandwidth (bytes/s)
+        max_span: merged spans stop growing at this size so they can still be fetched in parallel
+            (a single range longer than this is fetched whole)
+        '''
+        self.max_gap = max_gap
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_span = max_span
+        self.plans = []
+
+    @property
+    def gap_limit(self):
+        return self.max_gap if self.max_gap is not None else int(self.latency * self.bandwidth)
+
+    def plan(self, ranges):
+        '''
+        RangePlan of (offset, length) ranges, which may be unsorted or overlap
+        '''
+        ranges = [(int(offset), int(length)) for offset, length in ranges]
+        order = sorted(range(len(ranges)), key=lambda i: ranges[i])
+        spans, span_of = [], [0] * len(ranges)
+        start = end = None
+        for i in order:
+            offset, length = ranges[i]
+            if start is not None and offset - end <= self.gap_limit and \
+                    (self.max_span is None or max(end, offset + length) - start <= self.max_span):
+                end = max(end, offset + length)
+            else:
+                if start is not None:
+                    spans.append((start, end - start))
+                start, end = offset, offset + length
+            span_of[i] = len(spans)
+        if start is not None:
+            spans.append((start, end - start))
+        plan = RangePlan(ranges, spans, span_of)
+        self.plans.append(plan)
+        return plan
+
+    def fetch(self, client, cid, ranges, max_workers=None, views=False):
+        '''
+        bytes (memoryviews if views) of each range of a file on IPFS, with the merged spans
+        fetched concurrently
+        '''
+        plan = self.plan(ranges)
+        return plan.slice(client.cat_ranges(cid, plan.spans, max_workers), views)
+
+    def reset(self):
+        self.plans = []
+
+    def summary(self):
+        '''
+        totals over the plans made since the last reset
+        '''
+        wanted = sum(plan.wanted_bytes for plan in self.plans)
+        fetched = sum(plan.fetched_bytes for plan in self.plans)
+        return {'ranges': sum(len(plan.ranges) for plan in self.plans),
+                'requests': sum(plan.requests for plan in self.plans),
+                'wanted_bytes': wanted, 'fetched_bytes': fetched,
+                'over_read': fetched / wanted if wanted else 1.0}
@@ -4,6 +4,7 @@ Script to create a tree structure for geohash
 Author: Zheng Liu
 Date: 2024-02-01
 '''
+import numpy as np
 
 class TrieNode:
     def __init__(self):
@@ -29,6 +30,18 @@ class Trie:
             node = node.children[char]
         return node.value
 
+    def items(self):
+        '''
+        (index, values) of every node holding values, in sorted index order
+        '''
+        stack = [("", self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.value:
+                yield prefix, node.value
+            for char in sorted(node.children, reverse=True):
+                stack.append((prefix+char, node.children[char]))
+
 def trim_full_node(node):
     if len(node.children) == 0:
         return True
@@ -57,4 +70,169 @@ def trim_hashes(input_hashes):
     for index in input_hashes:
         trie_dict.insert(index, 1)
     trim_full_node(trie_dict.root)
-    return get_trie_leaves(trie_dict.root,"")
\ No newline at end of file
+    return get_trie_leaves(trie_dict.root,"")
+class CompactTrieNode:
+    '''
+    Read-only view of the node for `prefix` in a CompactTrie, covering the sorted
+    entries [lo, hi) whose key starts with prefix.
+    '''
+    __slots__ = ('trie', 'prefix', 'lo', 'hi', '_children')
+
+    def __init__(self, trie, prefix, lo, hi):
+        self.trie = trie
+        self.prefix = prefix
+        self.lo = lo
+        self.hi = hi
+        self._children = None
+
+    @property
+    def value(self):
+        return self.trie._values_between(self.lo, self.lo + self.trie._exact_count(self.prefix, self.lo, self.hi))
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = {}
+            depth = len(self.prefix)
+            start = self.lo + self.trie._exact_count(self.prefix, self.lo, self.hi)
+            if start < self.hi:
+                chars = self.trie._key_bytes[start:self.hi, depth]
+                bounds = np.concatenate(([0], np.flatnonzero(chars[1:] != chars[:-1]) + 1, [len(chars)]))
+                for a, b in zip(bounds[:-1], bounds[1:]):
+                    char = chr(chars[a])
+                    self._children[char] = CompactTrieNode(self.trie, self.prefix + char, start + a, start + b)
+        return self._children
+
+class CompactTrie:
+    '''
+    Trie with the Trie insert/get/items API backed by typed arrays instead of one
+    TrieNode per character: keys and values are appended to growing NumPy buffers and
+    sorted once on the first read. Integer values and tuples of integers (offset/length,
+    row group/row) are stored as int64, anything else in an object array.
+    `root` exposes the usual node interface (children, value) for export.
+    '''
+    def __init__(self):
+        self._keys = np.empty(0, dtype='S1')
+        self._values = None
+        self._value_kind = None
+        self._size = 0
+        self._sorted = True
+
+    def __len__(self):
+        return self._size
+
+    def _value_array(self, values):
+        first = values[0]
+        if self._value_kind is None:
+            if isinstance(first, (tuple, list, np.ndarray)) and all(isinstance(v, (int, np.integer)) for v in first):
+                self._value_kind = 'tuple'
+            elif isinstance(first, (int, np.integer)):
+                self._value_kind = 'int'
+            else:
+                self._value_kind = 'object'
+        if self._value_kind == 'tuple':
+            return np.asarray(values, dtype=np.int64).reshape(len(values), -1)
+        if self._value_kind == 'int':
+            return np.asarray(values, dtype=np.int64)
+        array = np.empty(len(values), dtype=object)
+        array[:] = list(values)
+        return array
+
+    def _reserve(self, count, key_width, values):
+        needed = self._size + count
+        if key_width > self._keys.dtype.itemsize:
+            self._keys = self._keys.astype(f'S{key_width}')
+        if self._values is None:
+            self._values = np.empty((max(needed, 1024),) + values.shape[1:], dtype=values.dtype)
+            self._keys = np.resize(self._keys, max(needed, 1024))
+        elif needed > len(self._values):
+            capacity = max(needed, 2 * len(self._values))
+            self._values = np.resize(self._values, (capacity,) + self._values.shape[1:])
+            self._keys = np.resize(self._keys, capacity)
+
+    def insert_many(self, indexes, values):
+        '''
+        insert a batch of index-value pairs
+        '''
+        if len(indexes) == 0:
+            return
+        keys = np.asarray(indexes)
+        if keys.dtype.kind not in 'SU':
+            keys = np.array([str(index) for index in keys])
+        keys = keys.astype('S')
+        values = self._value_array(values)
+        self._reserve(len(keys), keys.dtype.itemsize, values)
+        self._keys[self._size:self._size + len(keys)] = keys
+        self._values[self._size:self._size + len(keys)] = values
+        self._size += len(keys)
+        self._sorted = False
+
+    def insert(self, index, value):
+        self.insert_many([index], [value])
+
+    def _finalize(self):
+        if not self._sorted:
+            order = np.argsort(self._keys[:self._size], kind='stable')
+            self._keys = self._keys[:self._size][order]
+            self._values = self._values[:self._size][order]
+            self._sorted = True
+
+    @property
+    def _key_bytes(self):
+        self._finalize()
+        width = self._keys.dtype.itemsize
+        return self._keys.view(np.uint8).reshape(-1, width)
+
+    def _prefix_range(self, prefix):
+        self._finalize()
+        keys = self._keys[:self._size]
+        if not prefix:
+            return 0, self._size
+        key = prefix.encode()
+        if len(key) > keys.dtype.itemsize:
+            return 0, 0
+        successor = key[:-1] + bytes([key[-1] + 1])
+        return int(np.searchsorted(keys, key, side='left')), int(np.searchsorted(keys, successor, side='left'))
+
+    def _exact_count(self, prefix, lo, hi):
+        '''
+        number of entries in [lo, hi) whose key is exactly prefix (they sort first)
+        '''
+        if lo >= hi:
+            return 0
+        return int(np.searchsorted(self._keys[lo:hi], prefix.encode(), side='right'))
+
+    def _values_between(self, lo, hi):
+        values = self._values[lo:hi]
+        if self._value_kind == 'tuple':
+            return list(map(tuple, values.tolist()))
+        return values.tolist()
+
+    @property
+    def root(self):
+        self._finalize()
+        return CompactTrieNode(self, "", 0, self._size)
+
+    def get(self, index):
+        prefix = str(index)
+        lo, hi = self._prefix_range(prefix)
+        if lo >= hi:
+            return None
+        return self._values_between(lo, lo + self._exact_count(prefix, lo, hi))
+
+    def items(self, prefix=""):
+        '''
+        (index, values) of every key starting with prefix, in sorted index order
+        '''
+        lo, hi = self._prefix_range(prefix)
+        keys = self._keys[lo:hi]
+        bounds = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(keys)]))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            yield keys[a].decode(), self._values_between(lo + a, lo + b)
+
+    def arrays(self, prefix=""):
+        '''
+        sorted key and value arrays of the keys starting with prefix
+        '''
+        lo, hi = self._prefix_range(prefix)
+        return self._keys[lo:hi].astype(str), self._values[lo:hi]
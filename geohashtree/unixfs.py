@@ -0,0 +1,162 @@
+'''
+Daemon-free CID computation reproducing `ipfs add` with Kubo's default import settings:
+fixed-size 256 KiB chunks, balanced DAG with at most 174 links per node, sha2-256,
+raw leaves for CIDv1 (dag-pb UnixFS leaves for CIDv0).
+'''
+import os
+import base64
+import hashlib
+from multiprocessing import Pool
+
+CHUNK_SIZE = 262144
+MAX_LINKS = 174
+POOL_MIN_BYTES = 1 << 28
+RAW = 0x55
+DAG_PB = 0x70
+SHA2_256 = 0x12
+UNIXFS_FILE = 2
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+def _varint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def _bytes_field(number, payload):
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+def _int_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+def _unixfs_data(filesize, data=None, blocksizes=()):
+    '''
+    UnixFS Data message of a file node: Type, Data, filesize, blocksizes (unpacked)
+    '''
+    message = _int_field(1, UNIXFS_FILE)
+    if data:
+        message += _bytes_field(2, data)
+    message += _int_field(3, filesize)
+    return message + b''.join(_int_field(4, size) for size in blocksizes)
+
+def _dag_pb(links, data):
+    '''
+    dag-pb block: links (Hash, empty Name, Tsize) before Data, as go-codec-dagpb writes them
+    '''
+    block = b''.join(_bytes_field(2, _bytes_field(1, cid) + _bytes_field(2, b'') + _int_field(3, tsize))
+                     for cid, tsize in links)
+    return block + _bytes_field(1, data)
+
+def _cid(codec, block, version):
+    multihash = bytes([SHA2_256, 32]) + hashlib.sha256(block).digest()
+    if version == 0:
+        return multihash
+    return _varint(1) + _varint(codec) + multihash
+
+def cid_to_string(cid):
+    '''
+    base58btc for CIDv0 (Qm...), multibase base32 for CIDv1 (b...)
+    '''
+    if cid[0] == SHA2_256:
+        n = int.from_bytes(cid, 'big')
+        out = ''
+        while n:
+            n, r = divmod(n, 58)
+            out = BASE58_ALPHABET[r] + out
+        return '1' * (len(cid) - len(cid.lstrip(b'\0'))) + out
+    return 'b' + base64.b32encode(cid).decode().lower().rstrip('=')
+
+class _Chunker:
+    '''
+    fixed-size chunks of a binary stream with one chunk of lookahead
+    '''
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.next = self._read()
+
+    def _read(self):
+        chunk = self.stream.read(self.chunk_size)
+        while chunk and len(chunk) < self.chunk_size:
+            more = self.stream.read(self.chunk_size - len(chunk))
+            if not more:
+                break
+            chunk += more
+        return chunk
+
+    def done(self):
+        return not self.next
+
+    def pop(self):
+        chunk, self.next = self.next, self._read()
+        return chunk
+
+class _DagBuilder:
+    '''
+    balanced layout of go-unixfs, keeping only (cid, tsize, filesize) of finished nodes
+    '''
+    def __init__(self, cid_version, raw_leaves, max_links):
+        self.cid_version = cid_version
+        self.raw_leaves = raw_leaves
+        self.max_links = max_links
+
+    def leaf(self, chunk):
+        if self.raw_leaves:
+            return _cid(RAW, chunk, self.cid_version), len(chunk), len(chunk)
+        block = _dag_pb([], _unixfs_data(len(chunk), chunk))
+        return _cid(DAG_PB, block, self.cid_version), len(block), len(chunk)
+
+    def internal(self, children):
+        filesizes = [filesize for _, _, filesize in children]
+        block = _dag_pb([(cid, tsize) for cid, tsize, _ in children], _unixfs_data(sum(filesizes), None, filesizes))
+        return _cid(DAG_PB, block, self.cid_version), len(block) + sum(t for _, t, _ in children), sum(filesizes)
+
+    def fill(self, chunks, depth, first=None):
+        children = [first] if first else []
+        while len(children) < self.max_links and not chunks.done():
+            children.append(self.leaf(chunks.pop()) if depth == 1 else self.fill(chunks, depth - 1))
+        return self.internal(children)
+
+    def layout(self, chunks):
+        if chunks.done():
+            return self.leaf(b'')
+        root = self.leaf(chunks.pop())
+        depth = 1
+        while not chunks.done():
+            # a full tree becomes the first child of a tree one level deeper
+            root = self.fill(chunks, depth, root)
+            depth += 1
+        return root
+
+def stream_cid(stream, cid_version=1, raw_leaves=None, chunk_size=CHUNK_SIZE, max_links=MAX_LINKS):
+    '''
+    CID of the bytes of a binary stream as `ipfs add --cid-version=<cid_version> -n` reports it.
+    raw_leaves defaults to Kubo's choice: raw for CIDv1, UnixFS leaves for CIDv0.
+    '''
+    if raw_leaves is None:
+        raw_leaves = cid_version > 0
+    if cid_version == 0 and raw_leaves:
+        raise ValueError("raw leaves need CIDv1")
+    builder = _DagBuilder(cid_version, raw_leaves, max_links)
+    cid, _, _ = builder.layout(_Chunker(stream, chunk_size))
+    return cid_to_string(cid)
+
+def file_cid(file_path, cid_version=1):
+    '''
+    CID of a file with Kubo's default import settings
+    '''
+    with open(file_path, 'rb') as f:
+        return stream_cid(f, cid_version)
+
+def file_cids(file_paths, cid_version=1, processes=None):
+    '''
+    CIDs of many files, hashed in a process pool once their total size outweighs the pool start-up
+    '''
+    file_paths = list(file_paths)
+    if processes == 1 or len(file_paths) < 2 or sum(map(os.path.getsize, file_paths)) < POOL_MIN_BYTES:
+        return [file_cid(path, cid_version) for path in file_paths]
+    with Pool(processes) as pool:
+        return pool.starmap(file_cid, [(path, cid_version) for path in file_paths],
+                            chunksize=max(1, len(file_paths) // 64))
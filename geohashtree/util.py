@@ -1,6 +1,7 @@
 '''
 Some utility functions for the geohash tree
 '''
+import ast
 def merge_lists(list1, list2):
     val1 = list1[0]  # assuming val1 is the same in both lists
     rest_values = list(set(list1[1:] + list2[1:]))  # merge and remove duplicates
@@ -26,3 +27,39 @@ def compose_path(s:str,root:str) -> str:
         path.append(s[:i+1])
     return "/".join(path)
 
+
+def parse_tuple(item):
+    """
+    parse an index entry: tuple repr from a text leaf, or an already decoded tuple
+    """
+    return item if isinstance(item, tuple) else ast.literal_eval(item)
+
+
+def dataset_leaf_lines(items):
+    """
+    lines of a dataset index leaf for (file_id, a, b) items: "@file_id" before the values of each file
+    """
+    lines = []
+    current = None
+    for file_id, *value in items:
+        if file_id != current:
+            lines.append(f"@{file_id}")
+            current = file_id
+        lines.append(f"{tuple(value)}")
+    return lines
+
+
+def parse_dataset_leaf(lines, files):
+    """
+    {cid: [head, value, ...]} of the lines of a dataset index leaf, files being the index's file table
+    """
+    result = {}
+    values = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('@'):
+            f = files[int(line[1:])]
+            values = result.setdefault(f['cid'], [tuple(f['head'])])
+        elif line:
+            values.append(line)
+    return result
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+import geohashtree.binary_leaf as binary_leaf
+from geohashtree.binary_leaf import encode_leaf, decode_leaf, leaf_entries, encode_varints, decode_varints, \
+    HEADER, SMALL_BODY
+
+FILES = [{'cid': f'Qm{i}', 'format': 'geojson', 'head': [0, i]} for i in range(300)]
+
+def random_entries(n, n_files, seed=0):
+    rng = np.random.default_rng(seed)
+    file_ids = rng.integers(0, n_files, n)
+    # repeated a values exercise the b deltas, large ones multi-byte varints
+    values = np.stack([rng.integers(0, 5, n) * rng.choice([1, 1000, 2**40], n), rng.integers(0, 2**33, n)], axis=1)
+    return file_ids, values
+
+def sorted_entries(file_ids, values):
+    order = np.lexsort((values[:, 1], values[:, 0], file_ids))
+    return np.asarray(file_ids)[order], np.asarray(values)[order]
+
+@pytest.mark.parametrize("n,n_files", [(1, 1), (5, 2), (20, 3), (400, 1), (5000, 300)])
+def test_leaf_round_trip(n, n_files):
+    file_ids, values = random_entries(n, n_files)
+    data = encode_leaf(file_ids, values)
+    decoded_ids, decoded_values = decode_leaf(data)
+    expected_ids, expected_values = sorted_entries(file_ids, values)
+    assert decoded_ids.dtype == np.uint32 and decoded_values.dtype == np.int64
+    np.testing.assert_array_equal(decoded_ids, expected_ids)
+    np.testing.assert_array_equal(decoded_values, expected_values)
+    entries = leaf_entries(data, FILES)
+    assert sorted(entries) == sorted(FILES[i]['cid'] for i in set(expected_ids.tolist()))
+    for file_id in set(expected_ids.tolist()):
+        f = FILES[file_id]
+        assert entries[f['cid']] == [tuple(f['head'])] + list(map(tuple, expected_values[expected_ids == file_id].tolist()))
+
+def test_small_and_numpy_paths_agree(monkeypatch):
+    for n in (3, 30, 300):
+        data = encode_leaf(*random_entries(n, 4, seed=n))
+        default = decode_leaf(data), leaf_entries(data, FILES)
+        # force every body through the other decoder
+        monkeypatch.setattr(binary_leaf, 'SMALL_BODY', -1 if len(data) - HEADER.size <= SMALL_BODY else 1 << 30)
+        forced = decode_leaf(data), leaf_entries(data, FILES)
+        monkeypatch.undo()
+        np.testing.assert_array_equal(default[0][0], forced[0][0])
+        np.testing.assert_array_equal(default[0][1], forced[0][1])
+        assert default[1] == forced[1]
+
+def test_empty_leaf():
+    data = encode_leaf([], np.empty((0, 2)))
+    file_ids, values = decode_leaf(data)
+    assert len(file_ids) == 0 and values.shape == (0, 2)
+    assert leaf_entries(data, FILES) == {}
+
+def test_varints():
+    values = np.array([0, 1, 127, 128, 300, 2**32, 2**63 - 1], dtype=np.uint64)
+    np.testing.assert_array_equal(decode_varints(encode_varints(values)), values)
+    assert encode_varints([300]) == b'\xac\x02'
+    with pytest.raises(ValueError):
+        decode_varints(b'\x80')
+
+def test_corrupt_leaves_raise():
+    data = encode_leaf([0, 1], [[1, 2], [3, 4]])
+    with pytest.raises(ValueError):
+        decode_leaf(b'XXXX' + data[4:])
+    with pytest.raises(ValueError):
+        decode_leaf(data[:-1])
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from geohashtree.geometry import haversine_distance_array
+from geohashtree.geohash_func import geohash_encode_array, geohash_prefix_mask, \
+    geohashes_covering_rectangle, geohashes_covering_circle, \
+    geohashes_covering_rectangle_adaptive, geohashes_covering_circle_adaptive
+
+def sample(lon_lo, lon_hi, lat_lo, lat_hi, n=200000, seed=0):
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(lon_lo, lon_hi, n)
+    lat = np.clip(rng.uniform(lat_lo, lat_hi, n), -90, 90)
+    # wrap to [-180, 180)
+    return (lon + 180) % 360 - 180, lat
+
+def assert_covers(covering, lon, lat):
+    assert len(lon) > 0
+    precisions = {len(g) for g in covering}
+    hashes = geohash_encode_array(lat, lon, max(precisions))
+    missed = hashes[~geohash_prefix_mask(hashes, list(covering))]
+    assert len(missed) == 0, sorted(set(missed))[:10]
+
+RECTANGLES = [
+    (10.2, 11.7, 45.1, 46.3, 4),
+    (-3.0, 2.5, -1.2, 0.8, 3),
+    # crossing the antimeridian
+    (179.3, -179.2, -5.5, 4.1, 3),
+    (170.0, -170.0, 60.0, 70.0, 2),
+]
+
+@pytest.mark.parametrize("min_lon,max_lon,min_lat,max_lat,precision", RECTANGLES)
+def test_rectangle_covering_matches_brute_force(min_lon, max_lon, min_lat, max_lat, precision):
+    width = (max_lon - min_lon) % 360
+    lon, lat = sample(min_lon, min_lon + width, min_lat, max_lat)
+    covering = geohashes_covering_rectangle(min_lon, max_lon, min_lat, max_lat, precision)
+    assert_covers(covering, lon, lat)
+    # no cell outside the rectangle: the cells hit by a dense sample are all of them
+    assert set(covering) == set(geohash_encode_array(lat, lon, precision))
+    assert_covers(geohashes_covering_rectangle_adaptive(min_lon, max_lon, min_lat, max_lat, precision, 50), lon, lat)
+
+CIRCLES = [
+    (10.0, 45.0, 30000, 4),
+    (179.9, 10.0, 100000, 3),
+    (-179.95, 0.0, 50000, 4),
+    (179.5, -20.0, 200000, 3),
+]
+
+@pytest.mark.parametrize("xc,yc,radius,precision", CIRCLES)
+def test_haversine_circle_covering_matches_brute_force(xc, yc, radius, precision):
+    degrees = radius / 111000 * 1.5
+    lon, lat = sample(xc - degrees / np.cos(np.radians(yc)), xc + degrees / np.cos(np.radians(yc)),
+                      yc - degrees, yc + degrees)
+    inside = haversine_distance_array(lon, lat, xc, yc) <= radius
+    covering = geohashes_covering_circle(xc, yc, radius, precision, 'haversine')
+    assert_covers(covering, lon[inside], lat[inside])
+    adaptive = geohashes_covering_circle_adaptive(xc, yc, radius, precision, 50, distance_type='haversine')
+    assert_covers(adaptive, lon[inside], lat[inside])
+
+def test_haversine_circle_at_antimeridian_includes_cells_across_it():
+    covering = geohashes_covering_circle(179.9, 10, 100000, 3, 'haversine')
+    assert {'818', '81b'} <= set(covering)
+
+def test_euclidean_circle_covering_matches_brute_force():
+    xc, yc, radius = 12.3, 41.9, 0.8
+    lon, lat = sample(xc - radius, xc + radius, yc - radius, yc + radius)
+    inside = np.hypot(lon - xc, lat - yc) <= radius
+    assert_covers(geohashes_covering_circle(xc, yc, radius, 4), lon[inside], lat[inside])
+    assert_covers(geohashes_covering_circle_adaptive(xc, yc, radius, 4, 60), lon[inside], lat[inside])
@@ -0,0 +1,31 @@
+import io
+import json
+import geopandas as gpd
+import pandas as pd
+from geohashtree.geojson_decode import decode_features, feature_collection
+
+HEADER = b'{\n"type": "FeatureCollection",\n"features": [\n'
+
+def features(dates):
+    return [json.dumps({"type": "Feature", "properties": {"name": f"p{i}", "date": date},
+                        "geometry": {"type": "Point", "coordinates": [-77.0 + i, 38.9]}}).encode() + b",\n"
+            for i, date in enumerate(dates)]
+
+def expected(runs):
+    return gpd.read_file(io.BytesIO(feature_collection(HEADER, runs)))
+
+def test_valid_dates_are_typed_like_gdal():
+    runs = features(["2020-01-02", "2021-12-31", None])
+    gdf = decode_features(HEADER, runs)
+    assert pd.api.types.is_datetime64_any_dtype(gdf["date"])
+    pd.testing.assert_frame_equal(pd.DataFrame(gdf), pd.DataFrame(expected(runs)))
+
+def test_invalid_month_stays_a_string_like_gdal():
+    runs = features(["2020-01-02", "2020-13-45"])
+    gdf = decode_features(HEADER, runs)
+    pd.testing.assert_frame_equal(pd.DataFrame(gdf), pd.DataFrame(expected(runs)))
+
+def test_invalid_day_stays_a_string():
+    # GDAL types this column as Date and fails to read 2021-02-30
+    gdf = decode_features(HEADER, features(["2021-02-30", "2021-03-01", None]))
+    assert gdf["date"].tolist() == ["2021-02-30", "2021-03-01", None]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from geohashtree.packed_index import PackedIndex, write_packed_index
+
+ALPHABET = np.array(list('0123456789bcdefghjkmnpqrstuvwxyz'))
+FILES = [{'cid': 'QmA', 'format': 'geojson', 'head': [0, 42]},
+         {'cid': 'QmB', 'format': 'parquet', 'head': [-1, -1]},
+         {'cid': 'QmC', 'format': 'geojson', 'head': [0, 7]}]
+
+class RangeReader:
+    '''
+    stands in for a remote FileSystem, serving byte ranges of a local file
+    '''
+    is_local = False
+
+    def read_bytes(self, path, offset, length):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+def random_entries(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # few distinct short prefixes so prefix ranges span several key blocks
+    keys = [''.join(row) for row in ALPHABET[rng.integers(0, 4, (n, 5))]]
+    file_ids = rng.integers(0, len(FILES), n)
+    values = rng.integers(0, 10**9, (n, 2))
+    return keys, file_ids, values
+
+def expected(keys, file_ids, values, prefix):
+    result = {}
+    for key, file_id, value in zip(keys, file_ids, values.tolist()):
+        if key.startswith(prefix):
+            f = FILES[file_id]
+            result.setdefault(f['cid'], [tuple(f['head'])]).append(tuple(value))
+    return result
+
+def normalized(result):
+    # entries come in key order, compare them as sets of pairs
+    return {cid: [entries[0]] + sorted(entries[1:]) for cid, entries in result.items()}
+
+@pytest.mark.parametrize("fs", [None, RangeReader()])
+def test_packed_index_round_trip(tmp_path, fs):
+    keys, file_ids, values = random_entries(5000)
+    path = str(tmp_path / 'index.ghx')
+    write_packed_index(path, keys, file_ids, values, FILES, block_size=64)
+    index = PackedIndex.open(path, fs)
+    assert index.n_entries == len(keys)
+    assert index.files == FILES
+    start, stop = index.prefix_range('')
+    ids, pairs = index.entries(start, stop)
+    assert sorted(zip(ids.tolist(), map(tuple, pairs.tolist()))) == \
+        sorted(zip(file_ids.tolist(), map(tuple, values.tolist())))
+    for prefix in ['0', '1', '2', '3', '01', '3210', keys[0], keys[-1], 'z', '4', '000000']:
+        assert normalized(index.query_single(prefix)) == normalized(expected(keys, file_ids, values, prefix)), prefix
+
+def test_empty_packed_index(tmp_path):
+    path = str(tmp_path / 'index.ghx')
+    write_packed_index(path, [], [], np.empty((0, 2)), FILES)
+    index = PackedIndex.open(path)
+    assert index.n_entries == 0
+    assert index.query_single('0') == {}
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+from geohashtree.geohashtree import LiteTreeOffset
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    rng = np.random.default_rng(1)
+    n = 3000
+    geometry = [Point(x, y) for x, y in zip(rng.uniform(-10, 10, n), rng.uniform(40, 50, n))]
+    geometry[5] = None
+    frame = gpd.GeoDataFrame({'name': [f'feature {i}' for i in range(n)], 'value': rng.integers(0, 100, n)},
+                             geometry=geometry, crs='EPSG:4326')
+    root = tmp_path_factory.mktemp('dataset')
+    frame.iloc[:2000].to_file(root / 'a.geojson', driver='GeoJSON')
+    frame.iloc[2000:].to_parquet(root / 'b.parquet', row_group_size=128)
+    return root
+
+def tree_files(root):
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+def build(destination, index_format, processes, add):
+    tree = LiteTreeOffset(index_format=index_format)
+    add(tree, processes)
+    tree.generate_tree_index(str(destination), processes)
+    return tree_files(destination)
+
+ADDS = {
+    # small windows so the GeoJSON scan is split over many of them
+    'geojson': lambda root: lambda tree, processes: tree.add_from_geojson(str(root / 'a.geojson'), 5, 4096, processes),
+    'parquet': lambda root: lambda tree, processes: tree.add_from_parquet(str(root / 'b.parquet'), 5, processes),
+    'dataset': lambda root: lambda tree, processes: tree.add_from_dataset(str(root), 5, processes),
+}
+
+@pytest.mark.parametrize("index_format", ['tree', 'binary'])
+@pytest.mark.parametrize("source", sorted(ADDS))
+def test_parallel_build_equals_serial_build(dataset, tmp_path, index_format, source):
+    add = ADDS[source](dataset)
+    serial = build(tmp_path / 'serial', index_format, 1, add)
+    parallel = build(tmp_path / 'parallel', index_format, 2, add)
+    assert len(serial) > 10
+    assert sorted(serial) == sorted(parallel)
+    assert all(serial[name] == parallel[name] for name in serial)
@@ -0,0 +1,45 @@
+import io
+import struct
+import pyarrow as pa
+import pyarrow.parquet as pq
+from geohashtree.footer_cache import parse_footer
+from geohashtree.parquet_select import leaf_types, row_group_may_match
+
+def footer(table):
+    out = io.BytesIO()
+    pq.write_table(table, out)
+    data = out.getvalue()
+    length = struct.unpack('<I', data[-8:-4])[0]
+    return parse_footer(data[-8 - length:-8])
+
+def may_match(table, *filters):
+    fmd = footer(table)
+    return row_group_may_match(fmd.row_groups[0], leaf_types(fmd), list(filters))
+
+def test_unsigned_statistics_are_not_read_as_signed():
+    table = pa.table({'v': pa.array([2**63 + 5, 2**63 + 10], pa.uint64()),
+                      'w': pa.array([3_000_000_000, 4_000_000_000], pa.uint32()),
+                      'b': pa.array([200, 250], pa.uint8())})
+    assert may_match(table, ('v', '>', 0))
+    assert may_match(table, ('v', '==', 2**63 + 5))
+    assert not may_match(table, ('v', '<', 2**63))
+    assert may_match(table, ('w', '>', 1))
+    assert not may_match(table, ('w', '>', 4_000_000_000))
+    assert may_match(table, ('b', '>', 199))
+    assert not may_match(table, ('b', '<', 200))
+
+def test_decimal_statistics_never_prune():
+    table = pa.table({'d': pa.array([1.5, 2.5]).cast(pa.decimal128(5, 2))})
+    assert may_match(table, ('d', '>', 100))
+    assert may_match(table, ('d', '<', -100))
+
+def test_signed_statistics_prune():
+    table = pa.table({'i': pa.array([-3, 5], pa.int64())})
+    assert not may_match(table, ('i', '<', -3))
+    assert may_match(table, ('i', '<', -2))
+
+def test_not_equal_keeps_chunks_with_nulls():
+    table = pa.table({'n': pa.array([1.0, None])})
+    assert may_match(table, ('n', '!=', 1.0))
+    assert may_match(table, ('n', 'not in', [1.0]))
+    assert not may_match(pa.table({'n': pa.array([1.0, 1.0])}), ('n', '!=', 1.0))
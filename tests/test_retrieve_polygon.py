@@ -0,0 +1,14 @@
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point, box
+from geohashtree.geohashtree import LiteTreeOffset
+
+def test_retrieve_polygon_drops_empty_and_missing_geometries():
+    features = gpd.GeoDataFrame({'id': [1, 2, 3, 4, 5]},
+                                geometry=[Point(1, 1), shapely.from_wkt('POINT EMPTY'), None, Point(5, 5),
+                                          Point(1.999, 1.5)])
+    tree = LiteTreeOffset()
+    # stands in for the index: every covering cell returns all the features
+    tree.retrieve = lambda geohashes, index_root: features
+    result = tree.retrieve_polygon(box(0, 0, 2, 2), 'index', 4)
+    assert result['id'].tolist() == [1, 5]
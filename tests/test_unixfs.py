@@ -0,0 +1,44 @@
+import io
+import pytest
+from geohashtree.unixfs import stream_cid, file_cid, file_cids
+
+# `ipfs add -n` (CIDv0) and `ipfs add -n --cid-version=1` of these bytes
+VECTORS = [
+    (b'hello world', 'Qmf412jQZiuVUtdgnB36FXFX7xg5V6KEbSJ4dpQuhkLyfD',
+     'bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e'),
+    (b'hello world\n', 'QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o',
+     'bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4'),
+    (b'', 'QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH',
+     'bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku'),
+]
+
+class ShortReads(io.BytesIO):
+    '''
+    a stream returning at most 1000 bytes per read, like a pipe or socket
+    '''
+    def read(self, size=-1):
+        return super().read(1000 if size < 0 else min(size, 1000))
+
+@pytest.mark.parametrize("data,v0,v1", VECTORS)
+def test_known_cids(data, v0, v1):
+    assert stream_cid(io.BytesIO(data), 0) == v0
+    assert stream_cid(io.BytesIO(data), 1) == v1
+
+def test_raw_leaves_need_cid_v1():
+    with pytest.raises(ValueError):
+        stream_cid(io.BytesIO(b'hello world'), 0, raw_leaves=True)
+
+def test_chunked_files(tmp_path):
+    # three chunks of 256 KiB and a partial one, so the DAG has an internal node
+    data = bytes(range(256)) * 4000
+    for version in (0, 1):
+        cid = stream_cid(io.BytesIO(data), version)
+        assert stream_cid(ShortReads(data), version) == cid
+        assert cid != stream_cid(io.BytesIO(data[:-1]), version)
+    paths = []
+    for i, content in enumerate([data, b'hello world']):
+        paths.append(str(tmp_path / f'{i}.bin'))
+        with open(paths[-1], 'wb') as f:
+            f.write(content)
+    assert file_cid(paths[1], 0) == VECTORS[0][1]
+    assert file_cids(paths) == [stream_cid(io.BytesIO(data)), VECTORS[0][2]]